@@ -2,23 +2,41 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app.services.admin_service import AdminService
 from app.services.event_service import EventService
+from app.services.certificate_service import CertificateService
+from app.services.job_registry_service import JobRegistryService
+from app.services.email_metrics_service import metrics as email_metrics
+from app.services.notification_service import NotificationService
 from app.serializers import serialize_user
 from app.models import Activity, Event
 from app.extensions import db
 from threading import Thread, Lock
 from math import ceil
-from uuid import uuid4
 from io import BytesIO
 from pathlib import Path
 import json
+import os
+import struct
 import tempfile
 import time
+import urllib.request
 from datetime import datetime
 
 bp = Blueprint('admin', __name__, url_prefix='/api')
 admin_service = AdminService()
-_IMPORT_JOBS = {}
-_IMPORT_JOBS_LOCK = Lock()
+job_registry = JobRegistryService()
+IMPORT_JOB_TYPE = 'user_import'
+# Row results are appended to the log (and counters published) every this many rows.
+IMPORT_JOB_FLUSH_EVERY = 50
+# Writer-side state, owned by the thread that runs each import.
+_IMPORT_JOB_BUFFERS = {}
+_IMPORT_JOB_BUFFERS_LOCK = Lock()
+_ROW_STATUS_COUNTERS = {
+    'created': 'created_count',
+    'updated': 'updated_count',
+    'unchanged': 'unchanged_count',
+}
+# One (byte offset, byte length) entry per logged row, so any row can be read with a single seek.
+_ROW_INDEX_ENTRY = struct.Struct('<QI')
 
 
 def _jobs_store_dir() -> Path:
@@ -27,90 +45,154 @@ def _jobs_store_dir() -> Path:
     return path
 
 
-def _job_file_path(job_id: str) -> Path:
-    return _jobs_store_dir() / f'{job_id}.json'
+def _job_log_path(job_id: str) -> Path:
+    return _jobs_store_dir() / f'{job_id}.rows.jsonl'
 
 
-def _persist_job(job: dict):
-    job_id = job.get('job_id')
-    if not job_id:
-        return
-    file_path = _job_file_path(job_id)
-    temp_path = file_path.with_suffix('.json.tmp')
-    temp_path.write_text(json.dumps(job, ensure_ascii=False), encoding='utf-8')
-    temp_path.replace(file_path)
+def _job_index_path(job_id: str) -> Path:
+    return _jobs_store_dir() / f'{job_id}.rows.idx'
 
 
-def _load_job(job_id: str):
-    file_path = _job_file_path(job_id)
-    if not file_path.exists():
-        return None
-    try:
-        return json.loads(file_path.read_text(encoding='utf-8'))
-    except Exception:
-        return None
+def _prune_job_logs(max_age: int) -> int:
+    """Deletes row logs and indexes untouched for ``max_age`` seconds; returns how many files were removed.
 
+    Logs stop changing once their job completes, so they expire with the job's registry entry.
+    """
+    if not max_age:
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for pattern in ('*.rows.jsonl', '*.rows.idx'):
+        for path in _jobs_store_dir().glob(pattern):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+    return removed
 
-def _job_rank(job: dict):
-    if not isinstance(job, dict):
-        return (-1, -1, -1)
-    return (
-        1 if job.get('completed') else 0,
-        int(job.get('processed_rows') or 0),
-        float(job.get('updated_at') or 0),
-    )
 
+def _append_job_log(job_id: str, rows: list):
+    """Appends rows to the job's JSONL log and records their offsets in the index.
 
-def _best_job_state(*jobs):
-    valid_jobs = [j for j in jobs if isinstance(j, dict)]
-    if not valid_jobs:
-        return None
-    return max(valid_jobs, key=_job_rank)
+    The log is flushed before the index is written, so an index entry never
+    points at bytes a reader cannot see yet.
+    """
+    if not job_id or not rows:
+        return
+    entries = []
+    with _job_log_path(job_id).open('ab') as log_file:
+        offset = log_file.seek(0, os.SEEK_END)
+        for row in rows:
+            line = json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n'
+            log_file.write(line)
+            entries.append(_ROW_INDEX_ENTRY.pack(offset, len(line)))
+            offset += len(line)
+        log_file.flush()
+    with _job_index_path(job_id).open('ab') as index_file:
+        index_file.write(b''.join(entries))
+
+
+def _count_job_rows(job_id: str) -> int:
+    try:
+        return _job_index_path(job_id).stat().st_size // _ROW_INDEX_ENTRY.size
+    except OSError:
+        return 0
 
 
-def _get_active_job_for_user(username: str):
-    if not username:
-        return None
-    for job in _IMPORT_JOBS.values():
-        if job.get('created_by') != username:
-            continue
-        if job.get('completed'):
-            continue
-        if job.get('status') in {'queued', 'running'}:
-            return job
-    return None
+def _read_job_rows(job_id: str, positions):
+    """Reads the rows at ``positions`` by seeking through the index; never loads the whole log."""
+    positions = list(positions)
+    if not positions:
+        return []
+    rows = []
+    try:
+        with _job_index_path(job_id).open('rb') as index_file, _job_log_path(job_id).open('rb') as log_file:
+            for position in positions:
+                index_file.seek(position * _ROW_INDEX_ENTRY.size)
+                entry = index_file.read(_ROW_INDEX_ENTRY.size)
+                if len(entry) < _ROW_INDEX_ENTRY.size:
+                    break
+                offset, length = _ROW_INDEX_ENTRY.unpack(entry)
+                log_file.seek(offset)
+                rows.append(json.loads(log_file.read(length)))
+    except (OSError, ValueError):
+        return rows
+    return rows
 
 
-def _update_job(job_id, **kwargs):
-    with _IMPORT_JOBS_LOCK:
-        job = _IMPORT_JOBS.get(job_id)
-        if not job:
-            return
-        kwargs['updated_at'] = time.time()
-        job.update(kwargs)
-        _persist_job(job)
+def _iter_job_rows(job_id: str, limit: int):
+    """Streams the first ``limit`` logged rows as ``(position, row)`` pairs."""
+    try:
+        with _job_log_path(job_id).open('rb') as log_file:
+            for position, line in enumerate(log_file):
+                if position >= limit:
+                    break
+                try:
+                    yield position, json.loads(line)
+                except ValueError:
+                    continue
+    except OSError:
+        return
 
 
-def _append_job_row(job_id, row_result):
-    with _IMPORT_JOBS_LOCK:
-        job = _IMPORT_JOBS.get(job_id)
-        if not job:
+def _flush_job_rows(job_id):
+    with _IMPORT_JOB_BUFFERS_LOCK:
+        buffer = _IMPORT_JOB_BUFFERS.get(job_id)
+        if not buffer or not buffer['pending']:
             return
+        counters, buffer['pending'] = buffer['pending'], {}
+        rows, buffer['rows'] = buffer['rows'], []
+
+    _append_job_log(job_id, rows)
+    job_registry.increment(job_id, **counters)
+
+
+def _update_job(job_id, rows=None, ignored_columns=None, **kwargs):
+    _flush_job_rows(job_id)
+    if rows:
+        _append_job_log(job_id, rows)
 
-        job['processed_rows'] += 1
-        status = row_result.get('status')
-        if status == 'created':
-            job['created'] += 1
-        elif status == 'updated':
-            job['updated'] += 1
-        elif status == 'unchanged':
-            job['unchanged'] += 1
-        else:
-            job['errors_count'] += 1
+    details = None
+    if ignored_columns is not None:
+        job = job_registry.get(job_id) or {}
+        details = dict(job.get('details') or {}, ignored_columns=ignored_columns)
+    job_registry.update(job_id, details=details, **kwargs)
 
-        job['rows'].append(row_result)
-        job['updated_at'] = time.time()
-        _persist_job(job)
+    if kwargs.get('completed'):
+        with _IMPORT_JOB_BUFFERS_LOCK:
+            _IMPORT_JOB_BUFFERS.pop(job_id, None)
+
+
+def _append_job_row(job_id, row_result):
+    counter = _ROW_STATUS_COUNTERS.get(row_result.get('status'), 'errors_count')
+    with _IMPORT_JOB_BUFFERS_LOCK:
+        buffer = _IMPORT_JOB_BUFFERS.setdefault(job_id, {'rows': [], 'pending': {}})
+        buffer['rows'].append(row_result)
+        pending = buffer['pending']
+        pending['processed_rows'] = pending.get('processed_rows', 0) + 1
+        pending[counter] = pending.get(counter, 0) + 1
+        should_flush = pending['processed_rows'] >= IMPORT_JOB_FLUSH_EVERY
+
+    if should_flush:
+        _flush_job_rows(job_id)
+
+
+def _create_import_job(import_type, created_by):
+    """Returns ``(job, created)``; ``created`` is False when the user already has an import running."""
+    job, created = job_registry.create_if_absent(
+        IMPORT_JOB_TYPE,
+        created_by=created_by,
+        message='Importação iniciada.',
+        details={'import_type': import_type, 'ignored_columns': []},
+    )
+    if not created:
+        return job, False
+    _prune_job_logs(job_registry.retention_seconds())
+    with _IMPORT_JOB_BUFFERS_LOCK:
+        _IMPORT_JOB_BUFFERS[job['job_id']] = {'rows': [], 'pending': {}}
+    return job, True
 
 
 def _run_tabular_import_job(job_id, file_content, app_obj, parse_method_name, process_method_name):
@@ -181,10 +263,11 @@ def _run_users_csv_import_job(job_id, file_content, app_obj):
     _run_tabular_import_job(job_id, file_content, app_obj, 'parse_users_csv', 'process_user_csv_record')
 
 
-def _apply_import_rows_filter(rows, field, query):
+def _import_row_matcher(field, query):
+    """Returns a predicate for the status filter, or ``None`` when there is nothing to filter."""
     q = (query or '').strip().lower()
     if not q:
-        return rows
+        return None
 
     allowed_fields = {'row_number', 'nome', 'cpf', 'curso', 'ra', 'status', 'message'}
     normalized_field = (field or 'all').strip().lower()
@@ -205,65 +288,74 @@ def _apply_import_rows_filter(rows, field, query):
         ]
         return any(q in str(value).lower() for value in searchable)
 
-    return [row for row in rows if match_row(row)]
+    return match_row
 
 
 def _build_import_job_payload(job_id, page, per_page, filter_field, filter_query):
     page = max(page, 1)
     per_page = max(min(per_page, 100), 5)
 
-    with _IMPORT_JOBS_LOCK:
-        memory_job = _IMPORT_JOBS.get(job_id)
-        file_job = _load_job(job_id)
-        job = _best_job_state(memory_job, file_job)
-        if not job:
-            return None
-
-        _IMPORT_JOBS[job_id] = job
-
-        rows = list(job.get('rows', []))
-        filtered_rows = _apply_import_rows_filter(rows, filter_field, filter_query)
-        total_items = len(filtered_rows)
-        pages = max(1, ceil(total_items / per_page))
-        if page > pages:
-            page = pages
-
-        start = (page - 1) * per_page
-        end = start + per_page
-        page_items = filtered_rows[start:end]
+    job = job_registry.get(job_id)
+    if not job or job['job_type'] != IMPORT_JOB_TYPE:
+        return None
 
-        return {
-            'job_id': job['job_id'],
-            'import_type': job.get('import_type'),
-            'status': job['status'],
-            'completed': job['completed'],
-            'message': job['message'],
-            'total_rows': job['total_rows'],
-            'processed_rows': job['processed_rows'],
-            'created': job['created'],
-            'updated': job['updated'],
-            'unchanged': job['unchanged'],
-            'errors_count': job['errors_count'],
-            'ignored_columns': job['ignored_columns'],
-            'rows': page_items,
-            'filters': {
-                'field': filter_field,
-                'q': filter_query,
-                'filtered_total_items': total_items,
-            },
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'pages': pages,
-                'total_items': total_items,
-            },
-        }
+    logged_rows = _count_job_rows(job_id)
+    match_row = _import_row_matcher(filter_field, filter_query)
+    if match_row is None:
+        positions = range(logged_rows)
+    else:
+        positions = [position for position, row in _iter_job_rows(job_id, logged_rows) if match_row(row)]
+
+    total_items = len(positions)
+    pages = max(1, ceil(total_items / per_page))
+    if page > pages:
+        page = pages
+
+    start = (page - 1) * per_page
+    end = start + per_page
+    page_items = _read_job_rows(job_id, positions[start:end])
+    details = job.get('details') or {}
+
+    return {
+        'job_id': job['job_id'],
+        'import_type': details.get('import_type'),
+        'status': job['status'],
+        'completed': bool(job['completed']),
+        'message': job['message'],
+        'total_rows': job['total_rows'],
+        'processed_rows': job['processed_rows'],
+        'created': job['created_count'],
+        'updated': job['updated_count'],
+        'unchanged': job['unchanged_count'],
+        'errors_count': job['errors_count'],
+        'ignored_columns': details.get('ignored_columns', []),
+        'rows': page_items,
+        'filters': {
+            'field': filter_field,
+            'q': filter_query,
+            'filtered_total_items': total_items,
+        },
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'pages': pages,
+            'total_items': total_items,
+        },
+    }
 
 
 def _cert_generated_dir() -> Path:
     return Path(current_app.root_path) / 'static' / 'certificates' / 'generated'
 
 
+def _fetch_worker_metrics(url: str) -> dict:
+    try:
+        with urllib.request.urlopen(f"{url}/metrics.json", timeout=2) as response:
+            return {"url": url, "metrics": json.loads(response.read().decode('utf-8'))}
+    except Exception as e:
+        return {"url": url, "erro": str(e)}
+
+
 def _bytes_to_mb(size_bytes: int) -> float:
     if size_bytes <= 0:
         return 0.0
@@ -440,38 +532,17 @@ def importar_alunos_xlsx_start():
     if file.filename == '':
         return jsonify({"erro": "Nenhum arquivo selecionado"}), 400
 
-    with _IMPORT_JOBS_LOCK:
-        active_job = _get_active_job_for_user(current_user.username)
-        if active_job:
-            return jsonify({
-                'job_id': active_job['job_id'],
-                'import_type': active_job.get('import_type'),
-                'message': 'Já existe uma importação em andamento para este usuário.',
-                'reused': True,
-            }), 202
-
-    job_id = uuid4().hex
-    file_content = file.read()
+    job, created = _create_import_job('xlsx', current_user.username)
+    if not created:
+        return jsonify({
+            'job_id': job['job_id'],
+            'import_type': (job.get('details') or {}).get('import_type'),
+            'message': 'Já existe uma importação em andamento para este usuário.',
+            'reused': True,
+        }), 202
 
-    with _IMPORT_JOBS_LOCK:
-        _IMPORT_JOBS[job_id] = {
-            'job_id': job_id,
-            'import_type': 'xlsx',
-            'status': 'queued',
-            'completed': False,
-            'message': 'Importação iniciada.',
-            'created_by': current_user.username,
-            'updated_at': time.time(),
-            'total_rows': 0,
-            'processed_rows': 0,
-            'created': 0,
-            'updated': 0,
-            'unchanged': 0,
-            'errors_count': 0,
-            'ignored_columns': [],
-            'rows': [],
-        }
-        _persist_job(_IMPORT_JOBS[job_id])
+    file_content = file.read()
+    job_id = job['job_id']
 
     app_obj = current_app._get_current_object()
     worker = Thread(target=_run_xlsx_import_job, args=(job_id, file_content, app_obj), daemon=True)
@@ -493,38 +564,17 @@ def importar_usuarios_csv_start():
     if file.filename == '':
         return jsonify({"erro": "Nenhum arquivo selecionado"}), 400
 
-    with _IMPORT_JOBS_LOCK:
-        active_job = _get_active_job_for_user(current_user.username)
-        if active_job:
-            return jsonify({
-                'job_id': active_job['job_id'],
-                'import_type': active_job.get('import_type'),
-                'message': 'Já existe uma importação em andamento para este usuário.',
-                'reused': True,
-            }), 202
-
-    job_id = uuid4().hex
-    file_content = file.read()
+    job, created = _create_import_job('csv', current_user.username)
+    if not created:
+        return jsonify({
+            'job_id': job['job_id'],
+            'import_type': (job.get('details') or {}).get('import_type'),
+            'message': 'Já existe uma importação em andamento para este usuário.',
+            'reused': True,
+        }), 202
 
-    with _IMPORT_JOBS_LOCK:
-        _IMPORT_JOBS[job_id] = {
-            'job_id': job_id,
-            'import_type': 'csv',
-            'status': 'queued',
-            'completed': False,
-            'message': 'Importação iniciada.',
-            'created_by': current_user.username,
-            'updated_at': time.time(),
-            'total_rows': 0,
-            'processed_rows': 0,
-            'created': 0,
-            'updated': 0,
-            'unchanged': 0,
-            'errors_count': 0,
-            'ignored_columns': [],
-            'rows': [],
-        }
-        _persist_job(_IMPORT_JOBS[job_id])
+    file_content = file.read()
+    job_id = job['job_id']
 
     app_obj = current_app._get_current_object()
     worker = Thread(target=_run_users_csv_import_job, args=(job_id, file_content, app_obj), daemon=True)
@@ -668,6 +718,7 @@ def cleanup_generated_certificates_cache():
         for item in candidate_files:
             try:
                 Path(item['path']).unlink(missing_ok=True)
+                Path(f"{item['path']}{CertificateService.PDF_CACHE_DIGEST_SUFFIX}").unlink(missing_ok=True)
                 deleted_files += 1
                 freed_bytes += item['size_bytes']
             except OSError:
@@ -697,3 +748,21 @@ def cleanup_generated_certificates_cache():
     }
 
     return jsonify(response)
+
+
+@bp.route('/admin/notificacoes/metricas', methods=['GET'])
+@login_required
+def email_pipeline_metrics():
+    if current_user.role != 'admin':
+        return jsonify({"erro": "Negado"}), 403
+
+    response = {
+        "publisher": email_metrics.snapshot(),
+        "queues": None,
+        "workers": [_fetch_worker_metrics(url) for url in current_app.config.get('EMAIL_WORKER_METRICS_URLS', [])],
+    }
+    try:
+        response["queues"] = NotificationService().queue_depths()
+    except Exception as e:
+        response["queues_erro"] = str(e)
+    return jsonify(response)
@@ -2,16 +2,18 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app, abort, url_for, send_file
 from flask_login import login_required, current_user
 from app.services.certificate_service import CertificateService
+from app.services.certificate_image_service import CertificateImageService
+from app.services.certificate_queue_service import CertificateQueueService
+from app.services.job_registry_service import JobRegistryService
 from app.services.event_service import EventService
 from app.services.event_team_certificate_service import EventTeamCertificateService
 from werkzeug.utils import secure_filename
-from threading import Lock, Thread
-from uuid import uuid4
+from threading import Thread
 from types import SimpleNamespace
+from uuid import uuid4
 import os
 import json
 import re
-import time
 
 from sqlalchemy.exc import IntegrityError
 from app.models import Event, Enrollment, User, Activity, EventTeamCertificateRecipient
@@ -24,21 +26,11 @@ MAX_DESIGN_IMAGE_SIZE = 8 * 1024 * 1024
 bp = Blueprint('certificates', __name__, url_prefix='/api/certificates')
 cert_service = CertificateService()
 team_cert_service = EventTeamCertificateService()
-_SEND_BATCH_JOBS = {}
-_SEND_BATCH_LOCK = Lock()
-_SEND_TEAM_BATCH_JOBS = {}
-_SEND_TEAM_BATCH_LOCK = Lock()
-
-
-def _prune_job_cache(jobs, max_completed_age=300, max_entries=100):
-    now = time.time()
-    to_remove = [job_id for job_id, job in list(jobs.items()) if job.get('completed') and now - job.get('updated_at', 0) > max_completed_age]
-    for job_id in to_remove:
-        del jobs[job_id]
-    if len(jobs) > max_entries:
-        sorted_jobs = sorted(jobs.items(), key=lambda x: x[1].get('updated_at', 0))
-        for job_id, _ in sorted_jobs[:len(jobs) - max_entries]:
-            del jobs[job_id]
+image_service = CertificateImageService()
+certificate_queue = CertificateQueueService()
+job_registry = JobRegistryService()
+SEND_BATCH_JOB_TYPE = 'certificate_batch'
+SEND_TEAM_BATCH_JOB_TYPE = 'team_certificate_batch'
 
 
 def _is_allowed_image(filename):
@@ -72,25 +64,8 @@ def _get_or_404(model, pk):
     return entity
 
 
-def _get_active_send_batch_job(event_id, created_by):
-    for job in _SEND_BATCH_JOBS.values():
-        if job.get('event_id') != event_id:
-            continue
-        if job.get('created_by') != created_by:
-            continue
-        if not job.get('completed'):
-            return job
-    return None
-
-
 def _update_send_batch_job(job_id, **kwargs):
-    with _SEND_BATCH_LOCK:
-        job = _SEND_BATCH_JOBS.get(job_id)
-        if not job:
-            return None
-        job.update(kwargs)
-        job['updated_at'] = time.time()
-        return dict(job)
+    return job_registry.update(job_id, **kwargs)
 
 
 def _run_send_batch_job(job_id, event_id, app_obj):
@@ -102,7 +77,7 @@ def _run_send_batch_job(job_id, event_id, app_obj):
                 status='running',
                 message='Gerando PDFs e enfileirando e-mails.',
             )
-            success, message, summary = service.queue_event_certificates(event_id)
+            success, message, summary = service.queue_event_certificates(event_id, send_id=job_id)
             _update_send_batch_job(
                 job_id,
                 status='completed' if success else 'error',
@@ -156,10 +131,11 @@ def _normalize_template_payload(template_source, designer_mode='event'):
     return cert_service.normalize_template_payload(parsed, designer_mode=designer_mode), None
 
 
-def _build_pdf_preview_response(pdf_path):
+def _build_pdf_preview_response(pdf_source):
+    """Streams a PDF given either its path or an in-memory buffer."""
     from flask import send_file
 
-    response = send_file(pdf_path, mimetype='application/pdf', conditional=False, max_age=0)
+    response = send_file(pdf_source, mimetype='application/pdf', conditional=False, max_age=0)
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
@@ -383,8 +359,8 @@ def setup_certificate(event_id):
         os.makedirs(upload_dir, exist_ok=True)
         save_path = os.path.join(upload_dir, filename)
         bg_file.save(save_path)
-        # Store as relative path for web access
-        bg_path = f"certificates/backgrounds/{filename}"
+        # Store as relative path for web access; certificates embed the print-ready variant.
+        bg_path = image_service.optimize_static_upload(f"certificates/backgrounds/{filename}", stretch=True)
     
     success = cert_service.update_config(event_id, bg_path, normalized_template)
     
@@ -418,15 +394,16 @@ def preview_layout(event_id):
         cpf=str(preview_data.get('{{CPF}}') or f'PREVIEW-EVENT-{event_id}'),
         email=None,
     )
-    pdf_path = cert_service.generate_pdf(
+    pdf_buffer = cert_service.generate_pdf(
         event,
         preview_user,
         [],
         preview_data.get('{{HORAS}}') or '0',
         template_override=normalized_template,
         tag_overrides=preview_data,
+        as_buffer=True,
     )
-    return _build_pdf_preview_response(pdf_path)
+    return _build_pdf_preview_response(pdf_buffer)
 
 
 @bp.route('/upload_asset/<int:event_id>', methods=['POST'])
@@ -447,11 +424,12 @@ def upload_asset(event_id):
     os.makedirs(upload_dir, exist_ok=True)
     save_path = os.path.join(upload_dir, filename)
     image_file.save(save_path)
+    asset_path = image_service.optimize_static_upload(f"certificates/assets/{filename}")
 
     return jsonify({
         "mensagem": "Asset enviado com sucesso",
-        "asset_url": url_for('static', filename=f"certificates/assets/{filename}"),
-        "asset_path": f"certificates/assets/{filename}"
+        "asset_url": url_for('static', filename=asset_path),
+        "asset_path": asset_path
     })
 
 @bp.route('/send_batch/<int:event_id>', methods=['POST'])
@@ -462,32 +440,29 @@ def send_batch(event_id):
     if not _can_manage_certificates(event):
         return jsonify({"erro": "Acesso negado para este evento"}), 403
 
-    with _SEND_BATCH_LOCK:
-        active_job = _get_active_send_batch_job(event_id, current_user.username)
-        if active_job:
-            return jsonify({
-                'job_id': active_job['job_id'],
-                'mensagem': active_job.get('message') or 'Já existe um envio em processamento.',
-                'resultado': 'processando',
-                'reused': True,
-            }), 202
-
-        job_id = uuid4().hex
-        _SEND_BATCH_JOBS[job_id] = {
+    job, created = job_registry.create_if_absent(
+        SEND_BATCH_JOB_TYPE,
+        created_by=current_user.username,
+        entity_id=event_id,
+        message='Envio em lote iniciado.',
+        resultado='processando',
+    )
+    if not created:
+        return jsonify({
+            'job_id': job['job_id'],
+            'mensagem': job.get('message') or 'Já existe um envio em processamento.',
+            'resultado': 'processando',
+            'reused': True,
+        }), 202
+    job_id = job['job_id']
+
+    if certificate_queue.enabled() and certificate_queue.publish_batch('event', event_id, job_id):
+        _update_send_batch_job(job_id, message='Envio encaminhado para a fila de renderização.')
+        return jsonify({
             'job_id': job_id,
-            'event_id': event_id,
-            'created_by': current_user.username,
-            'status': 'queued',
-            'completed': False,
+            'mensagem': 'Envio em lote encaminhado para a fila de renderização.',
             'resultado': 'processando',
-            'message': 'Envio em lote iniciado.',
-            'total_enviado': 0,
-            'sem_email': 0,
-            'falha_fila': 0,
-            'created_at': time.time(),
-            'updated_at': time.time(),
-        }
-        _prune_job_cache(_SEND_BATCH_JOBS)
+        }), 202
 
     app_obj = current_app._get_current_object()
     worker = Thread(target=_run_send_batch_job, args=(job_id, event_id, app_obj), daemon=True)
@@ -503,17 +478,15 @@ def send_batch(event_id):
 @bp.route('/send_batch/status/<job_id>', methods=['GET'])
 @login_required
 def send_batch_status(job_id):
-    with _SEND_BATCH_LOCK:
-        job = dict(_SEND_BATCH_JOBS.get(job_id) or {})
-
-    if not job:
+    job = job_registry.get(job_id)
+    if not job or job['job_type'] != SEND_BATCH_JOB_TYPE:
         return jsonify({'erro': 'Job não encontrado.'}), 404
 
-    event = db.session.get(Event, job.get('event_id'))
+    event = db.session.get(Event, job['entity_id'])
     if not event or not _can_manage_certificates(event):
         return jsonify({'erro': 'Acesso negado.'}), 403
 
-    return jsonify(job)
+    return jsonify(job_registry.batch_payload(job, 'event_id'))
 
 @bp.route('/list_delivery/<int:event_id>', methods=['GET'])
 @login_required
@@ -614,7 +587,10 @@ def resend_single(enrollment_id):
             'view_certificate_url': build_absolute_app_url(f"/api/certificates/preview_public/{enrollment.cert_hash}") if enrollment.cert_hash else '',
             'my_certificates_url': validation_url,
         },
-        attachment_path=pdf_path
+        attachment_path=pdf_path,
+        idempotency_key=cert_service.notifier.build_idempotency_key(
+            'certificate_resend', enrollment.cert_hash, target_email, uuid4().hex
+        ),
     )
     
     from datetime import datetime
@@ -972,51 +948,14 @@ def _run_send_team_batch_job(job_id, event_id, app_obj):
                 )
                 return
 
-            resolved_rows = team_cert_service.resolve_event_recipients(event)
-            total_enviado = 0
-            sem_email = 0
-            falha_fila = 0
-
-            missing_hashes = [r for r in resolved_rows if not r.get('cert_hash')]
-            if missing_hashes:
-                for r in missing_hashes:
-                    r = team_cert_service.ensure_persisted_automatic_recipient(event, r)
-                    team_cert_service.ensure_recipient_hash(event_id, r)
-                db.session.commit()
-
-            for row in resolved_rows:
-                if not row.get('email'):
-                    sem_email += 1
-                    continue
-
-                row = team_cert_service.ensure_persisted_automatic_recipient(event, row)
-
-                recipient = team_cert_service.build_virtual_recipient(event, row)
-                try:
-                    pdf_path = team_cert_service.generate_recipient_pdf(event, recipient)
-                    if not team_cert_service.queue_email(event, recipient, pdf_path):
-                        falha_fila += 1
-                        continue
-                    resolved_id = row.get('id')
-                    if resolved_id is not None:
-                        persisted_rec = db.session.get(EventTeamCertificateRecipient, resolved_id)
-                        if persisted_rec:
-                            persisted_rec.cert_entregue = True
-                            persisted_rec.cert_data_envio = datetime.now()
-                    total_enviado += 1
-                except Exception:
-                    falha_fila += 1
-
-            db.session.commit()
+            summary = team_cert_service.deliver_certificates(event, send_id=job_id)
             _update_send_team_batch_job(
                 job_id,
                 status='completed',
                 completed=True,
                 resultado='sucesso',
                 message='Envio em lote de equipe concluído.',
-                total_enviado=total_enviado,
-                sem_email=sem_email,
-                falha_fila=falha_fila,
+                **summary,
             )
         except Exception as exc:
             current_app.logger.exception('Falha no job de envio em lote de equipe (event_id=%s)', event_id)
@@ -1033,24 +972,7 @@ def _run_send_team_batch_job(job_id, event_id, app_obj):
 
 
 def _update_send_team_batch_job(job_id, **kwargs):
-    with _SEND_TEAM_BATCH_LOCK:
-        job = _SEND_TEAM_BATCH_JOBS.get(job_id)
-        if not job:
-            return None
-        job.update(kwargs)
-        job['updated_at'] = time.time()
-        return dict(job)
-
-
-def _get_active_send_team_batch_job(event_id, created_by):
-    for job in _SEND_TEAM_BATCH_JOBS.values():
-        if job.get('event_id') != event_id:
-            continue
-        if job.get('created_by') != created_by:
-            continue
-        if not job.get('completed'):
-            return job
-    return None
+    return job_registry.update(job_id, **kwargs)
 
 
 @bp.route('/team/event/<int:event_id>/send_batch', methods=['POST'])
@@ -1060,32 +982,29 @@ def send_team_batch(event_id):
     if not _can_manage_certificates(event):
         return jsonify({'erro': 'Acesso negado para este evento'}), 403
 
-    with _SEND_TEAM_BATCH_LOCK:
-        active_job = _get_active_send_team_batch_job(event_id, current_user.username)
-        if active_job:
-            return jsonify({
-                'job_id': active_job['job_id'],
-                'mensagem': active_job.get('message') or 'Já existe um envio em processamento.',
-                'resultado': 'processando',
-                'reused': True,
-            }), 202
-
-        job_id = uuid4().hex
-        _SEND_TEAM_BATCH_JOBS[job_id] = {
+    job, created = job_registry.create_if_absent(
+        SEND_TEAM_BATCH_JOB_TYPE,
+        created_by=current_user.username,
+        entity_id=event_id,
+        message='Envio em lote de equipe iniciado.',
+        resultado='processando',
+    )
+    if not created:
+        return jsonify({
+            'job_id': job['job_id'],
+            'mensagem': job.get('message') or 'Já existe um envio em processamento.',
+            'resultado': 'processando',
+            'reused': True,
+        }), 202
+    job_id = job['job_id']
+
+    if certificate_queue.enabled() and certificate_queue.publish_batch('team_event', event_id, job_id):
+        _update_send_team_batch_job(job_id, message='Envio de equipe encaminhado para a fila de renderização.')
+        return jsonify({
             'job_id': job_id,
-            'event_id': event_id,
-            'created_by': current_user.username,
-            'status': 'queued',
-            'completed': False,
+            'mensagem': 'Envio em lote de equipe encaminhado para a fila de renderização.',
             'resultado': 'processando',
-            'message': 'Envio em lote de equipe iniciado.',
-            'total_enviado': 0,
-            'sem_email': 0,
-            'falha_fila': 0,
-            'created_at': time.time(),
-            'updated_at': time.time(),
-        }
-        _prune_job_cache(_SEND_TEAM_BATCH_JOBS)
+        }), 202
 
     app_obj = current_app._get_current_object()
     worker = Thread(target=_run_send_team_batch_job, args=(job_id, event_id, app_obj), daemon=True)
@@ -1101,17 +1020,15 @@ def send_team_batch(event_id):
 @bp.route('/team/send_batch/status/<job_id>', methods=['GET'])
 @login_required
 def send_team_batch_status(job_id):
-    with _SEND_TEAM_BATCH_LOCK:
-        job = dict(_SEND_TEAM_BATCH_JOBS.get(job_id) or {})
-
-    if not job:
+    job = job_registry.get(job_id)
+    if not job or job['job_type'] != SEND_TEAM_BATCH_JOB_TYPE:
         return jsonify({'erro': 'Job não encontrado.'}), 404
 
-    event = db.session.get(Event, job.get('event_id'))
+    event = db.session.get(Event, job['entity_id'])
     if not event or not _can_manage_certificates(event):
         return jsonify({'erro': 'Acesso negado.'}), 403
 
-    return jsonify(job)
+    return jsonify(job_registry.batch_payload(job, 'event_id'))
 
 
 @bp.route('/team/event/<int:event_id>/setup', methods=['POST'])
@@ -1147,7 +1064,7 @@ def setup_team_certificate(event_id):
         os.makedirs(upload_dir, exist_ok=True)
         save_path = os.path.join(upload_dir, filename)
         bg_file.save(save_path)
-        bg_path = f"certificates/backgrounds/{filename}"
+        bg_path = image_service.optimize_static_upload(f"certificates/backgrounds/{filename}", stretch=True)
 
     event.cert_team_bg_path = bg_path or None
     event.cert_team_template_json = normalized_template
@@ -1185,13 +1102,14 @@ def preview_team_layout(event_id):
         cert_hash=str(preview_data.get('{{HASH}}') or 'TEAMPREVIEWHASH'),
         activity=None,
     )
-    pdf_path = team_cert_service.generate_recipient_pdf(
+    pdf_buffer = team_cert_service.generate_recipient_pdf(
         event,
         preview_recipient,
         template_override=normalized_template,
         tag_overrides=preview_data,
+        as_buffer=True,
     )
-    return _build_pdf_preview_response(pdf_path)
+    return _build_pdf_preview_response(pdf_buffer)
 
 
 @bp.route('/team/event/<int:event_id>/upload_asset', methods=['POST'])
@@ -1211,11 +1129,12 @@ def upload_team_asset(event_id):
     os.makedirs(upload_dir, exist_ok=True)
     save_path = os.path.join(upload_dir, filename)
     image_file.save(save_path)
+    asset_path = image_service.optimize_static_upload(f"certificates/assets/{filename}")
 
     return jsonify({
         'mensagem': 'Asset enviado com sucesso',
-        'asset_url': url_for('static', filename=f"certificates/assets/{filename}"),
-        'asset_path': f"certificates/assets/{filename}",
+        'asset_url': url_for('static', filename=asset_path),
+        'asset_path': asset_path,
     })
 
 
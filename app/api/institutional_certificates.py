@@ -4,9 +4,7 @@ import re
 import csv
 import io
 import os
-import time
-from threading import Lock, Thread
-from uuid import uuid4
+from threading import Thread
 from types import SimpleNamespace
 
 from flask import Blueprint, jsonify, request, make_response, send_file, current_app
@@ -25,11 +23,16 @@ from app.models import (
 )
 from app.services.institutional_certificate_service import InstitutionalCertificateService
 from app.services.certificate_service import CertificateService
+from app.services.certificate_image_service import CertificateImageService
+from app.services.certificate_queue_service import CertificateQueueService
+from app.services.job_registry_service import JobRegistryService
 
 bp = Blueprint('institutional_certificates', __name__, url_prefix='/api/institutional_certificates')
 institutional_service = InstitutionalCertificateService()
-_SEND_CERTIFICATE_JOBS = {}
-_SEND_CERTIFICATE_LOCK = Lock()
+image_service = CertificateImageService()
+certificate_queue = CertificateQueueService()
+job_registry = JobRegistryService()
+SEND_JOB_TYPE = 'institutional_certificate_batch'
 
 ALLOWED_IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp'}
 MAX_DESIGN_IMAGE_SIZE = 8 * 1024 * 1024
@@ -284,8 +287,9 @@ def _normalize_template_payload(template_source, designer_mode='institutional'):
     return CertificateService.normalize_template_payload(parsed, designer_mode=designer_mode), None
 
 
-def _build_pdf_preview_response(pdf_path):
-    response = send_file(pdf_path, mimetype='application/pdf', conditional=False, max_age=0)
+def _build_pdf_preview_response(pdf_source):
+    """Streams a PDF given either its path or an in-memory buffer."""
+    response = send_file(pdf_source, mimetype='application/pdf', conditional=False, max_age=0)
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
@@ -414,93 +418,8 @@ def _get_viewable_recipient_or_error(certificate_id, recipient_id):
     return cert, recipient, None
 
 
-def _get_active_send_job(certificate_id, created_by):
-    for job in _SEND_CERTIFICATE_JOBS.values():
-        if job.get('certificate_id') != certificate_id:
-            continue
-        if job.get('created_by') != created_by:
-            continue
-        if not job.get('completed'):
-            return job
-    return None
-
-
 def _update_send_job(job_id, **kwargs):
-    with _SEND_CERTIFICATE_LOCK:
-        job = _SEND_CERTIFICATE_JOBS.get(job_id)
-        if not job:
-            return None
-        job.update(kwargs)
-        job['updated_at'] = time.time()
-        return dict(job)
-
-
-def _send_institutional_certificates_sync(certificate_id):
-    cert = db.session.get(InstitutionalCertificate, certificate_id)
-    if not cert:
-        return False, 'Certificado não encontrado', {
-            'total_enviado': 0,
-            'sem_email': 0,
-            'falha_fila': 0,
-        }
-
-    recipients = InstitutionalCertificateRecipient.query.filter_by(certificate_id=certificate_id).all()
-    if not recipients:
-        return False, 'Nenhum destinatario cadastrado', {
-            'total_enviado': 0,
-            'sem_email': 0,
-            'falha_fila': 0,
-        }
-
-    sent_count = 0
-    skipped_without_email = 0
-    failed_queue = 0
-    now = datetime.utcnow()
-    for recipient in recipients:
-        profile = _recipient_effective_profile(recipient)
-        if not recipient.cert_hash:
-            recipient.cert_hash = institutional_service.build_hash(certificate_id, profile['nome'], profile['email'])
-
-        if not profile['email']:
-            skipped_without_email += 1
-            continue
-
-        pdf_path = institutional_service.generate_recipient_pdf(cert, recipient)
-        queued = institutional_service.queue_email(cert, recipient, pdf_path)
-        if not queued:
-            failed_queue += 1
-            continue
-
-        recipient.cert_entregue = True
-        recipient.cert_data_envio = now
-        sent_count += 1
-
-    cert.status = 'ENVIADO' if sent_count > 0 else cert.status
-    db.session.commit()
-
-    if sent_count == 0 and failed_queue > 0:
-        return False, 'Problema no envio: falha ao enfileirar e-mails.', {
-            'total_enviado': sent_count,
-            'sem_email': skipped_without_email,
-            'falha_fila': failed_queue,
-        }
-
-    if sent_count == 0:
-        return False, 'Problema no envio: nenhum destinatario com email valido', {
-            'total_enviado': sent_count,
-            'sem_email': skipped_without_email,
-            'falha_fila': failed_queue,
-        }
-
-    message = 'Envio concluido'
-    if failed_queue > 0:
-        message = 'Envio parcialmente concluido com falhas'
-
-    return True, message, {
-        'total_enviado': sent_count,
-        'sem_email': skipped_without_email,
-        'falha_fila': failed_queue,
-    }
+    return job_registry.update(job_id, **kwargs)
 
 
 def _run_institutional_send_job(job_id, certificate_id, app_obj):
@@ -511,7 +430,7 @@ def _run_institutional_send_job(job_id, certificate_id, app_obj):
                 status='running',
                 message='Gerando PDFs e enfileirando e-mails.',
             )
-            success, message, summary = _send_institutional_certificates_sync(certificate_id)
+            success, message, summary = institutional_service.deliver_certificates(certificate_id, send_id=job_id)
             _update_send_job(
                 job_id,
                 status='completed' if success else 'error',
@@ -802,7 +721,7 @@ def setup_institutional_certificate(certificate_id):
         os.makedirs(upload_dir, exist_ok=True)
         save_path = os.path.join(upload_dir, filename)
         bg_file.save(save_path)
-        bg_path = f'certificates/backgrounds/{filename}'
+        bg_path = image_service.optimize_static_upload(f'certificates/backgrounds/{filename}', stretch=True)
         cert.cert_bg_path = bg_path
 
     if normalized_template is not None:
@@ -848,13 +767,14 @@ def preview_layout(certificate_id):
         linked_user=None,
     )
 
-    pdf_path = institutional_service.generate_recipient_pdf(
+    pdf_buffer = institutional_service.generate_recipient_pdf(
         cert,
         preview_recipient,
         template_override=normalized_template,
         tag_overrides=preview_data,
+        as_buffer=True,
     )
-    return _build_pdf_preview_response(pdf_path)
+    return _build_pdf_preview_response(pdf_buffer)
 
 
 @bp.route('/<int:certificate_id>/upload_asset', methods=['POST'])
@@ -874,11 +794,12 @@ def upload_institutional_asset(certificate_id):
     os.makedirs(upload_dir, exist_ok=True)
     save_path = os.path.join(upload_dir, filename)
     image_file.save(save_path)
+    asset_path = image_service.optimize_static_upload(f'certificates/assets/{filename}')
 
     return jsonify({
         'mensagem': 'Asset enviado com sucesso',
-        'asset_url': url_for('static', filename=f'certificates/assets/{filename}'),
-        'asset_path': f'certificates/assets/{filename}',
+        'asset_url': url_for('static', filename=asset_path),
+        'asset_path': asset_path,
     })
 
 
@@ -1432,31 +1353,29 @@ def send_institutional_certificates(certificate_id):
     if error:
         return error
 
-    with _SEND_CERTIFICATE_LOCK:
-        active_job = _get_active_send_job(certificate_id, current_user.username)
-        if active_job:
-            return jsonify({
-                'job_id': active_job['job_id'],
-                'mensagem': active_job.get('message') or 'Já existe um envio em processamento.',
-                'resultado': 'processando',
-                'reused': True,
-            }), 202
-
-        job_id = uuid4().hex
-        _SEND_CERTIFICATE_JOBS[job_id] = {
+    job, created = job_registry.create_if_absent(
+        SEND_JOB_TYPE,
+        created_by=current_user.username,
+        entity_id=certificate_id,
+        message='Envio institucional iniciado.',
+        resultado='processando',
+    )
+    if not created:
+        return jsonify({
+            'job_id': job['job_id'],
+            'mensagem': job.get('message') or 'Já existe um envio em processamento.',
+            'resultado': 'processando',
+            'reused': True,
+        }), 202
+    job_id = job['job_id']
+
+    if certificate_queue.enabled() and certificate_queue.publish_batch('institutional', certificate_id, job_id):
+        _update_send_job(job_id, message='Envio institucional encaminhado para a fila de renderização.')
+        return jsonify({
             'job_id': job_id,
-            'certificate_id': certificate_id,
-            'created_by': current_user.username,
-            'status': 'queued',
-            'completed': False,
+            'mensagem': 'Envio institucional encaminhado para a fila de renderização.',
             'resultado': 'processando',
-            'message': 'Envio institucional iniciado.',
-            'total_enviado': 0,
-            'sem_email': 0,
-            'falha_fila': 0,
-            'created_at': time.time(),
-            'updated_at': time.time(),
-        }
+        }), 202
 
     app_obj = current_app._get_current_object()
     worker = Thread(target=_run_institutional_send_job, args=(job_id, certificate_id, app_obj), daemon=True)
@@ -1472,14 +1391,12 @@ def send_institutional_certificates(certificate_id):
 @bp.route('/send/status/<job_id>', methods=['GET'])
 @login_required
 def institutional_send_status(job_id):
-    with _SEND_CERTIFICATE_LOCK:
-        job = dict(_SEND_CERTIFICATE_JOBS.get(job_id) or {})
-
-    if not job:
+    job = job_registry.get(job_id)
+    if not job or job['job_type'] != SEND_JOB_TYPE:
         return jsonify({'erro': 'Job não encontrado.'}), 404
 
-    cert = db.session.get(InstitutionalCertificate, job.get('certificate_id'))
+    cert = db.session.get(InstitutionalCertificate, job['entity_id'])
     if not cert or not _can_edit_institutional_certificate(cert):
         return jsonify({'erro': 'Acesso negado.'}), 403
 
-    return jsonify(job)
+    return jsonify(job_registry.batch_payload(job, 'certificate_id'))
@@ -1,3 +1,5 @@
+import time
+
 import click
 from flask.cli import with_appcontext
 from flask import current_app
@@ -5,6 +7,7 @@ from flask_migrate import upgrade
 
 from app.bootstrap import seed_default_users
 from app.extensions import db
+from app.services.notification_service import NotificationService
 from scripts.migrate_sqlite_to_postgres import run_migration, DEFAULT_SOURCE
 
 
@@ -69,7 +72,56 @@ def bootstrap_postgres_command(source_uri, target_uri, skip_data):
         click.echo(f"- {table_name}: {count} row(s)")
 
 
+@click.command("replay-email-dlq")
+@click.option(
+    "--limit",
+    type=int,
+    default=None,
+    help="Numero maximo de mensagens a reenviar (padrao: todas).",
+)
+@with_appcontext
+def replay_email_dlq_command(limit):
+    """Move messages from email_dlq back to their original queue for another delivery attempt."""
+    try:
+        replayed = NotificationService().replay_dead_letters(limit=limit)
+    except Exception as exc:
+        raise click.ClickException(f"Falha ao reenviar mensagens da DLQ: {exc}")
+    click.echo(f"{replayed} mensagem(ns) reenviada(s) para a fila de origem.")
+
+
+@click.command("relay-notification-outbox")
+@click.option(
+    "--batch-size",
+    type=int,
+    default=None,
+    help="Mensagens publicadas por lote (padrao: NOTIFICATION_OUTBOX_BATCH_SIZE).",
+)
+@click.option("--once", is_flag=True, help="Esvazia o outbox e encerra, em vez de continuar aguardando.")
+@with_appcontext
+def relay_notification_outbox_command(batch_size, once):
+    """Publish pending notification_outbox rows to RabbitMQ in confirmed batches."""
+    service = NotificationService()
+    poll_seconds = current_app.config.get('NOTIFICATION_OUTBOX_POLL_SECONDS', 1)
+    total = 0
+    try:
+        while True:
+            published, failed = service.relay_outbox(batch_size=batch_size)
+            total += published
+            if failed:
+                click.echo(f"{failed} mensagem(ns) do outbox sem confirmacao; nova tentativa no proximo lote.")
+            if published:
+                continue
+            if once:
+                break
+            time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        pass
+    click.echo(f"{total} mensagem(ns) do outbox publicada(s).")
+
+
 def register_cli(app):
     app.cli.add_command(init_db_command)
     app.cli.add_command(seed_dev_data_command)
     app.cli.add_command(bootstrap_postgres_command)
+    app.cli.add_command(replay_email_dlq_command)
+    app.cli.add_command(relay_notification_outbox_command)
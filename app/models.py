@@ -671,3 +671,92 @@ class InstitutionalCertificateRecipient(db.Model):
         db.Index('ix_institutional_recipient_entregue', 'cert_entregue'),
         db.Index('ix_institutional_recipient_data_envio', 'cert_data_envio'),
     )
+
+
+class BackgroundJob(db.Model):
+    """Shared state of a long-running batch or import job.
+
+    Every web worker, node and render worker reads and updates the same row,
+    so status polling and duplicate-job detection do not depend on which
+    process started the job. Counters are only changed through atomic
+    ``col = col + n`` updates (see ``JobRegistryService``).
+    """
+    __tablename__ = 'background_jobs'
+
+    job_id = db.Column(db.String(32), primary_key=True)
+    job_type = db.Column(db.String(40), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=True)
+    created_by = db.Column(db.String(50), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    completed = db.Column(db.Boolean, nullable=False, default=False, server_default=sa.false())
+    resultado = db.Column(db.String(20), nullable=True)
+    message = db.Column(db.Text, nullable=True)
+    details_json = db.Column(db.Text, nullable=True)
+    total_rows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    processed_rows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    unchanged_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    errors_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_enviado = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    sem_email = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    falha_fila = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Epoch seconds, as reported by the job status endpoints.
+    created_at = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_background_jobs_lookup', 'job_type', 'created_by', 'completed'),
+        db.Index('ix_background_jobs_entity', 'job_type', 'entity_id'),
+        # At most one unfinished job per type/owner/entity, so duplicate starts cannot race.
+        db.Index(
+            'uq_background_jobs_active',
+            'job_type',
+            db.text('coalesce(entity_id, 0)'),
+            db.text("coalesce(created_by, '')"),
+            unique=True,
+            sqlite_where=db.text('completed = 0'),
+            postgresql_where=db.text('completed = false'),
+        ),
+    )
+
+
+class BackgroundJobChunk(db.Model):
+    """Counters one render chunk has added to its job.
+
+    A chunk replayed from the dead-letter queue replaces its earlier counts
+    instead of adding them a second time (see ``JobRegistryService.record_chunk``).
+    """
+    __tablename__ = 'background_job_chunks'
+
+    job_id = db.Column(db.String(32), primary_key=True)
+    chunk_id = db.Column(db.String(32), primary_key=True)
+    counters_json = db.Column(db.Text, nullable=False)
+
+
+class NotificationOutbox(db.Model):
+    """E-mail task waiting to be published to RabbitMQ.
+
+    Rows are added to the caller's session, so they commit (or roll back)
+    together with the business change that triggered them. The outbox relay
+    (``flask relay-notification-outbox``) publishes them in batches and
+    deletes each row once the broker confirmed it. Rows sharing a
+    ``coalesce_key`` are held until ``available_at`` (UTC) and then sent
+    as one digest. A relay leases the rows it is publishing with
+    ``claimed_until`` (UTC), so other relays skip them meanwhile.
+    """
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    queue = db.Column(db.String(60), nullable=False)
+    payload_json = db.Column(db.Text, nullable=False)
+    coalesce_key = db.Column(db.String(190), nullable=True)
+    available_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_error = db.Column(db.Text, nullable=True)
+    claimed_until = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_notification_outbox_coalesce', 'coalesce_key', 'available_at'),
+    )
@@ -1,6 +1,9 @@
+from app.extensions import db
 from app.models import Enrollment, Activity
 from .base_repository import BaseRepository
-from typing import Optional, List
+from sqlalchemy import bindparam, update
+from typing import Callable, Dict, Iterable, Optional, List, Tuple
+from datetime import datetime
 
 class EnrollmentRepository(BaseRepository[Enrollment]):
     """
@@ -38,3 +41,97 @@ class EnrollmentRepository(BaseRepository[Enrollment]):
             Enrollment.presente == True,
             Activity.event_id == event_id,
         ).all()
+
+    def get_present_ids_by_event(self, event_id: int) -> List[int]:
+        """
+        Lists the IDs of every present enrollment of an event.
+
+        Args:
+            event_id (int): The event ID.
+
+        Returns:
+            List[int]: Enrollment IDs in ascending order.
+        """
+        rows = db.session.query(Enrollment.id).join(
+            Activity, Enrollment.activity_id == Activity.id
+        ).filter(
+            Activity.event_id == event_id,
+            Enrollment.presente.is_(True),
+        ).order_by(Enrollment.id.asc()).all()
+        return [row.id for row in rows]
+
+    def get_present_by_ids(self, enrollment_ids: Iterable[int]) -> List[Enrollment]:
+        """
+        Loads present enrollments by ID, in ascending ID order.
+
+        Args:
+            enrollment_ids (Iterable[int]): The enrollment IDs.
+
+        Returns:
+            List[Enrollment]: The matching present enrollments.
+        """
+        enrollment_ids = list(enrollment_ids)
+        if not enrollment_ids:
+            return []
+        return self.model.query.filter(
+            Enrollment.id.in_(enrollment_ids),
+            Enrollment.presente.is_(True),
+        ).order_by(Enrollment.id.asc()).all()
+
+    def assign_missing_cert_hashes(self, event_id: int, build_hash: Callable[[str], str]) -> Dict[int, str]:
+        """
+        Assigns validation hashes to every present enrollment of an event that lacks one.
+
+        All rows are written by a single UPDATE statement (executed with one
+        parameter set per enrollment) and a single commit.
+
+        Args:
+            event_id (int): The event ID.
+            build_hash (Callable[[str], str]): Builds a hash from the participant CPF.
+
+        Returns:
+            Dict[int, str]: The hashes that were assigned, keyed by enrollment ID.
+        """
+        pending = db.session.query(Enrollment.id, Enrollment.user_cpf).join(
+            Activity, Enrollment.activity_id == Activity.id
+        ).filter(
+            Activity.event_id == event_id,
+            Enrollment.presente.is_(True),
+            Enrollment.cert_hash.is_(None),
+        ).all()
+        if not pending:
+            return {}
+
+        assigned = {enrollment_id: build_hash(user_cpf) for enrollment_id, user_cpf in pending}
+        table = Enrollment.__table__
+        statement = update(table).where(
+            table.c.id == bindparam('enrollment_id'),
+            table.c.cert_hash.is_(None),
+        ).values(cert_hash=bindparam('new_cert_hash'))
+        db.session.execute(statement, [
+            {'enrollment_id': enrollment_id, 'new_cert_hash': cert_hash}
+            for enrollment_id, cert_hash in assigned.items()
+        ])
+        db.session.commit()
+        return assigned
+
+    def mark_certificates_sent(self, deliveries: Iterable[Tuple[int, datetime]]) -> None:
+        """
+        Flags certificates as delivered in a single UPDATE statement and commit.
+
+        Args:
+            deliveries (Iterable[Tuple[int, datetime]]): Enrollment IDs and their send times.
+        """
+        params = [
+            {'enrollment_id': enrollment_id, 'sent_at': sent_at}
+            for enrollment_id, sent_at in deliveries
+        ]
+        if not params:
+            return
+
+        table = Enrollment.__table__
+        statement = update(table).where(
+            table.c.id == bindparam('enrollment_id'),
+        ).values(cert_entregue=True, cert_data_envio=bindparam('sent_at'))
+        db.session.execute(statement, params)
+        db.session.commit()
@@ -217,27 +217,29 @@ class AdminService:
         if not user or not activity:
             return False, "Usuário ou Atividade não encontrados."
             
+        def notify(enrollment):
+            try:
+                self._notify_manual_enrollment(user, activity)
+            except Exception:
+                current_app.logger.exception(
+                    "Falha ao enfileirar email de inscricao manual para o usuario %s na atividade %s",
+                    user.username,
+                    activity_id,
+                )
+
         success, message, enrollment = self.event_service.manual_enroll_user(
             actor_user or user,
             user,
             activity_id,
             category_id=category_id,
+            on_enrolled=notify,
         )
         if not success:
             return False, message
-
-        try:
-            self._notify_manual_enrollment(user, activity)
-        except Exception:
-            current_app.logger.exception(
-                "Falha ao enfileirar email de inscricao manual para o usuario %s na atividade %s",
-                user.username,
-                activity_id,
-            )
         return True, message
 
     def _notify_manual_enrollment(self, user, activity):
-        """Notify a participant when staff manually add them to an event activity."""
+        """Queue (in the outbox) the e-mail telling a participant staff added them to an activity."""
         if not user or not user.email or not activity:
             return
 
@@ -259,7 +261,7 @@ class AdminService:
         event_time = event_time_value.strftime('%H:%M') if event_time_value else '-'
         event_name = event.nome if event and event.nome else activity.nome
 
-        self.notification_service.send_email_task(
+        self.notification_service.enqueue_email_task(
             to_email=user.email,
             subject=f"Você foi adicionado ao evento: {event_name}",
             template_name='manual_enrollment_confirmation.html',
@@ -0,0 +1,118 @@
+import os
+import secrets
+
+from flask import current_app
+
+
+class CertificateImageService:
+    """Normalizes uploaded certificate images once, at upload time.
+
+    The uploaded file is kept untouched for re-export; a print-ready variant
+    (A4 landscape at 300 dpi at most) is written next to it and that is the
+    path stored on the certificate, so every generated PDF embeds the lighter
+    image instead of the raw upload.
+    """
+
+    PRINT_DPI = 300
+    # A4 landscape (297 x 210 mm) at PRINT_DPI.
+    PRINT_SIZE = (3508, 2480)
+    VARIANT_SUFFIX = '.print'
+    DEFAULT_JPEG_QUALITY = 90
+
+    @staticmethod
+    def _enabled():
+        return bool(current_app.config.get('CERTIFICATE_IMAGE_OPTIMIZE_ENABLED', True))
+
+    @classmethod
+    def _jpeg_quality(cls):
+        try:
+            quality = int(current_app.config.get('CERTIFICATE_IMAGE_JPEG_QUALITY', cls.DEFAULT_JPEG_QUALITY))
+        except (TypeError, ValueError):
+            return cls.DEFAULT_JPEG_QUALITY
+        return min(max(quality, 1), 95)
+
+    @staticmethod
+    def _has_alpha(image):
+        if image.mode in ('RGBA', 'LA', 'PA'):
+            return True
+        return image.mode == 'P' and 'transparency' in image.info
+
+    def _fit(self, image, stretch):
+        max_w, max_h = self.PRINT_SIZE
+        width, height = image.size
+        if width <= max_w and height <= max_h:
+            return image, False
+
+        from PIL import Image
+
+        if stretch:
+            # Backgrounds are stretched over the whole page, so each axis is clamped on its own.
+            return image.resize((min(width, max_w), min(height, max_h)), Image.LANCZOS), True
+        image = image.copy()
+        image.thumbnail(self.PRINT_SIZE, Image.LANCZOS)
+        return image, True
+
+    def optimize(self, original_path, stretch=False):
+        """Writes the print variant of ``original_path`` and returns the path to embed.
+
+        ``stretch`` is used for page backgrounds, which are drawn over the full
+        page regardless of their aspect ratio. Falls back to the original file
+        when optimization is disabled, the file is not a readable image, or the
+        variant would not be any lighter.
+        """
+        if not self._enabled():
+            return original_path
+        stem, _ = os.path.splitext(original_path)
+        return self.write_variant(original_path, f"{stem}{self.VARIANT_SUFFIX}", stretch=stretch)
+
+    def write_variant(self, original_path, variant_stem, stretch=False):
+        """Writes the print variant of ``original_path`` to ``variant_stem`` plus ``.jpg``/``.png``.
+
+        Returns the path to embed: the variant, or the original file when it is
+        not a readable image or the variant would not be any lighter.
+        """
+        from PIL import Image, ImageOps, UnidentifiedImageError
+
+        try:
+            with Image.open(original_path) as source:
+                source.load()
+                image = ImageOps.exif_transpose(source)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            # Decompression bombs (oversized uploads) are refused by Pillow before decoding.
+            current_app.logger.warning('Imagem de certificado não pôde ser otimizada: %s', original_path)
+            return original_path
+
+        has_alpha = self._has_alpha(image)
+        image, resized = self._fit(image, stretch)
+        variant_path = f"{variant_stem}{'.png' if has_alpha else '.jpg'}"
+        # Unique per writer: render processes may prepare the same variant at once.
+        tmp_path = f"{variant_path}.{secrets.token_hex(4)}.tmp"
+
+        save_kwargs = {'dpi': (self.PRINT_DPI, self.PRINT_DPI), 'optimize': True}
+        if has_alpha:
+            image = image.convert('RGBA')
+            save_kwargs['format'] = 'PNG'
+        else:
+            image = image.convert('RGB')
+            save_kwargs.update(format='JPEG', quality=self._jpeg_quality(), progressive=True)
+
+        try:
+            image.save(tmp_path, **save_kwargs)
+            if not resized and os.path.getsize(tmp_path) >= os.path.getsize(original_path):
+                os.remove(tmp_path)
+                if os.path.exists(variant_path):
+                    os.remove(variant_path)
+                return original_path
+            os.replace(tmp_path, variant_path)
+        except OSError:
+            current_app.logger.exception('Falha ao gravar variante otimizada de %s', original_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return original_path
+        return variant_path
+
+    def optimize_static_upload(self, relative_path, stretch=False):
+        """Same as :meth:`optimize` for a path relative to the ``static`` folder."""
+        static_root = os.path.join(current_app.root_path, 'static')
+        optimized = self.optimize(os.path.join(static_root, relative_path), stretch=stretch)
+        return os.path.relpath(optimized, static_root).replace(os.sep, '/')
@@ -0,0 +1,95 @@
+import json
+
+import pika
+from flask import current_app
+
+from app.services.notification_service import RabbitMQPublisher
+
+
+class CertificateQueueService:
+    """Producer for the 'certificate_render' queue consumed by ``render_worker.py``.
+
+    A batch is published as a single ``plan`` task. The render worker that picks
+    it up prepares the batch (hashes, persisted recipients) and fans it out as
+    ``chunk`` tasks of recipient IDs, so rendering scales by adding render
+    worker processes on any node.
+    """
+
+    QUEUE_NAME = 'certificate_render'
+    DLQ_NAME = 'certificate_render_dlq'
+    DLQ_ROUTING_KEY = 'certificate_render_dlq_key'
+    KINDS = ('event', 'team_event', 'institutional')
+    DEFAULT_CHUNK_SIZE = 50
+
+    @staticmethod
+    def enabled():
+        return bool(current_app.config.get('CERTIFICATE_RENDER_QUEUE_ENABLED', False))
+
+    @classmethod
+    def chunk_size(cls):
+        try:
+            return max(int(current_app.config.get('CERTIFICATE_RENDER_CHUNK_SIZE', cls.DEFAULT_CHUNK_SIZE)), 1)
+        except (TypeError, ValueError):
+            return cls.DEFAULT_CHUNK_SIZE
+
+    @classmethod
+    def split(cls, ids, chunk_size=None):
+        size = chunk_size or cls.chunk_size()
+        ids = list(ids)
+        return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+    @staticmethod
+    def _properties():
+        return pika.BasicProperties(
+            delivery_mode=2,
+            content_type='application/json',
+        )
+
+    @classmethod
+    def publish(cls, channel, task):
+        channel.basic_publish(
+            exchange='',
+            routing_key=cls.QUEUE_NAME,
+            body=json.dumps(task),
+            properties=cls._properties(),
+        )
+
+    @classmethod
+    def publish_chunks(cls, channel, kind, entity_id, job_id, chunks):
+        for index, ids in enumerate(chunks):
+            cls.publish(channel, {
+                'task': 'chunk',
+                'kind': kind,
+                'entity_id': entity_id,
+                'job_id': job_id,
+                'chunk_id': index,
+                'ids': list(ids),
+            })
+        return len(chunks)
+
+    def publish_batch(self, kind, entity_id, job_id):
+        """Publishes the ``plan`` task of a batch.
+
+        Returns:
+            bool: True if the task was published, False if the caller should
+            fall back to sending in-process.
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f'Tipo de lote desconhecido: {kind}')
+
+        try:
+            # The render worker declares the queue; producers only publish.
+            RabbitMQPublisher.for_app().publish(
+                routing_key=self.QUEUE_NAME,
+                body=json.dumps({
+                    'task': 'plan',
+                    'kind': kind,
+                    'entity_id': entity_id,
+                    'job_id': job_id,
+                }),
+                properties=self._properties(),
+            )
+            return True
+        except Exception:
+            current_app.logger.exception('Falha ao publicar lote %s %s na fila de renderização', kind, entity_id)
+            return False
@@ -0,0 +1,134 @@
+import os
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+from flask import Flask, current_app
+
+from app.services.certificate_service import CertificateService
+
+
+_PROCESS_SERVICE = None
+# One pool per process, reused across batches: spawning the interpreters costs
+# far more than rendering a chunk. Rebuilt when the size or config changes.
+_POOL = None
+_POOL_KEY = None
+_POOL_LOCK = Lock()
+
+
+def _init_render_process(root_path, config):
+    """Prepares a pool process: a bare app context is enough to draw certificates."""
+    global _PROCESS_SERVICE
+    process_app = Flask('app', root_path=root_path)
+    process_app.config.update(config)
+    process_app.app_context().push()
+    _PROCESS_SERVICE = CertificateService()
+
+
+def _render_in_process(descriptor):
+    try:
+        return _PROCESS_SERVICE.render_descriptor(descriptor), None
+    except Exception as exc:
+        return None, f'{exc.__class__.__name__}: {exc}'
+
+
+def _get_pool(processes, root_path, config):
+    global _POOL, _POOL_KEY
+    key = (os.getpid(), processes, root_path, repr(sorted(config.items())))
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL_KEY == key:
+            return _POOL
+        stale = _POOL if _POOL_KEY and _POOL_KEY[0] == os.getpid() else None
+        # Spawned (not forked) processes: the web worker holds DB connections and threads.
+        _POOL = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_render_process,
+            initargs=(root_path, config),
+        )
+        _POOL_KEY = key
+    if stale is not None:
+        stale.shutdown(wait=False)
+    return _POOL
+
+
+def _discard_pool(pool):
+    global _POOL, _POOL_KEY
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL, _POOL_KEY = None, None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_render_pool():
+    """Stops the shared render processes (registered to run at interpreter exit)."""
+    global _POOL, _POOL_KEY
+    with _POOL_LOCK:
+        pool, _POOL, _POOL_KEY = _POOL, None, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+atexit.register(shutdown_render_pool)
+
+
+class CertificateRenderService:
+    """Renders batches of certificate descriptors, using every core of the host.
+
+    The caller builds the descriptors (hashes, tags and any other database work)
+    and keeps publishing and delivery bookkeeping in its own process; only the
+    ReportLab drawing is fanned out to the process pool.
+    """
+
+    def __init__(self, certificate_service=None):
+        self.certificate_service = certificate_service or CertificateService()
+
+    @staticmethod
+    def _process_count():
+        configured = current_app.config.get('CERTIFICATE_RENDER_PROCESSES')
+        try:
+            configured = int(configured)
+        except (TypeError, ValueError):
+            configured = 0
+        if configured > 0:
+            return configured
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def _pool_config():
+        return {
+            key: value
+            for key, value in current_app.config.items()
+            if key.startswith(('CERTIFICATE_', 'BASE_'))
+        }
+
+    def _render_serial(self, descriptors):
+        for descriptor in descriptors:
+            try:
+                yield self.certificate_service.render_descriptor(descriptor), None
+            except Exception as exc:
+                current_app.logger.exception('Falha ao gerar certificado %s', descriptor.get('filename'))
+                yield None, f'{exc.__class__.__name__}: {exc}'
+
+    def render_many(self, descriptors):
+        """Yields ``(pdf_path, error)`` for each descriptor, in input order."""
+        descriptors = list(descriptors)
+        processes = min(self._process_count(), len(descriptors))
+        min_batch = int(current_app.config.get('CERTIFICATE_RENDER_POOL_MIN_BATCH', 20) or 1)
+        if processes <= 1 or len(descriptors) < min_batch:
+            yield from self._render_serial(descriptors)
+            return
+
+        rendered = 0
+        chunksize = max(1, len(descriptors) // (processes * 4))
+        executor = _get_pool(processes, current_app.root_path, self._pool_config())
+        try:
+            for result in executor.map(_render_in_process, descriptors, chunksize=chunksize):
+                rendered += 1
+                yield result
+        except BrokenProcessPool:
+            current_app.logger.exception('Pool de renderização interrompido; concluindo certificados em série.')
+            _discard_pool(executor)
+            yield from self._render_serial(descriptors[rendered:])
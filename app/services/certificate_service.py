@@ -3,17 +3,64 @@ import json
 import secrets
 import html
 import re
+import hashlib
+import tempfile
+from collections import OrderedDict
 from datetime import datetime
+from io import BytesIO
+from threading import Lock
+from types import SimpleNamespace
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import landscape, A4
 from app.repositories.event_repository import EventRepository
 from app.repositories.user_repository import UserRepository
 from app.repositories.activity_repository import ActivityRepository
+from app.repositories.enrollment_repository import EnrollmentRepository
 from app.services.notification_service import NotificationService
+from app.services.certificate_image_service import CertificateImageService
 from app.extensions import db
 from flask import current_app, has_app_context
 from app.utils import build_absolute_app_url, current_certificate_issue_date_label
 
+
+class CertificateRenderPlan:
+    """Template-level rendering state shared by every certificate of an entity.
+
+    Holds the normalized, zIndex-ordered visible elements, the resolved
+    background path and the precompiled text layouts, so the per-recipient
+    loop only substitutes tags and draws.
+    """
+
+    def __init__(self, key, elements, background_path):
+        self.key = key
+        self.elements = elements
+        self.background_path = background_path
+
+
+class CertificateDeliveryWriter:
+    """Buffers delivered certificates and persists them in chunks.
+
+    Each flush writes ``cert_entregue``/``cert_data_envio`` for up to
+    ``flush_size`` enrollments with one statement and one commit.
+    """
+
+    def __init__(self, enrollment_repo, flush_size=200):
+        self.enrollment_repo = enrollment_repo
+        self.flush_size = max(int(flush_size or 1), 1)
+        self._pending = []
+
+    def add(self, enrollment_id, sent_at=None):
+        self._pending.append((enrollment_id, sent_at or datetime.now()))
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self.enrollment_repo.mark_certificates_sent(pending)
+
+
 class CertificateService:
     """Service for managing, generating and distributing academic certificates."""
 
@@ -39,11 +86,26 @@ class CertificateService:
         'date_w': 78.0,
         'date_h': 8.0,
     }
-    
+    DEFAULT_RENDER_PLAN_CACHE_SIZE = 32
+    _render_plan_cache = OrderedDict()
+    _render_plan_lock = Lock()
+    STATIC_IMAGE_CACHE_SIZE = 64
+    # Bump whenever drawing changes, so cached PDFs from older code are re-rendered.
+    PDF_CACHE_VERSION = 2
+    PDF_CACHE_DIGEST_SUFFIX = '.digest'
+    # Tags holding today's date, left out of the PDF cache digest.
+    ISSUE_DATE_TAGS = ('{{DATA}}', '{{EMISSION_DATE}}')
+    QR_MATRIX_CACHE_SIZE = 256
+    _qr_matrix_cache = OrderedDict()
+    _qr_matrix_lock = Lock()
+    _static_image_cache = OrderedDict()
+    _static_image_lock = Lock()
+
     def __init__(self):
         self.event_repo = EventRepository()
         self.user_repo = UserRepository()
         self.activity_repo = ActivityRepository()
+        self.enrollment_repo = EnrollmentRepository()
         self.notifier = NotificationService()
 
     @classmethod
@@ -826,38 +888,95 @@ class CertificateService:
         tags['{{EMISSION_DATE}}'] = issue_date
         return tags
 
-    def _draw_qr_element(self, pdf_canvas, config, page_width, page_height, validation_url):
+    @staticmethod
+    def _qr_vector_enabled():
+        if not has_app_context():
+            return True
+        return bool(current_app.config.get('CERTIFICATE_QR_VECTOR', True))
+
+    @classmethod
+    def _qr_modules(cls, validation_url):
+        """Returns ``(module_count, fill_operators)`` for a URL, keeping recent ones in an LRU.
+
+        Dark modules are merged into one rectangle per horizontal run and
+        expressed in module units, so drawing needs a single transform.
+        """
         import qrcode
-        from io import BytesIO
+
+        with cls._qr_matrix_lock:
+            cached = cls._qr_matrix_cache.get(validation_url)
+            if cached is not None:
+                cls._qr_matrix_cache.move_to_end(validation_url)
+                return cached
 
         qr = qrcode.QRCode(box_size=10, border=0)
         qr.add_data(validation_url)
         qr.make(fit=True)
-        img_qr = qr.make_image(fill_color="black", back_color="white")
-        qr_buffer = BytesIO()
-        img_qr.save(qr_buffer, format="PNG")
-        qr_buffer.seek(0)
+        matrix = qr.get_matrix()
+
+        operators = []
+        for row_idx, row in enumerate(matrix):
+            col_idx = 0
+            module_count = len(row)
+            while col_idx < module_count:
+                if not row[col_idx]:
+                    col_idx += 1
+                    continue
+                run_start = col_idx
+                while col_idx < module_count and row[col_idx]:
+                    col_idx += 1
+                operators.append(f'{run_start} {row_idx} {col_idx - run_start} 1 re')
+        operators.append('f')
+        cached = (len(matrix), ' '.join(operators))
+
+        with cls._qr_matrix_lock:
+            cls._qr_matrix_cache[validation_url] = cached
+            while len(cls._qr_matrix_cache) > cls.QR_MATRIX_CACHE_SIZE:
+                cls._qr_matrix_cache.popitem(last=False)
+        return cached
 
+    def _draw_qr_element(self, pdf_canvas, config, page_width, page_height, validation_url):
         abs_w = (config.get('w', 12) / 100) * page_width
         abs_h = (config.get('h', 12) / 100) * page_height
         abs_x_center = (config.get('x', 50) / 100) * page_width
         abs_y_center = (1 - (config.get('y', 50) / 100)) * page_height
         frame_x = abs_x_center - (abs_w / 2)
         frame_y = abs_y_center - (abs_h / 2)
-        pdf_canvas.drawInlineImage(img_qr, frame_x, frame_y, width=abs_w, height=abs_h)
+
+        if not self._qr_vector_enabled():
+            import qrcode
+
+            qr = qrcode.QRCode(box_size=10, border=0)
+            qr.add_data(validation_url)
+            qr.make(fit=True)
+            img_qr = qr.make_image(fill_color="black", back_color="white")
+            pdf_canvas.drawInlineImage(img_qr, frame_x, frame_y, width=abs_w, height=abs_h)
+            return
+
+        module_count, fill_operators = self._qr_modules(validation_url)
+        pdf_canvas.saveState()
+        pdf_canvas.setFillColorRGB(1, 1, 1)
+        pdf_canvas.rect(frame_x, frame_y, abs_w, abs_h, stroke=0, fill=1)
+        pdf_canvas.setFillColorRGB(0, 0, 0)
+        # Module space: origin at the top-left corner, one unit per module, rows growing downwards.
+        pdf_canvas.transform(abs_w / module_count, 0, 0, -abs_h / module_count, frame_x, frame_y + abs_h)
+        pdf_canvas.addLiteral(fill_operators)
+        pdf_canvas.restoreState()
+
+    @staticmethod
+    def _resolve_static_image_path(src):
+        if src.startswith('/static/'):
+            return os.path.join(current_app.root_path, 'static', src.replace('/static/', '', 1))
+        if src.startswith('static/'):
+            return os.path.join(current_app.root_path, src)
+        return os.path.join(current_app.root_path, 'static', src)
 
     def _draw_image_element(self, pdf_canvas, config, page_width, page_height):
         src = config.get('src')
         if not src:
             return
 
-        if src.startswith('/static/'):
-            image_path = os.path.join(current_app.root_path, 'static', src.replace('/static/', '', 1))
-        elif src.startswith('static/'):
-            image_path = os.path.join(current_app.root_path, src)
-        else:
-            image_path = os.path.join(current_app.root_path, 'static', src)
-
+        image_path = config.get('_image_path') or self._resolve_static_image_path(src)
         if not os.path.exists(image_path):
             return
 
@@ -867,21 +986,23 @@ class CertificateService:
         abs_y_center = (1 - (config.get('y', 50) / 100)) * page_height
         frame_x = abs_x_center - (abs_w / 2)
         frame_y = abs_y_center - (abs_h / 2)
-        pdf_canvas.drawImage(image_path, frame_x, frame_y, width=abs_w, height=abs_h, mask='auto')
+        pdf_canvas.drawImage(
+            self._image_source(image_path), frame_x, frame_y, width=abs_w, height=abs_h, mask='auto'
+        )
 
-    def _draw_text_element(self, pdf_canvas, config, page_width, page_height, tags):
+    def _compile_text_element(self, config, page_width, page_height):
+        """Precomputes the recipient-independent layout of a text element.
+
+        The returned markup still carries the ``{{TAG}}`` placeholders; only the
+        substitution is left for each certificate.
+        """
         from reportlab.lib.styles import ParagraphStyle
-        from reportlab.platypus import Paragraph, Frame, KeepInFrame
         from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT, TA_JUSTIFY
 
         raw_text = config.get('text', '')
         html_content = config.get('html_content') if config.get('is_html') else None
         if not raw_text and not html_content:
-            return
-
-        final_text = raw_text
-        for tag, val in tags.items():
-            final_text = final_text.replace(tag, val)
+            return None
 
         family = config.get('font_family', 'Helvetica')
         is_bold = config.get('bold', False)
@@ -892,8 +1013,6 @@ class CertificateService:
         abs_h = (config.get('h', 10) / 100) * page_height
         abs_x_center = (config.get('x', 50) / 100) * page_width
         abs_y_center = (1 - (config.get('y', 50) / 100)) * page_height
-        frame_x = abs_x_center - (abs_w / 2)
-        frame_y = abs_y_center - (abs_h / 2)
 
         align_map = {'center': TA_CENTER, 'left': TA_LEFT, 'right': TA_RIGHT, 'justify': TA_JUSTIFY}
         font_size = (config.get('font', 20) / 1000) * page_width
@@ -907,27 +1026,257 @@ class CertificateService:
             leading=font_size * 1.2
         )
 
+        # Rich and HTML markup receive escaped tag values; plain text keeps raw values.
+        escape_values = True
         if html_content:
-            substituted_html = html_content
-            for tag_key, tag_value in tags.items():
-                substituted_html = substituted_html.replace(tag_key, html.escape(str(tag_value)))
-            paragraph_content = self._convert_jodit_html(substituted_html)
+            markup = self._convert_jodit_html(html_content)
         else:
             text_styles = config.get('text_styles', {})
             if isinstance(text_styles, dict) and text_styles:
-                paragraph_content = self._build_rich_text_markup(raw_text, text_styles, config, tags)
+                markup = self._build_rich_text_markup(raw_text, text_styles, config, {})
             else:
-                paragraph_content = final_text
+                markup = raw_text
+                escape_values = False
+
+        return {
+            'markup': markup,
+            'escape_values': escape_values,
+            'static': '{{' not in markup,
+            'lock': Lock(),
+            'style': style,
+            'frame_x': abs_x_center - (abs_w / 2),
+            'frame_y': abs_y_center - (abs_h / 2),
+            'width': abs_w,
+            'height': abs_h,
+        }
+
+    def _draw_text_element(self, pdf_canvas, config, page_width, page_height, tags):
+        from reportlab.platypus import Paragraph, Frame, KeepInFrame
+
+        compiled = config.get('_compiled') or self._compile_text_element(config, page_width, page_height)
+        if not compiled:
+            return
+
+        if compiled['static'] and self._static_layer_enabled():
+            self._draw_static_text(pdf_canvas, compiled)
+            return
 
-        paragraph = Paragraph(paragraph_content, style)
+        paragraph_content = compiled['markup']
+        for tag, val in tags.items():
+            if tag in paragraph_content:
+                value = html.escape(str(val)) if compiled['escape_values'] else val
+                paragraph_content = paragraph_content.replace(tag, value)
+
+        abs_w = compiled['width']
+        abs_h = compiled['height']
+        paragraph = Paragraph(paragraph_content, compiled['style'])
         story = [KeepInFrame(abs_w, abs_h, [paragraph], mode='shrink')]
-        frame = Frame(frame_x, frame_y, abs_w, abs_h, showBoundary=0, leftPadding=0, bottomPadding=0, rightPadding=0, topPadding=0)
+        frame = Frame(
+            compiled['frame_x'],
+            compiled['frame_y'],
+            abs_w,
+            abs_h,
+            showBoundary=0,
+            leftPadding=0,
+            bottomPadding=0,
+            rightPadding=0,
+            topPadding=0,
+        )
         frame.addFromList(story, pdf_canvas)
 
-    def generate_pdf(self, event, user, activities, total_hours, enrollment=None, template_override=None, tag_overrides=None):
-        """Generates a single certificate PDF for a user using professional layout blocks."""
-        import hashlib
+    @staticmethod
+    def _draw_static_text(pdf_canvas, compiled):
+        """Draws a placeholder-free text block, laying it out only the first time."""
+        from reportlab.platypus import Paragraph, KeepInFrame
+
+        abs_w = compiled['width']
+        abs_h = compiled['height']
+        # Flowables keep per-draw state, so concurrent renders take turns.
+        with compiled['lock']:
+            layout = compiled.get('layout')
+            if layout is None:
+                paragraph = Paragraph(compiled['markup'], compiled['style'])
+                flowable = KeepInFrame(abs_w, abs_h, [paragraph], mode='shrink')
+                width, height = flowable.wrapOn(pdf_canvas, abs_w, abs_h)
+                layout = compiled['layout'] = (flowable, width, height)
+
+            flowable, width, height = layout
+            # Same placement Frame.addFromList uses for a top-aligned, unpadded frame
+            # (KeepInFrame is left-aligned, so no horizontal offset is needed).
+            flowable.drawOn(pdf_canvas, compiled['frame_x'], compiled['frame_y'] + abs_h - height)
+
+    @staticmethod
+    def _static_layer_enabled():
+        if not has_app_context():
+            return True
+        return bool(current_app.config.get('CERTIFICATE_STATIC_LAYER_ENABLED', True))
+
+    @staticmethod
+    def _static_image_cache_dir():
+        path = current_app.config.get('CERTIFICATE_IMAGE_CACHE_DIR') or os.path.join(
+            tempfile.gettempdir(), 'unieventos_certificate_images'
+        )
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @classmethod
+    def _image_source(cls, image_path, stretch=False):
+        """Returns the file ``drawImage`` embeds for ``image_path``.
+
+        With the static layer enabled, each image version is converted once into
+        its print-sized variant (see ``CertificateImageService``), written to
+        ``CERTIFICATE_IMAGE_CACHE_DIR`` and shared by every render process.
+        Opaque images become JPEGs, which ReportLab copies into the PDF as they
+        are instead of decoding and deflating the pixels for every certificate.
+        Only paths are kept in memory, never decoded pixels.
+        """
+        if not cls._static_layer_enabled() or not has_app_context():
+            return image_path
+
+        stat = os.stat(image_path)
+        key = (image_path, stat.st_mtime_ns, stat.st_size, stretch)
+        with cls._static_image_lock:
+            source = cls._static_image_cache.get(key)
+            if source is not None:
+                cls._static_image_cache.move_to_end(key)
+        if source is not None and os.path.exists(source):
+            return source
+
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:32]
+        variant_stem = os.path.join(cls._static_image_cache_dir(), digest)
+        written = [variant_stem + ext for ext in ('.jpg', '.png') if os.path.exists(variant_stem + ext)]
+        if written:
+            source = written[0]
+        else:
+            source = CertificateImageService().write_variant(image_path, variant_stem, stretch=stretch)
+        with cls._static_image_lock:
+            cls._static_image_cache[key] = source
+            while len(cls._static_image_cache) > cls.STATIC_IMAGE_CACHE_SIZE:
+                cls._static_image_cache.popitem(last=False)
+        return source
+
+    @classmethod
+    def _render_plan_cache_size(cls):
+        raw = cls.DEFAULT_RENDER_PLAN_CACHE_SIZE
+        if has_app_context():
+            raw = current_app.config.get('CERTIFICATE_RENDER_PLAN_CACHE_SIZE', raw)
+        try:
+            return max(int(raw), 0)
+        except (TypeError, ValueError):
+            return cls.DEFAULT_RENDER_PLAN_CACHE_SIZE
+
+    @classmethod
+    def clear_render_plan_cache(cls):
+        with cls._render_plan_lock:
+            cls._render_plan_cache.clear()
+
+    def _render_plan_key(self, event):
+        """Identifies a template version: any edit to the layout yields a new key."""
+        designer_mode = self._designer_mode_for_entity(event)
+        fingerprint = json.dumps({
+            'template': self._template_json_for_entity(event, designer_mode=designer_mode) or '',
+            'bg': self._background_for_entity(event, designer_mode=designer_mode) or '',
+            'fixed': self.get_fixed_validation_elements(designer_mode=designer_mode),
+        }, sort_keys=True, default=str)
+        digest = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+        return (designer_mode, str(getattr(event, 'id', '')), current_app.root_path, digest)
+
+    def _build_render_plan(self, event, key=None, template_override=None):
+        elements, background_path = self._parse_template_elements(event, template_override=template_override)
+        page_width, page_height = landscape(A4)
+
+        ordered_elements = sorted(
+            [e for e in elements if e.get('visible', True)],
+            key=lambda item: item.get('zIndex', 0)
+        )
+        for config in ordered_elements:
+            element_type = config.get('type', 'text')
+            if element_type == 'qr' or config.get('id', '') == 'qrcode':
+                continue
+            if element_type == 'image' and config.get('src'):
+                config['_image_path'] = self._resolve_static_image_path(config['src'])
+                continue
+            config['_compiled'] = self._compile_text_element(config, page_width, page_height)
+
+        resolved_background = (
+            os.path.join(current_app.root_path, 'static', background_path)
+            if background_path else None
+        )
+        return CertificateRenderPlan(key, ordered_elements, resolved_background)
+
+    def _get_render_plan(self, event, template_override=None):
+        """Returns the compiled plan for an entity, reusing it while its template is unchanged."""
+        if template_override is not None:
+            return self._build_render_plan(event, template_override=template_override)
+
+        cache_size = self._render_plan_cache_size()
+        key = self._render_plan_key(event)
+        if cache_size:
+            with self._render_plan_lock:
+                plan = self._render_plan_cache.get(key)
+                if plan is not None:
+                    self._render_plan_cache.move_to_end(key)
+                    return plan
+
+        plan = self._build_render_plan(event, key=key)
+        if cache_size:
+            with self._render_plan_lock:
+                self._render_plan_cache[key] = plan
+                self._render_plan_cache.move_to_end(key)
+                while len(self._render_plan_cache) > cache_size:
+                    self._render_plan_cache.popitem(last=False)
+        return plan
+
+    @staticmethod
+    def build_enrollment_hash(event, user):
+        return CertificateService.build_enrollment_hash_for_cpf(event.id, user.cpf)
+
+    @staticmethod
+    def build_enrollment_hash_for_cpf(event_id, cpf):
+        raw = f"{event_id}-{cpf}-{secrets.token_hex(8)}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:16].upper()
+
+    def assign_missing_enrollment_hashes(self, event_id):
+        """Gives every present enrollment of the event a validation hash in one statement."""
+        return self.enrollment_repo.assign_missing_cert_hashes(
+            event_id,
+            lambda cpf: self.build_enrollment_hash_for_cpf(event_id, cpf),
+        )
+
+    def ensure_enrollment_hash(self, event, user, enrollment):
+        """Assigns and persists the validation hash of a single enrollment if missing."""
+        if not enrollment.cert_hash:
+            enrollment.cert_hash = self.build_enrollment_hash(event, user)
+            db.session.commit()
+        return enrollment.cert_hash
+
+    @staticmethod
+    def _delivery_flush_size():
+        try:
+            return max(int(current_app.config.get('CERTIFICATE_DELIVERY_FLUSH_SIZE', 200)), 1)
+        except (TypeError, ValueError):
+            return 200
+
+    def _entity_snapshot(self, event):
+        """Copies the template-related attributes of an entity into a plain dict."""
+        return {
+            'id': event.id,
+            'designer_mode': self._designer_mode_for_entity(event),
+            'is_institutional_certificate': bool(getattr(event, 'is_institutional_certificate', False)),
+            'cert_bg_path': getattr(event, 'cert_bg_path', None),
+            'cert_template_json': getattr(event, 'cert_template_json', None),
+            'cert_team_bg_path': getattr(event, 'cert_team_bg_path', None),
+            'cert_team_template_json': getattr(event, 'cert_team_template_json', None),
+        }
+
+    def build_render_descriptor(
+        self, event, user, activities, total_hours, enrollment=None, template_override=None, tag_overrides=None
+    ):
+        """Resolves everything a certificate needs into a picklable descriptor.
 
+        Database access (tags, validation hash) happens here, so the descriptor
+        can be rendered by ``render_descriptor`` in another process.
+        """
         tags = self._build_template_tags(
             event,
             user,
@@ -938,41 +1287,81 @@ class CertificateService:
         )
         override_hash = str(tags.get('{{HASH}}') or '').strip()
         
-        # 0. Handle Validation Hash
-        if enrollment and not override_hash and not enrollment.cert_hash:
-            raw = f"{event.id}-{user.cpf}-{secrets.token_hex(8)}"
-            enrollment.cert_hash = hashlib.sha256(raw.encode()).hexdigest()[:16].upper()
-            from app.extensions import db
-            db.session.commit()
-        
+        # 0. Handle Validation Hash (batches pre-assign them, see assign_missing_enrollment_hashes)
+        if enrollment and not override_hash:
+            self.ensure_enrollment_hash(event, user, enrollment)
+
         cert_hash = override_hash or (enrollment.cert_hash if enrollment else "VALID-SAMPLE-HASH")
         tags['{{HASH}}'] = cert_hash
-        validation_url = build_absolute_app_url(f"/validar/{cert_hash}")
-
-        output_dir = os.path.join(current_app.root_path, 'static', 'certificates', 'generated')
-        os.makedirs(output_dir, exist_ok=True)
         safe_identifier = str(getattr(user, 'cpf', '') or f"USER-{getattr(user, 'id', 'NA')}")
-        filename = f"cert_{event.id}_{safe_identifier}.pdf"
-        filepath = os.path.join(output_dir, filename)
-        temp_filepath = os.path.join(output_dir, f".tmp_{secrets.token_hex(8)}_{filename}")
-        
+        # One file per enrollment: a participant of several activities gets one certificate each.
+        enrollment_id = getattr(enrollment, 'id', None)
+        if enrollment_id:
+            safe_identifier = f"{safe_identifier}_{enrollment_id}"
+
+        return {
+            'entity': self._entity_snapshot(event),
+            'template_override': template_override,
+            'tags': tags,
+            'validation_url': build_absolute_app_url(f"/validar/{cert_hash}"),
+            'filename': f"cert_{event.id}_{safe_identifier}.pdf",
+        }
+
+    @staticmethod
+    def _pdf_cache_enabled():
+        if not has_app_context():
+            return False
+        return bool(current_app.config.get('CERTIFICATE_PDF_CACHE_ENABLED', True))
+
+    def _pdf_cache_digest(self, descriptor, plan):
+        """Digest of every input that shapes a certificate PDF.
+
+        The issue date (``ISSUE_DATE_TAGS``, always today) is left out, otherwise every
+        cached PDF would expire at midnight: a re-sent certificate keeps the
+        date it was first issued until something else about it changes.
+        """
+        image_paths = [plan.background_path] + [
+            config['_image_path'] for config in plan.elements if config.get('_image_path')
+        ]
+        file_stamps = []
+        for image_path in image_paths:
+            if not image_path:
+                continue
+            try:
+                stat = os.stat(image_path)
+                file_stamps.append([image_path, stat.st_mtime_ns, stat.st_size])
+            except OSError:
+                file_stamps.append([image_path, None, None])
+
+        payload = json.dumps({
+            'version': self.PDF_CACHE_VERSION,
+            'qr_vector': self._qr_vector_enabled(),
+            'plan': list(plan.key),
+            'files': file_stamps,
+            'tags': {tag: value for tag, value in descriptor['tags'].items() if tag not in self.ISSUE_DATE_TAGS},
+            'validation_url': descriptor['validation_url'],
+            'filename': descriptor['filename'],
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _cached_pdf_is_current(self, filepath, cache_digest):
+        try:
+            with open(filepath + self.PDF_CACHE_DIGEST_SUFFIX, 'r', encoding='utf-8') as digest_file:
+                stored_digest = digest_file.read().strip()
+        except OSError:
+            return False
+        return stored_digest == cache_digest and os.path.exists(filepath)
+
+    def _draw_certificate(self, c, plan, tags, validation_url):
         page_width, page_height = landscape(A4)
 
-        c = canvas.Canvas(temp_filepath, pagesize=(page_width, page_height))
-        
         # 1. Draw Background
-        elements, background_path = self._parse_template_elements(event, template_override=template_override)
-        if background_path and os.path.exists(os.path.join(current_app.root_path, 'static', background_path)):
-            c.drawImage(os.path.join(current_app.root_path, 'static', background_path), 0, 0, width=page_width, height=page_height)
+        if plan.background_path and os.path.exists(plan.background_path):
+            background = self._image_source(plan.background_path, stretch=True)
+            c.drawImage(background, 0, 0, width=page_width, height=page_height)
         
         # 2. Draw Elements
-
-        ordered_elements = sorted(
-            [e for e in elements if e.get('visible', True)],
-            key=lambda item: item.get('zIndex', 0)
-        )
-
-        for config in ordered_elements:
+        for config in plan.elements:
             element_type = config.get('type', 'text')
             element_id = config.get('id', '')
 
@@ -985,8 +1374,53 @@ class CertificateService:
                 continue
 
             self._draw_text_element(c, config, page_width, page_height, tags)
-        
+
         c.showPage()
+
+    def render_descriptor(self, descriptor, as_buffer=False):
+        """Draws a descriptor built by ``build_render_descriptor`` and returns the PDF path.
+
+        Unless the layout is an unsaved override, an existing PDF rendered from
+        the same inputs is returned as is. With ``as_buffer`` the PDF is drawn
+        into a ``BytesIO`` that is returned instead, and nothing touches the disk.
+        """
+        event = SimpleNamespace(**descriptor['entity'])
+        tags = descriptor['tags']
+        validation_url = descriptor['validation_url']
+
+        if as_buffer:
+            plan = self._get_render_plan(event, template_override=descriptor.get('template_override'))
+            buffer = BytesIO()
+            pdf_canvas = canvas.Canvas(buffer, pagesize=landscape(A4))
+            self._draw_certificate(pdf_canvas, plan, tags, validation_url)
+            pdf_canvas.save()
+            buffer.seek(0)
+            return buffer
+
+        output_dir = os.path.join(current_app.root_path, 'static', 'certificates', 'generated')
+        os.makedirs(output_dir, exist_ok=True)
+        filename = descriptor['filename']
+        filepath = os.path.join(output_dir, filename)
+        digest_filepath = filepath + self.PDF_CACHE_DIGEST_SUFFIX
+
+        plan = self._get_render_plan(event, template_override=descriptor.get('template_override'))
+        cache_digest = None
+        if plan.key is not None and self._pdf_cache_enabled():
+            cache_digest = self._pdf_cache_digest(descriptor, plan)
+            if self._cached_pdf_is_current(filepath, cache_digest):
+                try:
+                    # Keeps certificates still being downloaded out of the age-based cleanup.
+                    os.utime(filepath, None)
+                except OSError:
+                    pass
+                return filepath
+
+        temp_filepath = os.path.join(output_dir, f".tmp_{secrets.token_hex(8)}_{filename}")
+        
+        page_width, page_height = landscape(A4)
+
+        c = canvas.Canvas(temp_filepath, pagesize=(page_width, page_height))
+        self._draw_certificate(c, plan, tags, validation_url)
         try:
             c.save()
         except FileNotFoundError:
@@ -994,68 +1428,170 @@ class CertificateService:
             os.makedirs(os.path.dirname(temp_filepath), exist_ok=True)
             c.save()
         try:
+            # Drop the old digest first so a half-replaced pair never looks current.
+            if os.path.exists(digest_filepath):
+                os.remove(digest_filepath)
             # Replace atomically so an older read-only file does not block regeneration.
             os.replace(temp_filepath, filepath)
         finally:
             if os.path.exists(temp_filepath):
                 os.remove(temp_filepath)
+
+        if cache_digest:
+            temp_digest_filepath = os.path.join(
+                output_dir, f".tmp_{secrets.token_hex(8)}_{filename}{self.PDF_CACHE_DIGEST_SUFFIX}"
+            )
+            with open(temp_digest_filepath, 'w', encoding='utf-8') as digest_file:
+                digest_file.write(cache_digest)
+            os.replace(temp_digest_filepath, digest_filepath)
         return filepath
 
-    def queue_event_certificates(self, event_id):
-        """Queues certificate delivery for all present participants of an event."""
+    def generate_pdf(
+        self, event, user, activities, total_hours, enrollment=None, template_override=None, tag_overrides=None,
+        as_buffer=False,
+    ):
+        """Generates a single certificate PDF for a user using professional layout blocks.
+
+        Returns the file path, or an in-memory ``BytesIO`` when ``as_buffer`` is set.
+        """
+        descriptor = self.build_render_descriptor(
+            event,
+            user,
+            activities,
+            total_hours,
+            enrollment=enrollment,
+            template_override=template_override,
+            tag_overrides=tag_overrides,
+        )
+        return self.render_descriptor(descriptor, as_buffer=as_buffer)
+
+    def _iter_present_enrollments(self, event, enrollment_ids=None):
+        if enrollment_ids is None:
+            for atv in event.activities:
+                for enroll in atv.enrollments:
+                    if enroll.presente:
+                        yield atv, enroll
+            return
+
+        for enroll in self.enrollment_repo.get_present_by_ids(enrollment_ids):
+            yield enroll.activity, enroll
+
+    def prepare_event_certificate_batch(self, event_id):
+        """Assigns missing hashes and returns the present enrollment IDs of a queued batch."""
         event = self.event_repo.get_by_id(event_id)
         if not event:
-            return False, "Evento não encontrado", {
-                'total_enviado': 0,
-                'sem_email': 0,
-                'falha_fila': 0,
-            }
+            return []
+        self.assign_missing_enrollment_hashes(event.id)
+        return self.enrollment_repo.get_present_ids_by_event(event.id)
+
+    def deliver_event_certificates(self, event, enrollment_ids=None, send_id=None):
+        """Renders and queues the certificates of present enrollments (all of them, or only ``enrollment_ids``).
+
+        Expects the validation hashes to be assigned already. ``send_id`` (the
+        batch job) scopes the e-mails' idempotency keys.
+        """
+        from app.services.certificate_render_service import CertificateRenderService
+
         count = 0
         skipped_without_email = 0
         failed_queue = 0
-        for atv in event.activities:
-            for enroll in atv.enrollments:
-                if not enroll.presente:
-                    continue
+        recipients = []
+        descriptors = []
+        for atv, enroll in self._iter_present_enrollments(event, enrollment_ids):
+            user = self.user_repo.get_by_cpf(enroll.user_cpf)
+            if not user or not user.email:
+                skipped_without_email += 1
+                continue
 
-                user = self.user_repo.get_by_cpf(enroll.user_cpf)
-                if not user or not user.email:
-                    skipped_without_email += 1
-                    continue
+            # Standard events issue one certificate per activity/enrollment.
+            # Fast events still have a single default activity and behave naturally.
+            descriptors.append(
+                self.build_render_descriptor(event, user, [atv], atv.carga_horaria or 0, enrollment=enroll)
+            )
+            # Plain values: delivery flushes commit (and expire) the session mid-loop.
+            recipients.append({
+                'enrollment_id': enroll.id,
+                'cert_hash': enroll.cert_hash,
+                'email': user.email,
+                'user_name': user.nome,
+                'hours': atv.carga_horaria or 0,
+                'activity_name': atv.nome,
+            })
+
+        event_name = event.nome
+        event_date = event.data_inicio.strftime('%d/%m/%Y') if event.data_inicio else ''
+        show_activity = getattr(event, 'tipo', None) == 'PADRAO'
+        delivery_writer = CertificateDeliveryWriter(self.enrollment_repo, self._delivery_flush_size())
+        rendered = CertificateRenderService(self).render_many(descriptors)
+        queued = []
+        email_tasks = []
+        for recipient, (pdf_path, render_error) in zip(recipients, rendered):
+            if render_error:
+                failed_queue += 1
+                continue
+
+            cert_hash = recipient['cert_hash']
+            validation_url = build_absolute_app_url(f"/validar/{cert_hash}") if cert_hash else ''
+            download_url = build_absolute_app_url(f"/api/certificates/download_public/{cert_hash}") if cert_hash else ''
+            activity_suffix = f" - {recipient['activity_name']}" if show_activity else ''
+
+            queued.append(recipient['enrollment_id'])
+            email_tasks.append({
+                'to_email': recipient['email'],
+                'subject': f"Seu Certificado: {event_name}{activity_suffix}",
+                'template_name': 'certificate_ready.html',
+                'template_data': {
+                    'user_name': recipient['user_name'],
+                    'event_name': event_name,
+                    'event_date': event_date,
+                    'course_hours': recipient['hours'],
+                    'certificate_number': cert_hash,
+                    'certificate_download_url': download_url,
+                    'view_certificate_url': (
+                        build_absolute_app_url(f"/api/certificates/preview_public/{cert_hash}") if cert_hash else ''
+                    ),
+                    'my_certificates_url': validation_url,
+                },
+                'attachment_path': pdf_path,
+                'idempotency_key': self.notifier.build_idempotency_key(
+                    'certificate', cert_hash, recipient['email'], send_id
+                ),
+            })
 
-                # Standard events issue one certificate per activity/enrollment.
-                # Fast events still have a single default activity and behave naturally.
-                cert_hours = atv.carga_horaria or 0
-                pdf_path = self.generate_pdf(event, user, [atv], cert_hours, enrollment=enroll)
-                cert_hash = enroll.cert_hash
-                validation_url = build_absolute_app_url(f"/validar/{cert_hash}") if cert_hash else ''
-                download_url = build_absolute_app_url(f"/api/certificates/download_public/{cert_hash}") if cert_hash else ''
-                event_date = event.data_inicio.strftime('%d/%m/%Y') if event and event.data_inicio else ''
-                activity_suffix = f" - {atv.nome}" if getattr(event, 'tipo', None) == 'PADRAO' else ''
-
-                if not self.notifier.send_email_task(
-                    to_email=user.email,
-                    subject=f"Seu Certificado: {event.nome}{activity_suffix}",
-                    template_name='certificate_ready.html',
-                    template_data={
-                        'user_name': user.nome,
-                        'event_name': event.nome,
-                        'event_date': event_date,
-                        'course_hours': cert_hours,
-                        'certificate_number': cert_hash,
-                        'certificate_download_url': download_url,
-                        'view_certificate_url': build_absolute_app_url(f"/api/certificates/preview_public/{cert_hash}") if cert_hash else '',
-                        'my_certificates_url': validation_url,
-                    },
-                    attachment_path=pdf_path
-                ):
+        # Only deliveries the broker confirmed are marked as sent.
+        try:
+            for enrollment_id, confirmed in zip(queued, self.notifier.send_email_tasks(email_tasks)):
+                if not confirmed:
                     failed_queue += 1
                     continue
-
-                enroll.cert_data_envio = datetime.now()
-                enroll.cert_entregue = True
-                db.session.commit()
+                delivery_writer.add(enrollment_id)
                 count += 1
+        finally:
+            delivery_writer.flush()
+
+        return {
+            'total_enviado': count,
+            'sem_email': skipped_without_email,
+            'falha_fila': failed_queue,
+        }
+
+    def queue_event_certificates(self, event_id, send_id=None):
+        """Queues certificate delivery for all present participants of an event."""
+        event = self.event_repo.get_by_id(event_id)
+        if not event:
+            return False, "Evento não encontrado", {
+                'total_enviado': 0,
+                'sem_email': 0,
+                'falha_fila': 0,
+            }
+
+        # Batch preparation: every missing validation hash is written at once, so
+        # neither descriptor building nor rendering has to touch the session.
+        self.assign_missing_enrollment_hashes(event.id)
+        summary = self.deliver_event_certificates(event, send_id=send_id)
+        count = summary['total_enviado']
+        skipped_without_email = summary['sem_email']
+        failed_queue = summary['falha_fila']
 
         if count == 0 and failed_queue > 0:
             return False, "Problema no envio: falha ao enfileirar e-mails.", {
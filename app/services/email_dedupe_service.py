@@ -0,0 +1,138 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+
+
+class LocalDedupeStore:
+    """In-process idempotency keys with TTL-based eviction.
+
+    Deduplicates redeliveries handled by one worker process; use the Redis
+    store to share keys between workers. Each state has a fixed TTL, so its
+    keys expire in insertion order and are evicted from the front.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = Lock()
+        self._pending = OrderedDict()
+        self._sent = OrderedDict()
+
+    @staticmethod
+    def _evict(keys, now):
+        while keys:
+            key, expires_at = next(iter(keys.items()))
+            if expires_at > now:
+                return
+            del keys[key]
+
+    def begin(self, key, pending_ttl):
+        """Claims ``key``; returns None when claimed, or the state of the existing claim."""
+        with self._lock:
+            now = self._clock()
+            self._evict(self._pending, now)
+            self._evict(self._sent, now)
+            if key in self._sent:
+                return SENT
+            if key in self._pending:
+                return PENDING
+            self._pending[key] = now + pending_ttl
+            return None
+
+    def complete(self, key, ttl):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._sent.pop(key, None)
+            self._sent[key] = self._clock() + ttl
+
+    def abort(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+
+class RedisDedupeStore:
+    """Idempotency keys kept in Redis (``SET NX EX``), shared by every worker.
+
+    Requires the ``redis`` package.
+    """
+
+    def __init__(self, url, prefix='email_dedupe:'):
+        import redis
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def begin(self, key, pending_ttl):
+        name = f'{self.prefix}{key}'
+        if self._client.set(name, PENDING, nx=True, ex=pending_ttl):
+            return None
+        # The key may expire between SET and GET: report it as in flight and retry later.
+        return self._client.get(name) or PENDING
+
+    def complete(self, key, ttl):
+        self._client.set(f'{self.prefix}{key}', SENT, ex=ttl)
+
+    def abort(self, key):
+        self._client.delete(f'{self.prefix}{key}')
+
+
+class EmailDeduplicator:
+    """Skips e-mails whose idempotency key was already sent within ``ttl`` seconds.
+
+    A key is claimed as pending before the SMTP send and marked sent after
+    it; a failed send releases it. A pending claim older than
+    ``pending_ttl`` (a worker that crashed mid-send) expires so the message
+    can be retried. ``ttl`` 0 disables deduplication. If the store is
+    unreachable the e-mail is sent anyway: a rare duplicate beats lost mail.
+    """
+
+    def __init__(self, store, ttl=86400, pending_ttl=300):
+        self.store = store
+        self.ttl = ttl
+        self.pending_ttl = max(pending_ttl, 1)
+
+    @classmethod
+    def from_env(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        redis_url = (environ.get('EMAIL_DEDUPE_REDIS_URL') or '').strip()
+        store = RedisDedupeStore(redis_url) if redis_url else LocalDedupeStore()
+        return cls(
+            store,
+            ttl=int(environ.get('EMAIL_DEDUPE_TTL_SECONDS', 86400) or 0),
+            pending_ttl=int(environ.get('EMAIL_DEDUPE_PENDING_SECONDS', 300) or 300),
+        )
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def begin(self, key):
+        """Returns None if the caller may send, else ``'sent'`` or ``'pending'``."""
+        if not key or not self.enabled:
+            return None
+        try:
+            return self.store.begin(key, self.pending_ttl)
+        except Exception as e:
+            logger.warning(f"Dedupe store unavailable, sending without idempotency check ({key}): {e}")
+            return None
+
+    def complete(self, key):
+        if key and self.enabled:
+            try:
+                self.store.complete(key, self.ttl)
+            except Exception as e:
+                logger.warning(f"Failed to record idempotency key {key}: {e}")
+
+    def abort(self, key):
+        if key and self.enabled:
+            try:
+                self.store.abort(key)
+            except Exception as e:
+                # The pending claim still expires after pending_ttl.
+                logger.warning(f"Failed to release idempotency key {key}: {e}")
@@ -0,0 +1,177 @@
+import json
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets: SMTP and render
+# times sit at the low end, queue dwell through retry backlogs at the high end.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class EmailMetrics:
+    """Process-local counters and latency histograms of the e-mail pipeline.
+
+    Each series is a metric name plus labels (``lane``, ``template``, ...).
+    The web process records publishes; each worker records dwell, render and
+    SMTP times, retries and DLQ routes, and serves them with
+    ``start_metrics_server``.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.started_at = time.time()
+        self._lock = Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        seconds = max(float(seconds), 0.0)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # One slot per bucket plus the +Inf overflow.
+                histogram = self._histograms[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            histogram['counts'][bisect_left(self.buckets, seconds)] += 1
+            histogram['sum'] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the duration of the ``with`` block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+        self.started_at = time.time()
+
+    def _quantile(self, counts, total, quantile):
+        """Upper bound of the bucket holding ``quantile``; None when it falls in +Inf."""
+        rank = quantile * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else None
+        return None
+
+    def snapshot(self):
+        """Returns every series as plain data, for the JSON endpoints."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value['counts']), value['sum']) for key, value in self._histograms.items())
+
+        result = {
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in counters
+            ],
+            'histograms': [],
+        }
+        for (name, labels), counts, total_seconds in histograms:
+            total = sum(counts)
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets['+Inf'] = total
+            result['histograms'].append({
+                'name': name,
+                'labels': dict(labels),
+                'count': total,
+                'sum': round(total_seconds, 6),
+                'avg': round(total_seconds / total, 6) if total else None,
+                'p50': self._quantile(counts, total, 0.5),
+                'p95': self._quantile(counts, total, 0.95),
+                'buckets': buckets,
+            })
+        return result
+
+    def render_prometheus(self, prefix='euroeventos_'):
+        """Renders the series in the Prometheus text exposition format."""
+        def label_text(labels, **extra):
+            labels = {**labels, **extra}
+            if not labels:
+                return ''
+            return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+        for counter in snapshot['counters']:
+            name = f"{prefix}{counter['name']}_total"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f"{name}{label_text(counter['labels'])} {counter['value']}")
+        for histogram in snapshot['histograms']:
+            name = f"{prefix}{histogram['name']}"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            for bound, count in histogram['buckets'].items():
+                lines.append(f"{name}_bucket{label_text(histogram['labels'], le=bound)} {count}")
+            lines.append(f"{name}_sum{label_text(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{label_text(histogram['labels'])} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+# Registry shared by the notification publisher and the workers of this process.
+metrics = EmailMetrics()
+
+
+def start_metrics_server(port, host='0.0.0.0', registry=None):
+    """Serves ``/metrics`` (Prometheus text) and ``/metrics.json`` on a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server (``server_address`` holds the bound port).
+    """
+    registry = registry or metrics
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path == '/metrics':
+                body = registry.render_prometheus().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif path == '/metrics.json':
+                body = json.dumps(registry.snapshot()).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood the worker log.
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Metrics endpoint listening on {host}:{server.server_address[1]}")
+    return server
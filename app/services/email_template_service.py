@@ -2,15 +2,31 @@
 Email Template Service for EuroEventos.
 Renders HTML email templates with Jinja2.
 """
+import json
 import os
-from jinja2 import Environment, FileSystemLoader
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, meta
 
 
 class EmailTemplateService:
     """Service for rendering email templates."""
     
-    def __init__(self):
-        """Initialize the template environment."""
+    def __init__(self, bytecode_cache_dir: str = None, render_cache_size: int = 0, watch_interval: float = None):
+        """
+        Initialize the template environment.
+
+        Args:
+            bytecode_cache_dir (str, optional): Directory where compiled templates
+                are persisted, so a restarted process skips compiling them again
+            render_cache_size (int, optional): Rendered e-mails kept in memory,
+                keyed by template and context; 0 disables the render cache
+            watch_interval (float, optional): Seconds between checks of the
+                e-mail templates for changes. None keeps Jinja's check of the
+                template file on every render.
+        """
         # Support both template references styles:
         # - direct file names (e.g. welcome.html) from templates/emails
         # - prefixed inheritance paths (e.g. emails/base.html) from templates
@@ -18,11 +34,91 @@ class EmailTemplateService:
         templates_root_dir = os.path.join(base_dir, 'templates')
         templates_dir = os.path.join(base_dir, 'templates', 'emails')
         
+        self.templates_dir = templates_dir
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+
         # Initialize Jinja2 environment
         self.env = Environment(
             loader=FileSystemLoader([templates_root_dir, templates_dir]),
-            autoescape=True
+            autoescape=True,
+            bytecode_cache=bytecode_cache,
+            auto_reload=watch_interval is None,
         )
+
+        self.render_cache_size = max(render_cache_size, 0)
+        self.watch_interval = watch_interval
+        self._render_cache = OrderedDict()
+        self._lock = Lock()
+        self._signature = self._templates_signature() if watch_interval is not None else None
+        self._checked_at = time.monotonic()
+
+    def _templates_signature(self):
+        signature = []
+        for root, _, files in os.walk(self.templates_dir):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                signature.append((root, name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def precompile(self) -> int:
+        """
+        Compile every e-mail template, and the layouts they extend or include.
+
+        Compiled templates stay in memory and, with a bytecode cache
+        directory, on disk for the next process.
+
+        Returns:
+            int: Number of templates compiled
+        """
+        pending = sorted(name for name in os.listdir(self.templates_dir) if name.endswith('.html'))
+        compiled = set()
+        while pending:
+            name = pending.pop()
+            if name in compiled:
+                continue
+            template = self.env.get_template(name)
+            compiled.add(name)
+            with open(template.filename, encoding='utf-8') as source:
+                referenced = meta.find_referenced_templates(self.env.parse(source.read()))
+            pending.extend(ref for ref in referenced if ref and ref not in compiled)
+        return len(compiled)
+
+    def refresh_if_changed(self) -> bool:
+        """
+        Reload the templates if a file in the e-mail templates directory changed.
+
+        Checks at most once per ``watch_interval``; on change, drops the
+        compiled templates and the rendered e-mails and compiles them again.
+
+        Returns:
+            bool: Whether the templates were reloaded
+        """
+        if self.watch_interval is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.watch_interval:
+                return False
+            self._checked_at = now
+            signature = self._templates_signature()
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            self._render_cache.clear()
+            self.env.cache.clear()
+        self.precompile()
+        return True
+
+    @staticmethod
+    def _render_key(template_name, context):
+        try:
+            return template_name, json.dumps(context, sort_keys=True)
+        except (TypeError, ValueError):
+            # Only JSON contexts (the worker payloads) are cached.
+            return None
     
     def render_template(self, template_name: str, context: dict = None) -> str:
         """
@@ -35,13 +131,29 @@ class EmailTemplateService:
         Returns:
             str: Rendered HTML content
         """
+        self.refresh_if_changed()
+        key = self._render_key(template_name, context or {}) if self.render_cache_size else None
+        if key is not None:
+            with self._lock:
+                html = self._render_cache.get(key)
+                if html is not None:
+                    self._render_cache.move_to_end(key)
+                    return html
+
         try:
             template = self.env.get_template(template_name)
-            return template.render(**(context or {}))
+            html = template.render(**(context or {}))
         except Exception as e:
             # Log error and return a simple fallback
             print(f"Error rendering template {template_name}: {e}")
             return self._render_fallback(template_name, context or {})
+
+        if key is not None:
+            with self._lock:
+                self._render_cache[key] = html
+                while len(self._render_cache) > self.render_cache_size:
+                    self._render_cache.popitem(last=False)
+        return html
     
     def render_welcome_email(self, user_name: str, email: str, app_url: str) -> str:
         """Render welcome email template."""
@@ -1322,34 +1322,36 @@ class EventService:
     def notify_all_participants(self, event_id, subject, body):
         """Sends a broadcast email to all unique participants of an event.
         
-        Uses RabbitMQ for asynchronous processing of email tasks.
+        Publishes a single broadcast task (one body, BCC recipient list) that
+        the worker sends in chunks, instead of one message per participant.
         """
         from app.models import User
-        # Get unique user CPFs enrolled in any activity of this event
-        enrollments = Enrollment.query.join(Activity, Enrollment.activity_id == Activity.id).filter(Activity.event_id == event_id).all()
-        cpfs = set([e.user_cpf for e in enrollments])
+        # E-mails of users enrolled in any activity of this event, in one query.
+        emails = [
+            email
+            for (email,) in db.session.query(User.email)
+            .join(Enrollment, Enrollment.user_cpf == User.cpf)
+            .join(Activity, Enrollment.activity_id == Activity.id)
+            .filter(Activity.event_id == event_id, User.email.isnot(None), User.email != '')
+            .distinct()
+        ]
         
-        count = 0
         event = self.event_repo.get_by_id(event_id)
         event_name = event.nome if event else 'Evento'
         app_url = (current_app.config.get('BASE_URL') or '').rstrip('/')
-        for cpf in cpfs:
-            user = User.query.filter_by(cpf=cpf).first()
-            if user and user.email:
-                self.notification_service.send_email_task(
-                    to_email=user.email,
-                    subject=subject,
-                    template_name='event_broadcast.html',
-                    template_data={
-                        'subject': subject,
-                        'event_name': event_name,
-                        'user_name': user.nome,
-                        'message_text': body,
-                        'app_url': app_url,
-                    },
-                )
-                count += 1
-        return count
+        # Counts the recipients of a broadcast the broker confirmed.
+        return self.notification_service.send_broadcast_task(
+            emails,
+            subject,
+            template_name='event_broadcast.html',
+            template_data={
+                'subject': subject,
+                'event_name': event_name,
+                'user_name': 'participante',
+                'message_text': body,
+                'app_url': app_url,
+            },
+        )
 
     def get_event_by_id(self, event_id):
         return self.event_repo.get_by_id(event_id)
@@ -1427,29 +1429,12 @@ class EventService:
                 nome=user.nome,
                 presente=False,
             )
-            try:
-                saved = self.enrollment_repo.save(enrollment)
-            except IntegrityError:
-                # Covers concurrent insert attempts after uniqueness hardening.
-                existing = self.get_enrollment(activity_id, user.cpf)
-                if existing:
-                    if not existing.event_registration_id:
-                        refreshed_registration, _ = self.ensure_event_registration(
-                            event,
-                            user,
-                            category_id=category_id,
-                            actor_user=actor_user or user,
-                        )
-                        if refreshed_registration:
-                            existing.event_registration_id = refreshed_registration.id
-                            self.enrollment_repo.save(existing)
-                    return existing, "Já inscrito"
-                raise
+            # Queued in the same commit as the enrollment; the outbox relay publishes it.
             if user.email:
                 app_url = (current_app.config.get('BASE_URL') or '').rstrip('/')
                 event_date = activity.event.data_inicio.strftime('%d/%m/%Y') if activity.event and activity.event.data_inicio else ''
                 event_time = activity.hora_atv.strftime('%H:%M') if activity.hora_atv else ''
-                self.notification_service.send_email_task(
+                self.notification_service.enqueue_email_task(
                     to_email=user.email,
                     subject=f"Inscrição Confirmada: {activity.nome}",
                     template_name='enrollment_confirmation.html',
@@ -1464,8 +1449,30 @@ class EventService:
                         'event_details_url': app_url,
                         'my_events_url': f"{app_url}/meus_eventos" if app_url else '',
                         'cancel_url': '',
+                        'activity_name': activity.nome,
+                        'activity_date': activity.data_atv.strftime('%d/%m/%Y') if activity.data_atv else '',
                     },
+                    # Enrollments in several activities of one event within the window go out as one digest.
+                    coalesce_key=f"{NotificationService.ENROLLMENT_DIGEST}:{activity.event_id}:{user.email.lower()}",
                 )
+            try:
+                saved = self.enrollment_repo.save(enrollment)
+            except IntegrityError:
+                # Covers concurrent insert attempts after uniqueness hardening.
+                existing = self.get_enrollment(activity_id, user.cpf)
+                if existing:
+                    if not existing.event_registration_id:
+                        refreshed_registration, _ = self.ensure_event_registration(
+                            event,
+                            user,
+                            category_id=category_id,
+                            actor_user=actor_user or user,
+                        )
+                        if refreshed_registration:
+                            existing.event_registration_id = refreshed_registration.id
+                            self.enrollment_repo.save(existing)
+                    return existing, "Já inscrito"
+                raise
             return saved, "Inscrição Realizada!"
         elif action == 'sair':
             if existing:
@@ -1474,7 +1481,12 @@ class EventService:
             return None, "Desinscrição realizada."
         return None, "Ação inválida"
 
-    def manual_enroll_user(self, actor_user, subject_user, activity_id, category_id=None):
+    def manual_enroll_user(self, actor_user, subject_user, activity_id, category_id=None, on_enrolled=None):
+        """Enrolls ``subject_user`` on behalf of staff and marks them present.
+
+        ``on_enrolled(enrollment)`` runs before the presence is committed, so
+        notifications it adds to the outbox commit together with it.
+        """
         activity = self.get_activity(activity_id)
         if not activity:
             return False, "Atividade inválida.", None
@@ -1494,6 +1506,8 @@ class EventService:
             return False, message, None
 
         enrollment.presente = True
+        if on_enrolled is not None:
+            on_enrolled(enrollment)
         self.enrollment_repo.save(enrollment)
         return True, "Inscrição realizada com sucesso.", enrollment
 
@@ -1525,7 +1539,6 @@ class EventService:
                     lat_checkin=lat,
                     lon_checkin=lon,
                 )
-                self.enrollment_repo.save(enrollment)
             else:
                 return False, "Você não se inscreveu nesta atividade.", None
         else:
@@ -1542,11 +1555,11 @@ class EventService:
             enrollment.presente = True
             enrollment.lat_checkin = lat
             enrollment.lon_checkin = lon
-            self.enrollment_repo.save(enrollment)
 
         if user.email:
+            # Queued in the same commit as the presence; the outbox relay publishes it.
             app_url = (current_app.config.get('BASE_URL') or '').rstrip('/')
-            self.notification_service.send_email_task(
+            self.notification_service.enqueue_email_task(
                 to_email=user.email,
                 subject=f"Presença Confirmada: {activity.nome}",
                 template_name='presence_confirmation.html',
@@ -1557,6 +1570,7 @@ class EventService:
                     'app_url': f"{app_url}/meus_eventos" if app_url else '',
                 },
             )
+        self.enrollment_repo.save(enrollment)
         return True, "Presença confirmada!", enrollment
 
     def get_user_events_paginated(self, user_cpf, page=1, per_page=10, filters=None):
@@ -2,6 +2,7 @@ import hashlib
 import json
 from datetime import datetime, timezone
 from types import SimpleNamespace
+from uuid import uuid4
 
 from sqlalchemy.exc import IntegrityError
 
@@ -9,7 +10,7 @@ from app.utils import build_absolute_app_url, current_certificate_issue_date_lab
 
 from app.services.certificate_service import CertificateService
 from app.services.notification_service import NotificationService
-from app.models import EventTeamCertificateRecipient
+from app.models import Event, EventTeamCertificateRecipient
 from app.extensions import db
 
 
@@ -123,44 +124,12 @@ class EventTeamCertificateService:
         for recipient in event.team_certificate_recipients:
             if recipient.source != 'manual':
                 continue
-            activity = getattr(recipient, 'activity', None)
-            resolved.append({
-                'source': 'manual',
-                'event_id': recipient.event_id,
-                'activity_id': recipient.activity_id,
-                'activity_name': activity.nome if activity else None,
-                'nome': recipient.nome,
-                'email': recipient.email,
-                'cpf': recipient.cpf,
-                'role_label': recipient.role_label,
-                'workload_hours': recipient.workload_hours,
-                'source_key': None,
-                'cert_hash': recipient.cert_hash,
-                'cert_entregue': bool(recipient.cert_entregue),
-                'cert_data_envio': recipient.cert_data_envio.isoformat() if recipient.cert_data_envio else None,
-                'id': recipient.id,
-            })
+            resolved.append(self._persisted_row(recipient))
 
         for source_key, recipient in automatic_rows.items():
             if source_key in consumed_automatic_keys:
                 continue
-            activity = getattr(recipient, 'activity', None)
-            resolved.append({
-                'source': 'automatico',
-                'event_id': recipient.event_id,
-                'activity_id': recipient.activity_id,
-                'activity_name': activity.nome if activity else None,
-                'nome': recipient.nome,
-                'email': recipient.email,
-                'cpf': recipient.cpf,
-                'role_label': recipient.role_label,
-                'workload_hours': recipient.workload_hours,
-                'source_key': recipient.source_key,
-                'cert_hash': recipient.cert_hash,
-                'cert_entregue': bool(recipient.cert_entregue),
-                'cert_data_envio': recipient.cert_data_envio.isoformat() if recipient.cert_data_envio else None,
-                'id': recipient.id,
-            })
+            resolved.append(self._persisted_row(recipient))
 
         for row in resolved:
             row['resolved_key'] = self.build_resolved_key(row)
@@ -169,6 +138,43 @@ class EventTeamCertificateService:
 
         return resolved
 
+    @staticmethod
+    def _persisted_row(recipient):
+        activity = getattr(recipient, 'activity', None)
+        is_manual = recipient.source == 'manual'
+        return {
+            'source': 'manual' if is_manual else 'automatico',
+            'event_id': recipient.event_id,
+            'activity_id': recipient.activity_id,
+            'activity_name': activity.nome if activity else None,
+            'nome': recipient.nome,
+            'email': recipient.email,
+            'cpf': recipient.cpf,
+            'role_label': recipient.role_label,
+            'workload_hours': recipient.workload_hours,
+            'source_key': None if is_manual else recipient.source_key,
+            'cert_hash': recipient.cert_hash,
+            'cert_entregue': bool(recipient.cert_entregue),
+            'cert_data_envio': recipient.cert_data_envio.isoformat() if recipient.cert_data_envio else None,
+            'id': recipient.id,
+        }
+
+    def resolve_persisted_recipients(self, event, recipient_ids):
+        """Rows of the given persisted recipients only, without resolving the whole event.
+
+        Used by queued batches, whose plan step already persisted every resolved row.
+        """
+        if not recipient_ids:
+            return []
+        recipients = EventTeamCertificateRecipient.query.filter(
+            EventTeamCertificateRecipient.event_id == event.id,
+            EventTeamCertificateRecipient.id.in_(list(recipient_ids)),
+        ).order_by(EventTeamCertificateRecipient.id.asc()).all()
+        rows = [self._persisted_row(recipient) for recipient in recipients]
+        for row in rows:
+            row['resolved_key'] = self.build_resolved_key(row)
+        return rows
+
     @staticmethod
     def build_resolved_key(row):
         parts = [
@@ -389,7 +395,7 @@ class EventTeamCertificateService:
             'elements': [team_text_element] + json.loads(json.dumps(fixed_elements)),
         }
 
-    def generate_recipient_pdf(self, event, recipient, template_override=None, tag_overrides=None):
+    def _recipient_pdf_arguments(self, event, recipient, template_override=None, tag_overrides=None):
         activity = getattr(recipient, 'activity', None)
         activity_name = activity.nome if activity and getattr(activity, 'nome', None) else ''
 
@@ -444,26 +450,41 @@ class EventTeamCertificateService:
         )
         fake_enrollment = SimpleNamespace(cert_hash=recipient.cert_hash)
 
-        return self.certificate_service.generate_pdf(
-            fake_event,
-            fake_user,
-            [activity] if activity else [],
-            total_hours,
-            enrollment=fake_enrollment,
-            template_override=template_override,
-            tag_overrides=merged_overrides,
+        return (fake_event, fake_user, [activity] if activity else [], total_hours), {
+            'enrollment': fake_enrollment,
+            'template_override': template_override,
+            'tag_overrides': merged_overrides,
+        }
+
+    def generate_recipient_pdf(self, event, recipient, template_override=None, tag_overrides=None, as_buffer=False):
+        args, kwargs = self._recipient_pdf_arguments(
+            event, recipient, template_override=template_override, tag_overrides=tag_overrides
         )
+        if as_buffer:
+            kwargs['as_buffer'] = True
+        return self.certificate_service.generate_pdf(*args, **kwargs)
 
-    def queue_email(self, event, recipient, attachment_path):
+    def build_recipient_render_descriptor(self, event, recipient, template_override=None, tag_overrides=None):
+        args, kwargs = self._recipient_pdf_arguments(
+            event, recipient, template_override=template_override, tag_overrides=tag_overrides
+        )
+        return self.certificate_service.build_render_descriptor(*args, **kwargs)
+
+    def build_email_task(self, event, recipient, attachment_path, kind='team_certificate', send_id=None):
+        """Returns the ``send_email_task`` arguments for a recipient, or None without an e-mail.
+
+        ``kind`` and ``send_id`` (the batch job or resend request) scope the
+        idempotency key: one send never mails the same certificate twice,
+        while a new batch or resend gets its own key.
+        """
         if not recipient.email:
-            return False
+            return None
         event_name = getattr(event, 'nome', '')
-        subject = f"Certificado de Equipe - {event_name}"
-        return self.notifier.send_email_task(
-            to_email=recipient.email,
-            subject=subject,
-            template_name='team_certificate_ready.html',
-            template_data={
+        return {
+            'to_email': recipient.email,
+            'subject': f"Certificado de Equipe - {event_name}",
+            'template_name': 'team_certificate_ready.html',
+            'template_data': {
                 'recipient_name': recipient.nome,
                 'event_name': event_name,
                 'role_label': recipient.role_label,
@@ -472,5 +493,108 @@ class EventTeamCertificateService:
                 'preview_url': build_absolute_app_url(f"/api/certificates/team/preview_public/{recipient.cert_hash}"),
                 'validation_url': build_absolute_app_url(f"/validar/{recipient.cert_hash}"),
             },
-            attachment_path=attachment_path,
+            'attachment_path': attachment_path,
+            'idempotency_key': self.notifier.build_idempotency_key(kind, recipient.cert_hash, recipient.email, send_id),
+        }
+
+    def queue_email(self, event, recipient, attachment_path):
+        task = self.build_email_task(
+            event, recipient, attachment_path, kind='team_certificate_resend', send_id=uuid4().hex
         )
+        if not task:
+            return False
+        return self.notifier.send_email_task(**task)
+
+    def prepare_certificate_batch(self, event_id):
+        """Persists the resolved team rows and their hashes; returns the IDs of every persisted row.
+
+        Rows without e-mail are kept so the chunks report them as ``sem_email``.
+        """
+        event = db.session.get(Event, event_id)
+        if not event:
+            return []
+
+        recipient_ids = []
+        for row in self.resolve_event_recipients(event):
+            row = self.ensure_persisted_automatic_recipient(event, row)
+            self.ensure_recipient_hash(event_id, row)
+            if row.get('id') is not None:
+                recipient_ids.append(row['id'])
+        db.session.commit()
+        return recipient_ids
+
+    def deliver_certificates(self, event, recipient_ids=None, send_id=None):
+        """Renders and queues team certificates (all resolved rows, or only the persisted ``recipient_ids``).
+
+        ``send_id`` (the batch job) scopes the e-mails' idempotency keys.
+        """
+        from app.services.certificate_render_service import CertificateRenderService
+
+        if recipient_ids is not None:
+            resolved_rows = self.resolve_persisted_recipients(event, recipient_ids)
+        else:
+            resolved_rows = self.resolve_event_recipients(event)
+        total_enviado = 0
+        sem_email = 0
+        falha_fila = 0
+
+        missing_hashes = [r for r in resolved_rows if not r.get('cert_hash')]
+        if missing_hashes:
+            for r in missing_hashes:
+                r = self.ensure_persisted_automatic_recipient(event, r)
+                self.ensure_recipient_hash(event.id, r)
+            db.session.commit()
+
+        deliverable = []
+        descriptors = []
+        for row in resolved_rows:
+            if not row.get('email'):
+                sem_email += 1
+                continue
+
+            row = self.ensure_persisted_automatic_recipient(event, row)
+
+            recipient = self.build_virtual_recipient(event, row)
+            try:
+                descriptors.append(self.build_recipient_render_descriptor(event, recipient))
+            except Exception:
+                falha_fila += 1
+                continue
+            deliverable.append((row, recipient))
+
+        rendered = CertificateRenderService(self.certificate_service).render_many(descriptors)
+        queued = []
+        email_tasks = []
+        for (row, recipient), (pdf_path, render_error) in zip(deliverable, rendered):
+            if render_error:
+                falha_fila += 1
+                continue
+            try:
+                task = self.build_email_task(event, recipient, pdf_path, send_id=send_id)
+            except Exception:
+                task = None
+            if not task:
+                falha_fila += 1
+                continue
+            queued.append(row)
+            email_tasks.append(task)
+
+        # Only deliveries the broker confirmed are marked as sent.
+        for row, confirmed in zip(queued, self.notifier.send_email_tasks(email_tasks)):
+            if not confirmed:
+                falha_fila += 1
+                continue
+            resolved_id = row.get('id')
+            if resolved_id is not None:
+                persisted_rec = db.session.get(EventTeamCertificateRecipient, resolved_id)
+                if persisted_rec:
+                    persisted_rec.cert_entregue = True
+                    persisted_rec.cert_data_envio = datetime.now()
+            total_enviado += 1
+
+        db.session.commit()
+        return {
+            'total_enviado': total_enviado,
+            'sem_email': sem_email,
+            'falha_fila': falha_fila,
+        }
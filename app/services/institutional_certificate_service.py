@@ -3,12 +3,15 @@ import hashlib
 import json
 from datetime import datetime
 from types import SimpleNamespace
+from uuid import uuid4
 
 from flask import current_app
 from app.utils import build_absolute_app_url, current_certificate_issue_date_label
 
 from app.services.certificate_service import CertificateService
 from app.services.notification_service import NotificationService
+from app.models import InstitutionalCertificate, InstitutionalCertificateRecipient
+from app.extensions import db
 
 
 class InstitutionalCertificateService:
@@ -18,13 +21,6 @@ class InstitutionalCertificateService:
         self.notifier = NotificationService()
         self.event_certificate_service = CertificateService()
 
-    @staticmethod
-    def _replace_placeholders(text, values):
-        rendered = text or ''
-        for key, value in values.items():
-            rendered = rendered.replace(key, value)
-        return rendered
-
     @staticmethod
     def _recipient_metadata(recipient):
         try:
@@ -62,55 +58,11 @@ class InstitutionalCertificateService:
             'cpf': cpf,
         }
 
-    def _render_institutional_template_json(self, certificate, recipient):
-        if not certificate.cert_template_json:
-            return None
-
-        try:
-            template = json.loads(certificate.cert_template_json)
-        except Exception:
-            return certificate.cert_template_json
-
-        metadata = self._recipient_metadata(recipient)
-        profile = self._recipient_effective_profile(recipient)
-        carga_horaria = str(metadata.get('carga_horaria') or '-')
-        curso_usuario = str(metadata.get('curso_usuario') or '-')
-        issue_date = current_certificate_issue_date_label()
-
-        placeholders = {
-            '{{RECIPIENT_NAME}}': profile['nome'] or '',
-            '{{CERTIFICATE_TITLE}}': certificate.titulo or '',
-            '{{CATEGORY}}': certificate.categoria or '',
-            '{{EMISSION_DATE}}': issue_date,
-            '{{SIGNER}}': certificate.signer_name or 'Coordenacao de Extensao',
-            '{{CARGA_HORARIA}}': carga_horaria,
-            '{{CURSO_USUARIO}}': curso_usuario,
-            '{{HASH}}': recipient.cert_hash or '',
-            # Backward-compatible aliases
-            '{{NOME}}': profile['nome'] or '',
-            '{{EVENTO}}': certificate.titulo or '',
-            '{{HORAS}}': carga_horaria,
-            '{{CURSO}}': curso_usuario,
-            '{{DATA}}': issue_date,
-            '{{DATA_REALIZACAO}}': '',
-            '{{CPF}}': profile['cpf'] or '',
-        }
-
-        for element in template.get('elements', []):
-            if not isinstance(element, dict):
-                continue
-            if isinstance(element.get('text'), str):
-                element['text'] = self._replace_placeholders(element['text'], placeholders)
-            if isinstance(element.get('html_content'), str):
-                element['html_content'] = self._replace_placeholders(element['html_content'], placeholders)
-
-        return json.dumps(template, ensure_ascii=False)
-
     def build_hash(self, certificate_id, recipient_name, recipient_email=None):
         raw = f"{certificate_id}|{recipient_name}|{recipient_email or ''}|{datetime.utcnow().isoformat()}"
         return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16].upper()
 
-    def generate_recipient_pdf(self, certificate, recipient, template_override=None, tag_overrides=None):
+    def _recipient_pdf_arguments(self, certificate, recipient, template_override=None, tag_overrides=None):
         profile = self._recipient_effective_profile(recipient)
         metadata = self._recipient_metadata(recipient)
 
@@ -123,7 +75,6 @@ class InstitutionalCertificateService:
         except Exception:
             data_inicio = None
 
-        rendered_template_json = self._render_institutional_template_json(certificate, recipient)
         carga_horaria = str(metadata.get('carga_horaria') or '-')
         curso_usuario = str(metadata.get('curso_usuario') or '-')
         issue_date = current_certificate_issue_date_label()
@@ -161,7 +112,7 @@ class InstitutionalCertificateService:
             signer_name=certificate.signer_name,
             data_inicio=data_inicio,
             cert_bg_path=certificate.cert_bg_path,
-            cert_template_json=rendered_template_json,
+            cert_template_json=certificate.cert_template_json,
             designer_mode='institutional',
             is_institutional_certificate=True,
         )
@@ -172,27 +123,44 @@ class InstitutionalCertificateService:
         )
         fake_enrollment = SimpleNamespace(cert_hash=recipient.cert_hash)
 
-        return self.event_certificate_service.generate_pdf(
-            fake_event,
-            fake_user,
-            [],
-            certificate.categoria or '-',
-            enrollment=fake_enrollment,
-            template_override=template_override,
-            tag_overrides=merged_tag_overrides,
+        return (fake_event, fake_user, [], certificate.categoria or '-'), {
+            'enrollment': fake_enrollment,
+            'template_override': template_override,
+            'tag_overrides': merged_tag_overrides,
+        }
+
+    def generate_recipient_pdf(
+        self, certificate, recipient, template_override=None, tag_overrides=None, as_buffer=False
+    ):
+        args, kwargs = self._recipient_pdf_arguments(
+            certificate, recipient, template_override=template_override, tag_overrides=tag_overrides
         )
+        if as_buffer:
+            kwargs['as_buffer'] = True
+        return self.event_certificate_service.generate_pdf(*args, **kwargs)
 
-    def queue_email(self, certificate, recipient, attachment_path):
+    def build_recipient_render_descriptor(self, certificate, recipient, template_override=None, tag_overrides=None):
+        args, kwargs = self._recipient_pdf_arguments(
+            certificate, recipient, template_override=template_override, tag_overrides=tag_overrides
+        )
+        return self.event_certificate_service.build_render_descriptor(*args, **kwargs)
+
+    def build_email_task(self, certificate, recipient, attachment_path, kind='institutional_certificate', send_id=None):
+        """Returns the ``send_email_task`` arguments for a recipient, or None without an e-mail.
+
+        ``kind`` and ``send_id`` (the batch job or resend request) scope the
+        idempotency key: one send never mails the same certificate twice,
+        while a new batch or resend gets its own key.
+        """
         profile = self._recipient_effective_profile(recipient)
         if not profile['email']:
-            return False
+            return None
 
-        subject = f"Certificado Institucional - {certificate.titulo}"
-        return self.notifier.send_email_task(
-            to_email=profile['email'],
-            subject=subject,
-            template_name='institutional_certificate_ready.html',
-            template_data={
+        return {
+            'to_email': profile['email'],
+            'subject': f"Certificado Institucional - {certificate.titulo}",
+            'template_name': 'institutional_certificate_ready.html',
+            'template_data': {
                 'recipient_name': profile['nome'],
                 'certificate_title': certificate.titulo,
                 'category_name': certificate.categoria,
@@ -204,5 +172,110 @@ class InstitutionalCertificateService:
                 'preview_url': build_absolute_app_url(f"/api/institutional_certificates/preview_public/{recipient.cert_hash}"),
                 'validation_url': build_absolute_app_url(f"/validar/{recipient.cert_hash}"),
             },
-            attachment_path=attachment_path,
+            'attachment_path': attachment_path,
+            'idempotency_key': self.notifier.build_idempotency_key(
+                kind, recipient.cert_hash, profile['email'], send_id
+            ),
+        }
+
+    def queue_email(self, certificate, recipient, attachment_path):
+        task = self.build_email_task(
+            certificate, recipient, attachment_path, kind='institutional_certificate_resend', send_id=uuid4().hex
         )
+        if not task:
+            return False
+        return self.notifier.send_email_task(**task)
+
+    def prepare_certificate_batch(self, certificate_id):
+        """Assigns missing recipient hashes; returns the IDs of recipients with e-mail."""
+        recipients = InstitutionalCertificateRecipient.query.filter_by(certificate_id=certificate_id).order_by(
+            InstitutionalCertificateRecipient.id.asc()
+        ).all()
+        recipient_ids = []
+        for recipient in recipients:
+            profile = self._recipient_effective_profile(recipient)
+            if not recipient.cert_hash:
+                recipient.cert_hash = self.build_hash(certificate_id, profile['nome'], profile['email'])
+            if profile['email']:
+                recipient_ids.append(recipient.id)
+        db.session.commit()
+        return recipient_ids
+
+    def deliver_certificates(self, certificate_id, recipient_ids=None, send_id=None):
+        """Renders and queues the certificates of ``certificate_id`` (all recipients, or only ``recipient_ids``).
+
+        ``send_id`` (the batch job) scopes the e-mails' idempotency keys.
+        Returns ``(success, message, summary)``.
+        """
+        from app.services.certificate_render_service import CertificateRenderService
+
+        cert = db.session.get(InstitutionalCertificate, certificate_id)
+        if not cert:
+            return False, 'Certificado não encontrado', {
+                'total_enviado': 0,
+                'sem_email': 0,
+                'falha_fila': 0,
+            }
+
+        recipients_query = InstitutionalCertificateRecipient.query.filter_by(certificate_id=certificate_id)
+        if recipient_ids is not None:
+            recipients_query = recipients_query.filter(InstitutionalCertificateRecipient.id.in_(list(recipient_ids)))
+        recipients = recipients_query.all()
+        if not recipients:
+            return False, 'Nenhum destinatario cadastrado', {
+                'total_enviado': 0,
+                'sem_email': 0,
+                'falha_fila': 0,
+            }
+
+        sent_count = 0
+        skipped_without_email = 0
+        failed_queue = 0
+        now = datetime.utcnow()
+        deliverable = []
+        for recipient in recipients:
+            profile = self._recipient_effective_profile(recipient)
+            if not recipient.cert_hash:
+                recipient.cert_hash = self.build_hash(certificate_id, profile['nome'], profile['email'])
+
+            if not profile['email']:
+                skipped_without_email += 1
+                continue
+            deliverable.append(recipient)
+
+        descriptors = [self.build_recipient_render_descriptor(cert, recipient) for recipient in deliverable]
+        rendered = CertificateRenderService(self.event_certificate_service).render_many(descriptors)
+        queued = []
+        email_tasks = []
+        for recipient, (pdf_path, render_error) in zip(deliverable, rendered):
+            if render_error:
+                failed_queue += 1
+                continue
+            queued.append(recipient)
+            email_tasks.append(self.build_email_task(cert, recipient, pdf_path, send_id=send_id))
+
+        # Only deliveries the broker confirmed are marked as sent.
+        for recipient, confirmed in zip(queued, self.notifier.send_email_tasks(email_tasks)):
+            if not confirmed:
+                failed_queue += 1
+                continue
+
+            recipient.cert_entregue = True
+            recipient.cert_data_envio = now
+            sent_count += 1
+
+        cert.status = 'ENVIADO' if sent_count > 0 else cert.status
+        db.session.commit()
+
+        summary = {
+            'total_enviado': sent_count,
+            'sem_email': skipped_without_email,
+            'falha_fila': failed_queue,
+        }
+        if sent_count == 0 and failed_queue > 0:
+            return False, 'Problema no envio: falha ao enfileirar e-mails.', summary
+        if sent_count == 0:
+            return False, 'Problema no envio: nenhum destinatario com email valido', summary
+        if failed_queue > 0:
+            return True, 'Envio parcialmente concluido com falhas', summary
+        return True, 'Envio concluido', summary
@@ -0,0 +1,284 @@
+import json
+import time
+from uuid import uuid4
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import BackgroundJob, BackgroundJobChunk
+
+
+class JobRegistryService:
+    """Database-backed registry of batch and import jobs, shared by every process.
+
+    Each write runs in its own short transaction on the engine, so job
+    bookkeeping never commits (or gets rolled back with) the caller's session.
+    Counters are incremented with ``col = col + n`` so concurrent writers
+    (threads, render workers on other nodes) never lose updates.
+    """
+
+    COUNTER_FIELDS = (
+        'total_rows',
+        'processed_rows',
+        'created_count',
+        'updated_count',
+        'unchanged_count',
+        'errors_count',
+        'total_enviado',
+        'sem_email',
+        'falha_fila',
+    )
+    STATE_FIELDS = ('status', 'completed', 'resultado', 'message')
+    DEFAULT_STALE_AFTER_SECONDS = 1800
+    DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+
+    @staticmethod
+    def _table():
+        return BackgroundJob.__table__
+
+    @classmethod
+    def _stale_after(cls):
+        try:
+            stale_after = current_app.config.get('JOB_REGISTRY_STALE_AFTER_SECONDS', cls.DEFAULT_STALE_AFTER_SECONDS)
+            return max(int(stale_after), 0)
+        except (TypeError, ValueError):
+            return cls.DEFAULT_STALE_AFTER_SECONDS
+
+    @classmethod
+    def retention_seconds(cls):
+        """How long finished jobs (and the files they leave behind) are kept; 0 keeps them forever."""
+        try:
+            return max(int(current_app.config.get('JOB_REGISTRY_RETENTION_SECONDS', cls.DEFAULT_RETENTION_SECONDS)), 0)
+        except (TypeError, ValueError):
+            return cls.DEFAULT_RETENTION_SECONDS
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row._mapping)
+        raw_details = job.pop('details_json', None)
+        try:
+            job['details'] = json.loads(raw_details) if raw_details else {}
+        except ValueError:
+            job['details'] = {}
+        return job
+
+    def _values(self, fields, details=None):
+        allowed = set(self.STATE_FIELDS) | set(self.COUNTER_FIELDS)
+        unknown = set(fields) - allowed
+        if unknown:
+            raise ValueError(f"Campos de job desconhecidos: {', '.join(sorted(unknown))}")
+        values = dict(fields)
+        if details is not None:
+            values['details_json'] = json.dumps(details, ensure_ascii=False)
+        values['updated_at'] = time.time()
+        return values
+
+    def create(self, job_type, created_by=None, entity_id=None, message='', details=None, **fields):
+        """Registers a new job and returns it as a dict."""
+        now = time.time()
+        values = self._values(fields, details=details if details is not None else {})
+        values.setdefault('status', 'queued')
+        values.setdefault('completed', False)
+        values.update(
+            job_id=uuid4().hex,
+            job_type=job_type,
+            entity_id=entity_id,
+            created_by=created_by,
+            message=message,
+            created_at=now,
+        )
+        with db.engine.begin() as connection:
+            connection.execute(insert(self._table()).values(**values))
+        self.prune_completed()
+        return self.get(values['job_id'])
+
+    def create_if_absent(self, job_type, created_by=None, entity_id=None, message='', details=None, **fields):
+        """Creates the job unless an unfinished one exists for this type/owner/entity.
+
+        Returns ``(job, created)``. The partial unique index
+        ``uq_background_jobs_active`` makes the check and the insert atomic:
+        of two concurrent requests only one inserts, the other gets the
+        existing row. An unfinished job that stopped reporting is closed to
+        make room for the new one.
+        """
+        for _ in range(2):
+            try:
+                return self.create(
+                    job_type,
+                    created_by=created_by,
+                    entity_id=entity_id,
+                    message=message,
+                    details=details,
+                    **fields,
+                ), True
+            except IntegrityError:
+                existing = self.find_active(job_type, created_by=created_by, entity_id=entity_id)
+                if existing:
+                    return existing, False
+                self._close_stale(job_type, created_by, entity_id)
+        raise RuntimeError(f'Não foi possível registrar o job {job_type}.')
+
+    def _close_stale(self, job_type, created_by, entity_id):
+        table = self._table()
+        now = time.time()
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(table).where(
+                    table.c.job_type == job_type,
+                    func.coalesce(table.c.created_by, '') == (created_by or ''),
+                    func.coalesce(table.c.entity_id, 0) == (entity_id or 0),
+                    table.c.completed.is_(False),
+                    table.c.updated_at < now - self._stale_after(),
+                ).values(
+                    completed=True,
+                    status='error',
+                    resultado='erro',
+                    message='Job interrompido: parou de reportar progresso.',
+                    updated_at=now,
+                )
+            )
+
+    def prune_completed(self, max_completed_age=None):
+        """Deletes finished jobs older than the retention window; returns how many were removed."""
+        max_completed_age = self.retention_seconds() if max_completed_age is None else max_completed_age
+        if not max_completed_age:
+            return 0
+        table = self._table()
+        chunks = BackgroundJobChunk.__table__
+        with db.engine.begin() as connection:
+            result = connection.execute(
+                delete(table).where(
+                    table.c.completed.is_(True),
+                    table.c.updated_at < time.time() - max_completed_age,
+                )
+            )
+            connection.execute(delete(chunks).where(chunks.c.job_id.not_in(select(table.c.job_id))))
+        return result.rowcount
+
+    def get(self, job_id):
+        if not job_id:
+            return None
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(self._table()).where(self._table().c.job_id == job_id)
+            ).first()
+        return self._to_dict(row)
+
+    def find_active(self, job_type, created_by=None, entity_id=None):
+        """Returns the unfinished job of this type/owner/entity, ignoring jobs that stopped reporting."""
+        table = self._table()
+        job_types = job_type if isinstance(job_type, (list, tuple, set)) else (job_type,)
+        statement = select(table).where(
+            table.c.job_type.in_(list(job_types)),
+            table.c.completed.is_(False),
+        )
+        if created_by is not None:
+            statement = statement.where(table.c.created_by == created_by)
+        if entity_id is not None:
+            statement = statement.where(table.c.entity_id == entity_id)
+        stale_after = self._stale_after()
+        if stale_after:
+            statement = statement.where(table.c.updated_at >= time.time() - stale_after)
+        statement = statement.order_by(table.c.created_at.desc())
+
+        with db.engine.connect() as connection:
+            row = connection.execute(statement).first()
+        return self._to_dict(row)
+
+    def update(self, job_id, details=None, **fields):
+        """Overwrites state fields (and optionally ``details``); returns the updated job."""
+        table = self._table()
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(table).where(table.c.job_id == job_id).values(**self._values(fields, details=details))
+            )
+        return self.get(job_id)
+
+    def _counters(self, values):
+        unknown = set(values) - set(self.COUNTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Contadores de job desconhecidos: {', '.join(sorted(unknown))}")
+        return {name: int(value) for name, value in values.items()}
+
+    def _increment(self, connection, job_id, deltas):
+        deltas = {name: value for name, value in deltas.items() if value}
+        if not deltas:
+            return
+        table = self._table()
+        values = {name: table.c[name] + value for name, value in deltas.items()}
+        values['updated_at'] = time.time()
+        connection.execute(update(table).where(table.c.job_id == job_id).values(**values))
+
+    def increment(self, job_id, **deltas):
+        """Atomically adds ``deltas`` to the job counters."""
+        deltas = self._counters(deltas)
+        with db.engine.begin() as connection:
+            self._increment(connection, job_id, deltas)
+
+    def record_chunk(self, job_id, chunk_id, **counters):
+        """Adds the counters of one chunk to the job, once per ``chunk_id``.
+
+        Recording the same chunk again (a task replayed from the dead-letter
+        queue) replaces its earlier counts instead of adding them twice.
+        Returns True the first time the chunk is recorded.
+        """
+        counters = self._counters(counters)
+        chunks = BackgroundJobChunk.__table__
+        key = (chunks.c.job_id == job_id) & (chunks.c.chunk_id == str(chunk_id))
+        with db.engine.begin() as connection:
+            previous = connection.execute(select(chunks.c.counters_json).where(key)).scalar()
+            if previous is None:
+                connection.execute(insert(chunks).values(
+                    job_id=job_id,
+                    chunk_id=str(chunk_id),
+                    counters_json=json.dumps(counters),
+                ))
+                self._increment(connection, job_id, counters)
+                return True
+
+            previous = json.loads(previous)
+            connection.execute(update(chunks).where(key).values(counters_json=json.dumps(counters)))
+            self._increment(connection, job_id, {
+                name: counters.get(name, 0) - previous.get(name, 0)
+                for name in set(counters) | set(previous)
+            })
+            return False
+
+    def complete_if_done(self, job_id):
+        """Marks the job completed once ``processed_rows`` reaches ``total_rows``.
+
+        Only one caller wins, so the job is finished exactly once even when the
+        last chunks are processed concurrently.
+        """
+        table = self._table()
+        with db.engine.begin() as connection:
+            result = connection.execute(
+                update(table).where(
+                    table.c.job_id == job_id,
+                    table.c.completed.is_(False),
+                    table.c.processed_rows >= table.c.total_rows,
+                ).values(completed=True, status='completed', updated_at=time.time())
+            )
+        return result.rowcount == 1
+
+    @staticmethod
+    def batch_payload(job, entity_key):
+        """Shapes a certificate batch job like the status endpoints have always returned it."""
+        return {
+            'job_id': job['job_id'],
+            entity_key: job['entity_id'],
+            'created_by': job['created_by'],
+            'status': job['status'],
+            'completed': bool(job['completed']),
+            'resultado': job['resultado'] or 'processando',
+            'message': job['message'],
+            'total_enviado': job['total_enviado'],
+            'sem_email': job['sem_email'],
+            'falha_fila': job['falha_fila'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at'],
+        }
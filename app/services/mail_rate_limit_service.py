@@ -0,0 +1,141 @@
+import logging
+import os
+import time
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class LocalTokenBucketStore:
+    """In-process token buckets.
+
+    Coordinates the sender threads of a single worker process, and stands in
+    for the shared store in tests and single-worker deployments.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = Lock()
+        self._buckets = {}
+
+    def reserve(self, key, rate, burst):
+        """Takes one token from ``key``; returns how many seconds the caller must wait for it.
+
+        Tokens may go negative: each caller reserves the next free slot, so
+        concurrent senders are spaced at exactly ``rate`` instead of retrying
+        in bursts.
+        """
+        with self._lock:
+            now = self._clock()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + max(now - updated, 0) * rate) - 1
+            self._buckets[key] = (tokens, now)
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+
+class RedisTokenBucketStore:
+    """Token buckets kept in Redis, shared by every worker process and node.
+
+    The refill-and-take step runs as one Lua script on the Redis clock, so
+    workers with skewed clocks still draw from the same bucket atomically.
+    Requires the ``redis`` package.
+    """
+
+    SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 60)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+    def __init__(self, url, prefix='mail_rate:'):
+        import redis
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def reserve(self, key, rate, burst):
+        return float(self._script(keys=[f'{self.prefix}{key}'], args=[rate, burst]))
+
+
+class MailRateLimiter:
+    """Paces outgoing mail with token buckets per sender account and per recipient domain.
+
+    Rates are messages per minute; 0 disables that limit. ``domain_overrides``
+    maps a domain to ``(rate, burst)`` for relays with their own limits.
+    """
+
+    def __init__(self, store, sender_rate=0, sender_burst=1, domain_rate=0, domain_burst=1, domain_overrides=None):
+        self.store = store
+        self.sender_rate = sender_rate
+        self.sender_burst = max(sender_burst, 1)
+        self.domain_rate = domain_rate
+        self.domain_burst = max(domain_burst, 1)
+        self.domain_overrides = domain_overrides or {}
+
+    @staticmethod
+    def parse_domain_overrides(raw):
+        """Parses ``"gmail.com=60:10,hotmail.com=30"`` into ``{domain: (rate, burst or None)}``."""
+        overrides = {}
+        for item in (raw or '').split(','):
+            domain, _, limits = item.partition('=')
+            domain = domain.strip().lower()
+            if not domain or not limits.strip():
+                continue
+            rate, _, burst = limits.partition(':')
+            overrides[domain] = (float(rate), int(burst) if burst.strip() else None)
+        return overrides
+
+    @classmethod
+    def from_env(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        redis_url = (environ.get('MAIL_RATE_REDIS_URL') or '').strip()
+        store = RedisTokenBucketStore(redis_url) if redis_url else LocalTokenBucketStore()
+        return cls(
+            store,
+            sender_rate=float(environ.get('MAIL_RATE_SENDER_PER_MINUTE', 0) or 0),
+            sender_burst=int(environ.get('MAIL_RATE_SENDER_BURST', 1) or 1),
+            domain_rate=float(environ.get('MAIL_RATE_DOMAIN_PER_MINUTE', 0) or 0),
+            domain_burst=int(environ.get('MAIL_RATE_DOMAIN_BURST', 1) or 1),
+            domain_overrides=cls.parse_domain_overrides(environ.get('MAIL_RATE_DOMAIN_OVERRIDES')),
+        )
+
+    def _limits(self, sender, recipient):
+        if self.sender_rate > 0 and sender:
+            yield f'sender:{sender.lower()}', self.sender_rate, self.sender_burst
+
+        local_part, _, domain = (recipient or '').rpartition('@')
+        domain = domain.strip().lower()
+        if not local_part or not domain:
+            return
+        rate, burst = self.domain_rate, self.domain_burst
+        if domain in self.domain_overrides:
+            rate, override_burst = self.domain_overrides[domain]
+            burst = override_burst or burst
+        if rate > 0:
+            yield f'domain:{domain}', rate, burst
+
+    def reserve(self, sender, recipient):
+        """Reserves a slot in every applicable bucket; returns the seconds to wait before sending."""
+        delay = 0.0
+        for key, per_minute, burst in self._limits(sender, recipient):
+            delay = max(delay, self.store.reserve(key, per_minute / 60.0, burst))
+        return delay
+
+    def wait(self, sender, recipient, sleep=time.sleep):
+        delay = self.reserve(sender, recipient)
+        if delay > 0:
+            logger.info(f"Rate limit: delaying email to {recipient} by {delay:.2f}s")
+            sleep(delay)
+        return delay
@@ -1,25 +1,409 @@
+import os
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from uuid import uuid4
+
 import pika
 import json
 from flask import current_app
+from sqlalchemy import delete, or_, select, update
+
+from app.extensions import db
+from app.models import NotificationOutbox
+from app.services.email_metrics_service import metrics
+
+
+class _BulkConfirmChannel:
+    """Confirm-mode channel on its own ``SelectConnection``, used for bulk publishes.
+
+    ``BlockingChannel.confirm_delivery()`` waits for the broker after every
+    message. The asynchronous channel lets a whole window go out first and
+    matches the broker's acks and nacks to messages by delivery tag; messages
+    returned as unroutable are matched by body. The I/O loop only runs while
+    a window is being published or confirmed.
+    """
+
+    def __init__(self, parameters):
+        self._connection = pika.SelectConnection(
+            parameters,
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_error,
+        )
+        self._channel = None
+        self._opening = None
+        self._error = None
+        self._delivery_tag = 0
+        self._pending = {}
+        self._failed = set()
+        self.broken = False
+        self.last_used = time.monotonic()
+
+    def _wake(self):
+        self._connection.ioloop.stop()
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, _connection, error):
+        self._error = error if isinstance(error, Exception) else pika.exceptions.AMQPConnectionError(error)
+        self._wake()
+
+    def _on_channel_open(self, channel):
+        self._opening = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.add_on_return_callback(self._on_return)
+        channel.confirm_delivery(ack_nack_callback=self._on_confirm, callback=self._on_confirm_selected)
+
+    def _on_confirm_selected(self, _frame):
+        self._channel = self._opening
+        self._wake()
+
+    def _on_channel_closed(self, _channel, reason):
+        self._error = reason
+        self._wake()
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        if method.multiple:
+            tags = [tag for tag in self._pending if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag]
+        for tag in tags:
+            index, _ = self._pending.pop(tag, (None, None))
+            if index is not None and isinstance(method, pika.spec.Basic.Nack):
+                self._failed.add(index)
+        if not self._pending:
+            self._wake()
+
+    def _on_return(self, _channel, _method, _properties, body):
+        # The broker sends basic.return before the ack of the same message.
+        for index, pending_body in self._pending.values():
+            if pending_body == body and index not in self._failed:
+                self._failed.add(index)
+                return
+
+    def _run(self, done, timeout):
+        """Runs the I/O loop until ``done()``, a connection error or ``timeout`` seconds."""
+        ioloop = self._connection.ioloop
+        deadline = time.monotonic() + timeout
+        timer = ioloop.call_later(timeout, ioloop.stop)
+        try:
+            while not done() and self._error is None and time.monotonic() < deadline:
+                ioloop.start()
+        finally:
+            ioloop.remove_timeout(timer)
+        if self._error is not None:
+            raise self._error
+
+    def open(self, timeout):
+        self._run(lambda: self._channel is not None, timeout)
+        if self._channel is None:
+            raise pika.exceptions.AMQPConnectionError('Canal de confirmação não abriu a tempo.')
+
+    def publish_window(self, messages, timeout):
+        """Publishes ``(index, routing_key, body, properties)`` messages, then waits for their confirms.
+
+        Returns:
+            set: indexes nacked, returned, unpublished or still unconfirmed
+            after ``timeout`` seconds. None of them is republished.
+        """
+        self._failed = set()
+        unpublished = [index for index, _, _, _ in messages]
+        try:
+            for index, routing_key, body, properties in messages:
+                body = body.encode('utf-8') if isinstance(body, str) else body
+                self._channel.basic_publish(
+                    exchange='',
+                    routing_key=routing_key,
+                    body=body,
+                    properties=properties,
+                    mandatory=True,
+                )
+                self._delivery_tag += 1
+                self._pending[self._delivery_tag] = (index, body)
+                unpublished.remove(index)
+            self._run(lambda: not self._pending, timeout)
+        except (pika.exceptions.AMQPError, OSError):
+            self.broken = True
+        # Late confirms of timed-out messages find no pending tag and are ignored.
+        failed = self._failed | {index for index, _ in self._pending.values()} | set(unpublished)
+        self._pending = {}
+        self.last_used = time.monotonic()
+        return failed
+
+    def close(self):
+        if self._connection.is_closed or self._connection.is_closing:
+            return
+        try:
+            self._connection.close()
+            self._run(lambda: self._connection.is_closed, 1)
+        except Exception:
+            pass
+
+
+class RabbitMQPublisher:
+    """Long-lived publishing connections, shared by every thread of one process.
+
+    pika's ``BlockingConnection`` is not thread-safe, so publishes are
+    serialized by a lock; each one only costs a frame write instead of a full
+    AMQP handshake. Bulk publishes (``publish_many``) use a second connection
+    and lock of their own, so a transactional ``publish`` never waits behind
+    a bulk batch. Instances are per process: after a fork (gunicorn preload)
+    the child drops the inherited publishers and opens its own connections on
+    first use. A connection that failed, or that stayed idle past its
+    heartbeat interval, is reopened and the publish retried once.
+    """
+
+    _instances = {}
+    _instances_lock = Lock()
+
+    def __init__(self, url, heartbeat=None):
+        self.url = url
+        self.heartbeat = heartbeat
+        self._pid = os.getpid()
+        self._lock = Lock()
+        self._connection = None
+        self._channel = None
+        self._last_used = 0.0
+        self._bulk_lock = Lock()
+        self._bulk = None
+
+    @classmethod
+    def for_url(cls, url, heartbeat=None):
+        """Returns this process' publisher for ``url``, creating it if needed."""
+        key = (url, heartbeat)
+        with cls._instances_lock:
+            publisher = cls._instances.get(key)
+            if publisher is None or publisher._pid != os.getpid():
+                publisher = cls(url, heartbeat=heartbeat)
+                cls._instances[key] = publisher
+            return publisher
+
+    @classmethod
+    def for_app(cls):
+        return cls.for_url(
+            current_app.config.get('RABBITMQ_URL'),
+            heartbeat=current_app.config.get('RABBITMQ_HEARTBEAT_SECONDS'),
+        )
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # The child shares the parent's sockets: forget them without closing,
+        # and replace locks a parent thread may have been holding at fork time.
+        cls._instances = {}
+        cls._instances_lock = Lock()
+
+    def _parameters(self):
+        params = pika.URLParameters(self.url)
+        if self.heartbeat is not None:
+            params.heartbeat = self.heartbeat
+        return params
+
+    def _ensure_channel(self):
+        idle_limit = self.heartbeat or 0
+        if self._channel is not None and idle_limit and time.monotonic() - self._last_used > idle_limit:
+            # The broker has likely dropped a connection that missed its heartbeats.
+            self._discard()
+        if self._channel is None or not self._channel.is_open:
+            self._discard()
+            self._connection = pika.BlockingConnection(self._parameters())
+            self._channel = self._connection.channel()
+        return self._channel
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._connection = self._channel = self._bulk = None
+            self._pid = os.getpid()
+
+    def _discard(self):
+        connection, self._connection, self._channel = self._connection, None, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def publish(self, routing_key, body, properties=None, exchange=''):
+        """Publishes one message, reconnecting once if the connection went away."""
+        with self._lock, metrics.timer('email_publish_seconds', mode='single'):
+            self._check_pid()
+            for attempt in range(2):
+                try:
+                    channel = self._ensure_channel()
+                    # Handles pending heartbeats and broker frames without blocking.
+                    self._connection.process_data_events(time_limit=0)
+                    channel.basic_publish(
+                        exchange=exchange,
+                        routing_key=routing_key,
+                        body=body,
+                        properties=properties,
+                    )
+                    self._last_used = time.monotonic()
+                    metrics.increment('email_published', queue=routing_key, outcome='ok')
+                    return
+                except (pika.exceptions.AMQPError, OSError):
+                    self._discard()
+                    if attempt:
+                        metrics.increment('email_published', queue=routing_key, outcome='failed')
+                        raise
+
+    def _ensure_bulk_channel(self, timeout):
+        idle_limit = self.heartbeat or 0
+        if self._bulk is not None and (
+            self._bulk.broken or (idle_limit and time.monotonic() - self._bulk.last_used > idle_limit)
+        ):
+            self._discard_bulk()
+        if self._bulk is None:
+            bulk = _BulkConfirmChannel(self._parameters())
+            try:
+                bulk.open(timeout)
+            except Exception:
+                bulk.close()
+                raise
+            self._bulk = bulk
+        return self._bulk
+
+    def _discard_bulk(self):
+        bulk, self._bulk = self._bulk, None
+        if bulk is not None:
+            bulk.close()
+
+    def _publish_window(self, batch, timeout):
+        # Nothing of this window is published yet, so a dead connection can be reopened safely once.
+        for attempt in range(2):
+            try:
+                bulk = self._ensure_bulk_channel(timeout)
+                break
+            except (pika.exceptions.AMQPError, OSError):
+                self._discard_bulk()
+                if attempt:
+                    return {index for index, _, _, _ in batch}
+        failed = bulk.publish_window(batch, timeout)
+        if bulk.broken:
+            self._discard_bulk()
+        return failed
+
+    def publish_many(self, messages, window=100, timeout=10):
+        """Publishes ``(routing_key, body, properties)`` messages with publisher confirms.
+
+        Messages are sent in windows of ``window``; after each window the
+        publisher waits up to ``timeout`` seconds for the broker's confirms.
+        A message nacked, returned as unroutable, left unconfirmed, or lost to
+        a dropped connection is reported as failed and never republished, so
+        nothing is sent twice.
+
+        Returns:
+            set: indexes (in ``messages`` order) of the messages that failed.
+        """
+        messages = list(messages)
+        window = max(int(window or 1), 1)
+        failed = set()
+        with self._bulk_lock, metrics.timer('email_publish_seconds', mode='batch'):
+            self._check_pid()
+            for start in range(0, len(messages), window):
+                batch = [
+                    (start + offset, routing_key, body, properties)
+                    for offset, (routing_key, body, properties) in enumerate(messages[start:start + window])
+                ]
+                failed.update(self._publish_window(batch, timeout))
+        for index, (routing_key, _, _) in enumerate(messages):
+            metrics.increment('email_published', queue=routing_key, outcome='failed' if index in failed else 'ok')
+        return failed
+
+    def close(self):
+        with self._lock:
+            self._discard()
+        with self._bulk_lock:
+            self._discard_bulk()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=RabbitMQPublisher._reset_after_fork)
+
 
 class NotificationService:
     """Service layer for publishing notification events to RabbitMQ.
-    
-    This service acts as a producer, sending structured messages to the
-    'email_queue' for asynchronous processing by background workers.
+
+    This service acts as a producer, sending structured messages for
+    asynchronous processing by background workers. Interactive mail (password
+    resets, enrollment and presence confirmations) goes to the
+    'email_transactional' lane, which workers serve ahead of the bulk
+    'email_queue' used by certificate batches and broadcasts.
     """
-    def _get_channel(self):
-        """Internal helper to establish a RabbitMQ connection and channel.
-        
+
+    QUEUE_NAME = 'email_queue'
+    TRANSACTIONAL_QUEUE_NAME = 'email_transactional'
+    PRIORITY_TRANSACTIONAL = 'transactional'
+    PRIORITY_BULK = 'bulk'
+    # Work queues consumed by the workers, highest priority first.
+    LANES = (TRANSACTIONAL_QUEUE_NAME, QUEUE_NAME)
+    # Payload 'type' of one e-mail sent to a recipient list in BCC chunks.
+    BROADCAST_TYPE = 'broadcast'
+    # Coalesce-key kind of enrollment confirmations merged into one digest.
+    ENROLLMENT_DIGEST = 'enrollment'
+    DLQ_NAME = 'email_dlq'
+    # Header carrying how many retry tiers a message already went through.
+    ATTEMPT_HEADER = 'x-retry-attempt'
+    LAST_ERROR_HEADER = 'x-last-error'
+    # Publish time (epoch seconds); workers measure queue dwell from it.
+    PUBLISHED_AT_HEADER = 'x-published-at'
+
+    def _get_publisher(self):
+        """Internal helper returning the process-wide RabbitMQ publisher.
+
         Note: We don't declare the queue here because the worker already declares it
         with DLQ support. Producers should only publish, not manage queue configuration.
         """
-        url = current_app.config.get('RABBITMQ_URL')
-        params = pika.URLParameters(url)
-        connection = pika.BlockingConnection(params)
-        channel = connection.channel()
-        # Don't declare queue - worker handles it with DLQ support
-        return connection, channel
+        return RabbitMQPublisher.for_app()
+
+    @classmethod
+    def queue_for(cls, priority):
+        """Returns the work queue of a priority; anything but 'bulk' is transactional."""
+        return cls.QUEUE_NAME if priority == cls.PRIORITY_BULK else cls.TRANSACTIONAL_QUEUE_NAME
+
+    @staticmethod
+    def _build_payload(
+        to_email: str,
+        subject: str,
+        body: str = None,
+        attachment_path: str = None,
+        template_name: str = None,
+        template_data: dict = None,
+        idempotency_key: str = None,
+    ):
+        return {
+            'to': to_email,
+            'subject': subject,
+            'body': body,
+            'attachment': attachment_path,
+            'template_name': template_name,
+            'template_data': template_data or {},
+            'idempotency_key': idempotency_key,
+        }
+
+    @staticmethod
+    def build_idempotency_key(kind, reference, recipient, send_id=None):
+        """Builds the dedupe key workers use to send one e-mail only once, e.g.
+        ``build_idempotency_key('certificate', cert_hash, email, job_id)``; None without a reference.
+
+        ``send_id`` scopes the key to one send (a batch job, a resend request):
+        redeliveries and replays of that send are skipped, while a deliberate
+        re-send gets a new key and is mailed again.
+        """
+        if not reference or not recipient:
+            return None
+        key = f"{kind}:{reference}:{recipient.strip().lower()}"
+        return f"{key}:{send_id}" if send_id else key
+
+    @classmethod
+    def _message_properties(cls):
+        return pika.BasicProperties(
+            delivery_mode=2,  # Make message persistent
+            content_type='application/json',
+            headers={cls.PUBLISHED_AT_HEADER: time.time()},
+        )
 
     def send_email_task(
         self,
@@ -29,12 +413,16 @@ class NotificationService:
         attachment_path: str = None,
         template_name: str = None,
         template_data: dict = None,
+        priority: str = PRIORITY_TRANSACTIONAL,
+        idempotency_key: str = None,
     ):
-        """Publishes an email notification task to the RabbitMQ 'email_queue'.
-        
-        This method handles connection setup, message structure, and persistence.
-        It uses the delivery_mode=2 to ensure messages survive a RabbitMQ restart.
-        
+        """Publishes an email notification task to RabbitMQ.
+
+        This method handles message structure and persistence over the shared
+        per-process connection. It uses the delivery_mode=2 to ensure messages
+        survive a RabbitMQ restart. Single sends are interactive by default and
+        go to the transactional lane.
+
         Args:
             to_email (str): Recipient email address.
             subject (str): Email subject line.
@@ -42,37 +430,380 @@ class NotificationService:
             attachment_path (str, optional): Absolute path to a file to be attached.
             template_name (str, optional): Template filename to render in worker.
             template_data (dict, optional): Context used to render the template.
-            
+            priority (str, optional): 'transactional' (default) or 'bulk'.
+            idempotency_key (str, optional): Workers skip a key already sent
+                (see ``build_idempotency_key``), so retries never mail twice.
+
         Returns:
             bool: True if the task was published successfully, False otherwise.
         """
-        connection = None
         try:
-            connection, channel = self._get_channel()
-            
-            payload = {
-                'to': to_email,
-                'subject': subject,
-                'body': body,
-                'attachment': attachment_path,
-                'template_name': template_name,
-                'template_data': template_data or {},
-            }
-            
-            channel.basic_publish(
-                exchange='',
-                routing_key='email_queue',
+            payload = self._build_payload(
+                to_email,
+                subject,
+                body=body,
+                attachment_path=attachment_path,
+                template_name=template_name,
+                template_data=template_data,
+                idempotency_key=idempotency_key,
+            )
+
+            self._get_publisher().publish(
+                routing_key=self.queue_for(priority),
                 body=json.dumps(payload),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # Make message persistent
-                    content_type='application/json'
-                )
+                properties=self._message_properties(),
             )
             return True
-        except Exception as e:
-            # In a production app, we would use a logger (e.g., app.logger.error)
-            print(f"CRITICAL: Failed to publish to RabbitMQ: {e}")
+        except Exception:
+            current_app.logger.exception('Falha ao publicar e-mail no RabbitMQ (%s)', to_email)
             return False
+
+    def enqueue_email_task(
+        self,
+        to_email: str,
+        subject: str,
+        body: str = None,
+        attachment_path: str = None,
+        template_name: str = None,
+        template_data: dict = None,
+        priority: str = PRIORITY_TRANSACTIONAL,
+        idempotency_key: str = None,
+        coalesce_key: str = None,
+    ):
+        """Adds an email task to the notification outbox in the current session.
+
+        Nothing is committed or published here: the row commits together with
+        the caller's business change (or is discarded with its rollback), and
+        the outbox relay publishes it afterwards, so request handlers never
+        wait on the broker. Takes the same arguments as ``send_email_task``.
+
+        Tasks with a ``coalesce_key`` (``<kind>:<scope>:<recipient>``) are held
+        for ``NOTIFICATION_DIGEST_WINDOW_SECONDS``; every task queued under
+        the same key meanwhile joins that window and they are sent as one
+        digest (see ``_coalesce``).
+
+        Returns:
+            NotificationOutbox: The pending outbox row.
+        """
+        available_at = None
+        window = current_app.config.get('NOTIFICATION_DIGEST_WINDOW_SECONDS', 0) if coalesce_key else 0
+        if window > 0:
+            now = datetime.utcnow()
+            # Must not flush the caller's pending changes (e.g. an enrollment still to be validated).
+            with db.session.no_autoflush:
+                open_window = db.session.execute(
+                    select(NotificationOutbox.available_at)
+                    .where(NotificationOutbox.coalesce_key == coalesce_key, NotificationOutbox.available_at > now)
+                    .order_by(NotificationOutbox.available_at.desc())
+                    .limit(1)
+                ).scalar()
+            available_at = open_window or now + timedelta(seconds=window)
+        else:
+            coalesce_key = None
+
+        entry = NotificationOutbox(
+            queue=self.queue_for(priority),
+            coalesce_key=coalesce_key,
+            available_at=available_at,
+            payload_json=json.dumps(self._build_payload(
+                to_email,
+                subject,
+                body=body,
+                attachment_path=attachment_path,
+                template_name=template_name,
+                template_data=template_data,
+                idempotency_key=idempotency_key,
+            )),
+        )
+        db.session.add(entry)
+        return entry
+
+    def relay_outbox(self, batch_size=None):
+        """Publishes one batch of pending outbox rows with publisher confirms.
+
+        Rows are claimed with ``FOR UPDATE SKIP LOCKED`` (on PostgreSQL) and
+        leased for ``NOTIFICATION_OUTBOX_CLAIM_SECONDS`` in one short
+        transaction, which commits before anything is published: the row
+        locks never wait on the broker, and several relays can run side by
+        side. Rows held for a digest window are skipped until it closes; rows
+        of the same window are then published as one message. Confirmed rows
+        are deleted; the others are released with ``attempts`` and
+        ``last_error`` updated and are retried by the next batch. Delivery is
+        at-least-once: rows of a relay that died mid-batch are published again
+        once their lease expires.
+
+        Returns:
+            tuple: (published, failed) row counts; (0, 0) when the outbox is empty.
+        """
+        table = NotificationOutbox.__table__
+        batch_size = batch_size or current_app.config.get('NOTIFICATION_OUTBOX_BATCH_SIZE', 500)
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.queue, table.c.payload_json, table.c.coalesce_key)
+                .where(
+                    or_(table.c.available_at.is_(None), table.c.available_at <= now),
+                    or_(table.c.claimed_until.is_(None), table.c.claimed_until <= now),
+                )
+                .order_by(table.c.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                return 0, 0
+            lease = timedelta(seconds=current_app.config.get('NOTIFICATION_OUTBOX_CLAIM_SECONDS', 300))
+            conn.execute(
+                update(table)
+                .where(table.c.id.in_([row.id for row in rows]))
+                .values(claimed_until=now + lease)
+            )
+
+        messages = self._coalesce(rows)
+        properties = self._message_properties()
+        error = 'Mensagem não confirmada pelo broker.'
+        try:
+            failed = self._get_publisher().publish_many(
+                [(queue, body, properties) for _, queue, body in messages],
+                window=current_app.config.get('RABBITMQ_CONFIRM_WINDOW', 100),
+                timeout=current_app.config.get('RABBITMQ_CONFIRM_TIMEOUT_SECONDS', 10),
+            )
+        except Exception as e:
+            failed = set(range(len(messages)))
+            error = str(e)
+
+        published_ids, failed_ids = [], []
+        for index, (ids, _, _) in enumerate(messages):
+            (failed_ids if index in failed else published_ids).extend(ids)
+        with db.engine.begin() as conn:
+            if published_ids:
+                conn.execute(delete(table).where(table.c.id.in_(published_ids)))
+            if failed_ids:
+                conn.execute(
+                    update(table)
+                    .where(table.c.id.in_(failed_ids))
+                    .values(attempts=table.c.attempts + 1, last_error=error[:500], claimed_until=None)
+                )
+        return len(published_ids), len(failed_ids)
+
+    def _coalesce(self, rows):
+        """Groups outbox rows into ``(row ids, queue, body)`` messages.
+
+        Rows sharing a coalesce key become one digest; the rest are sent as
+        they were queued.
+        """
+        groups = {}
+        messages = []
+        for row in rows:
+            if row.coalesce_key:
+                group = groups.get(row.coalesce_key)
+                if group is None:
+                    group = groups[row.coalesce_key] = ([], row.queue, [])
+                    messages.append(group)
+                group[0].append(row.id)
+                group[2].append(row.payload_json)
+            else:
+                messages.append(([row.id], row.queue, row.payload_json))
+
+        coalesced = []
+        for ids, queue, body in messages:
+            if isinstance(body, list):
+                body = body[0] if len(body) == 1 else json.dumps(
+                    self._enrollment_digest([json.loads(item) for item in body])
+                )
+            coalesced.append((ids, queue, body))
+        return coalesced
+
+    def _enrollment_digest(self, payloads):
+        """Merges enrollment confirmations of one event and recipient into a digest payload."""
+        first = payloads[0].get('template_data') or {}
+        activities = []
+        for payload in payloads:
+            data = payload.get('template_data') or {}
+            activities.append({
+                'activity_name': data.get('activity_name') or payload.get('subject'),
+                'activity_date': data.get('activity_date') or data.get('event_date'),
+                'event_time': data.get('event_time'),
+                'event_location': data.get('event_location'),
+            })
+        return self._build_payload(
+            payloads[0]['to'],
+            f"Inscrições Confirmadas: {first.get('event_name')}",
+            template_name='enrollment_digest.html',
+            template_data={
+                'user_name': first.get('user_name'),
+                'event_name': first.get('event_name'),
+                'event_date': first.get('event_date'),
+                'event_details_url': first.get('event_details_url'),
+                'my_events_url': first.get('my_events_url'),
+                'activities': activities,
+            },
+        )
+
+    def send_email_tasks(self, tasks, priority: str = PRIORITY_BULK):
+        """Publishes many email tasks over one confirm-mode channel.
+
+        Bulk senders use this instead of calling ``send_email_task`` in a loop:
+        messages go out in windows of ``RABBITMQ_CONFIRM_WINDOW`` and each one
+        counts as queued only once the broker confirmed it.
+
+        Args:
+            tasks (iterable of dict): Keyword arguments of ``send_email_task``.
+            priority (str, optional): Lane of the whole batch, 'bulk' by default.
+
+        Returns:
+            list[bool]: One entry per task, True if the broker confirmed it.
+        """
+        tasks = list(tasks)
+        if not tasks:
+            return []
+
+        properties = self._message_properties()
+        queue = self.queue_for(priority)
+        try:
+            failed = self._get_publisher().publish_many(
+                [(queue, json.dumps(self._build_payload(**task)), properties) for task in tasks],
+                window=current_app.config.get('RABBITMQ_CONFIRM_WINDOW', 100),
+                timeout=current_app.config.get('RABBITMQ_CONFIRM_TIMEOUT_SECONDS', 10),
+            )
+        except Exception:
+            current_app.logger.exception('Falha ao publicar %s e-mails no RabbitMQ', len(tasks))
+            return [False] * len(tasks)
+        return [index not in failed for index in range(len(tasks))]
+
+    @classmethod
+    def _dead_letter_origin(cls, headers):
+        """Returns the lane a dead-lettered message came from (from its x-death header)."""
+        for death in (headers or {}).get('x-death') or []:
+            queue = death.get('queue')
+            if isinstance(queue, bytes):
+                queue = queue.decode()
+            if queue in cls.LANES:
+                return queue
+        return cls.QUEUE_NAME
+
+    def send_broadcast_task(
+        self,
+        recipients,
+        subject: str,
+        body: str = None,
+        template_name: str = None,
+        template_data: dict = None,
+        priority: str = PRIORITY_BULK,
+    ):
+        """Publishes one e-mail for many recipients as a single broadcast task.
+
+        The body is rendered once for everyone; workers send it in chunks of
+        ``EMAIL_BROADCAST_BCC_LIMIT`` envelope (BCC) recipients, so a large
+        announcement costs a few SMTP transactions instead of one per person.
+        Each chunk gets its own idempotency key, so a retried broadcast skips
+        the chunks already sent.
+
+        Args:
+            recipients (iterable of str): E-mail addresses; duplicates are dropped.
+
+        Returns:
+            int: Number of recipients queued (0 if the broker did not confirm).
+        """
+        unique = {}
+        for email in recipients:
+            email = (email or '').strip()
+            if email:
+                unique.setdefault(email.lower(), email)
+        if not unique:
+            return 0
+
+        payload = self._build_payload(
+            None,
+            subject,
+            body=body,
+            template_name=template_name,
+            template_data=template_data,
+            idempotency_key=f"{self.BROADCAST_TYPE}:{uuid4().hex}",
+        )
+        payload['type'] = self.BROADCAST_TYPE
+        payload['bcc'] = list(unique.values())
+        try:
+            failed = self._get_publisher().publish_many(
+                [(self.queue_for(priority), json.dumps(payload), self._message_properties())],
+                timeout=current_app.config.get('RABBITMQ_CONFIRM_TIMEOUT_SECONDS', 10),
+            )
+        except Exception:
+            current_app.logger.exception('Falha ao publicar comunicado para %s destinatários no RabbitMQ', len(unique))
+            return 0
+        return 0 if failed else len(unique)
+
+    def replay_dead_letters(self, limit=None):
+        """Moves messages from 'email_dlq' back to their lane with a fresh retry budget.
+
+        Only the messages present when the replay starts are moved, so messages
+        that fail again meanwhile are not replayed in a loop. Each message is
+        acked on the DLQ only after the broker confirmed its republish.
+
+        Returns:
+            int: Number of messages replayed.
+        """
+        connection = pika.BlockingConnection(pika.URLParameters(current_app.config.get('RABBITMQ_URL')))
+        try:
+            channel = connection.channel()
+            pending = channel.queue_declare(queue=self.DLQ_NAME, durable=True, passive=True).method.message_count
+            if limit is not None:
+                pending = min(pending, limit)
+            channel.confirm_delivery()
+
+            replayed = 0
+            while replayed < pending:
+                method, properties, body = channel.basic_get(queue=self.DLQ_NAME)
+                if method is None:
+                    break
+                headers = {
+                    key: value
+                    for key, value in (properties.headers or {}).items()
+                    # The original publish time would count the time spent in the DLQ as dwell.
+                    if key not in (self.ATTEMPT_HEADER, self.LAST_ERROR_HEADER, self.PUBLISHED_AT_HEADER, 'x-death')
+                }
+                try:
+                    channel.basic_publish(
+                        exchange='',
+                        routing_key=self._dead_letter_origin(properties.headers),
+                        body=body,
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,
+                            content_type=properties.content_type or 'application/json',
+                            headers=headers or None,
+                        ),
+                    )
+                except pika.exceptions.NackError:
+                    channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                    break
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+                metrics.increment('email_dlq_replayed')
+                replayed += 1
+            return replayed
+        finally:
+            if connection.is_open:
+                connection.close()
+
+    def queue_depths(self):
+        """Returns the ready-message count of each lane and of the DLQ.
+
+        Read with passive declares on a short-lived connection, so the admin
+        metrics show queue lag and DLQ growth without the management UI.
+
+        Returns:
+            dict: ``{queue: count}``; None for a queue that does not exist yet.
+        """
+        connection = pika.BlockingConnection(pika.URLParameters(current_app.config.get('RABBITMQ_URL')))
+        try:
+            channel = connection.channel()
+            depths = {}
+            for queue in (*self.LANES, self.DLQ_NAME):
+                try:
+                    depths[queue] = channel.queue_declare(queue=queue, durable=True, passive=True).method.message_count
+                except pika.exceptions.ChannelClosedByBroker:
+                    # A missing queue closes the channel (404).
+                    depths[queue] = None
+                    channel = connection.channel()
+            return depths
         finally:
-            if connection and not connection.is_closed:
+            if connection.is_open:
                 connection.close()
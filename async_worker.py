@@ -0,0 +1,385 @@
+import asyncio
+import json
+from functools import partial
+import os
+import sys
+import time
+import logging
+
+import aio_pika
+import aiosmtplib
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# App imports come after load_dotenv() and the sys.path setup above.
+from worker import (  # noqa: E402
+    DEFAULT_SENDER,
+    EMAIL_RETRY_DELAYS,
+    RABBITMQ_URL,
+    WORKER_METRICS_HOST,
+    WORKER_METRICS_PORT,
+    SMTP_MAX_MESSAGES_PER_CONNECTION,
+    SMTP_NOOP_AFTER_SECONDS,
+    SMTP_PASSWORD,
+    SMTP_PORT,
+    SMTP_SERVER,
+    SMTP_USERNAME,
+    begin_delivery,
+    broadcast_chunks,
+    build_email_body,
+    build_message,
+    deduplicator,
+    is_retryable,
+    message_lane,
+    observe_dwell,
+    precompile_templates,
+    rate_limiter,
+    retry_headers,
+    retry_queue_name,
+    retry_target,
+)
+from app.services.email_metrics_service import metrics, start_metrics_server  # noqa: E402
+from app.services.notification_service import NotificationService  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+"""
+asyncio e-mail worker for EuroEventos.
+Alternative to worker.py: consumes the same 'email_transactional' and
+'email_queue' lanes (same payload and dlx_exchange/email_dlq topology) with aio-pika and sends through aiosmtplib,
+so one process keeps hundreds of deliveries in flight while SMTP replies are
+awaited.
+"""
+
+# Unacked deliveries one process handles at once; each one is an asyncio task.
+ASYNC_WORKER_PREFETCH = max(int(os.environ.get('ASYNC_WORKER_PREFETCH', 200)), 1)
+# Separate window for the transactional lane, consumed on its own channel.
+ASYNC_TRANSACTIONAL_PREFETCH = max(int(os.environ.get('ASYNC_TRANSACTIONAL_PREFETCH', 20)), 1)
+# Logged-in SMTP sessions shared by those deliveries.
+ASYNC_SMTP_POOL_SIZE = max(int(os.environ.get('ASYNC_SMTP_POOL_SIZE', 8)), 1)
+
+
+class AsyncSMTPConnectionPool:
+    """
+    asyncio counterpart of ``worker.SMTPConnectionPool``.
+
+    Same policies: idle sessions are checked with NOOP, sessions are closed
+    after ``max_messages`` messages, and a transient failure (4xx, including
+    421, or a dropped session) is retried once on a fresh session.
+    """
+
+    def __init__(self, host, port, username, password, size=8, max_messages=100,
+                 noop_after=30, factory=aiosmtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.max_messages = max_messages
+        self.noop_after = noop_after
+        self.factory = factory
+        self._idle = []
+        self._slots = None
+
+    def _semaphore(self):
+        # Created lazily so it binds to the running event loop.
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        return self._slots
+
+    async def _connect(self):
+        server = self.factory(hostname=self.host, port=self.port)
+        await server.connect()
+        await server.login(self.username, self.password)
+        logger.info(f"Opened async SMTP session to {self.host}:{self.port}")
+        return {'server': server, 'sent': 0, 'last_used': time.monotonic()}
+
+    @staticmethod
+    async def _close(session):
+        try:
+            await session['server'].quit()
+        except Exception:
+            session['server'].close()
+
+    async def _is_healthy(self, session):
+        if time.monotonic() - session['last_used'] <= self.noop_after:
+            return True
+        try:
+            response = await session['server'].noop()
+        except (aiosmtplib.SMTPException, OSError):
+            return False
+        return response.code == 250
+
+    async def _acquire(self):
+        while self._idle:
+            session = self._idle.pop()
+            if await self._is_healthy(session):
+                return session
+            await self._close(session)
+        return await self._connect()
+
+    async def _release(self, session):
+        if session['sent'] >= self.max_messages:
+            await self._close(session)
+        else:
+            session['last_used'] = time.monotonic()
+            self._idle.append(session)
+
+    @staticmethod
+    def _is_transient(error):
+        if isinstance(error, aiosmtplib.SMTPResponseException):
+            return 400 <= error.code < 500
+        return isinstance(error, (aiosmtplib.SMTPServerDisconnected, OSError))
+
+    async def send(self, from_addr, to_addrs, message):
+        async with self._semaphore():
+            for attempt in range(2):
+                session = None
+                try:
+                    session = await (self._connect() if attempt else self._acquire())
+                    await session['server'].sendmail(from_addr, to_addrs, message)
+                except Exception as e:
+                    if session is not None:
+                        await self._close(session)
+                    if attempt or not self._is_transient(e):
+                        raise
+                    logger.warning(f"SMTP session failed ({e}); retrying on a new session")
+                    continue
+                session['sent'] += 1
+                await self._release(session)
+                return
+
+    async def close(self):
+        while self._idle:
+            await self._close(self._idle.pop())
+
+
+smtp_pool = AsyncSMTPConnectionPool(
+    SMTP_SERVER,
+    SMTP_PORT,
+    SMTP_USERNAME,
+    SMTP_PASSWORD,
+    size=ASYNC_SMTP_POOL_SIZE,
+    max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION,
+    noop_after=SMTP_NOOP_AFTER_SECONDS,
+)
+
+
+async def send_email(to, subject, body, attachment_path=None, bcc=None):
+    """Sends one email through the async SMTP pool (or simulates it without credentials).
+
+    With ``bcc``, those are the envelope recipients and ``to`` is only the visible header.
+    """
+    # Reading the attachment is blocking file I/O: keep it off the event loop.
+    msg = await asyncio.to_thread(build_message, to, subject, body, attachment_path)
+    recipients = list(bcc) if bcc else [to]
+
+    if SMTP_USERNAME and SMTP_PASSWORD:
+        try:
+            delay = await asyncio.to_thread(rate_limiter.reserve, DEFAULT_SENDER, None if bcc else to)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            with metrics.timer('email_smtp_seconds'):
+                await smtp_pool.send(DEFAULT_SENDER, recipients, msg.as_string())
+            metrics.increment('email_sent', outcome='ok')
+            logger.info(f"Email successfully sent to {to if not bcc else f'{len(recipients)} BCC recipients'}")
+        except Exception as e:
+            metrics.increment('email_sent', outcome='error')
+            logger.error(f"Failed to send email: {e}")
+            raise
+    else:
+        # Simulation mode for development
+        logger.info("Simulation mode: Email would be sent (no SMTP credentials configured)")
+        await asyncio.sleep(1)  # Simulate network delay
+        logger.info(f"[SIMULATION] Email successfully prepared for {to}")
+
+
+def is_retryable_async(error):
+    """``worker.is_retryable`` for aiosmtplib errors, which do not subclass smtplib's."""
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return False
+    return is_retryable(error)
+
+
+async def schedule_retry(exchange, message, error):
+    """Publishes a failed message to its lane's next retry tier; returns False once retries are exhausted."""
+    target = retry_target(
+        message.headers,
+        error,
+        retryable=is_retryable_async,
+        lane=message_lane(getattr(message, 'routing_key', None)),
+    )
+    if not target or exchange is None:
+        return False
+    queue, delay, attempt = target
+    await exchange.publish(
+        aio_pika.Message(
+            message.body,
+            content_type='application/json',
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            headers=retry_headers(message.headers, attempt, error),
+            expiration=delay,
+        ),
+        routing_key=queue,
+    )
+    logger.warning(f"Message scheduled for retry {attempt} in {delay}s")
+    return True
+
+
+async def send_broadcast(data):
+    """asyncio counterpart of ``worker.send_broadcast``: BCC chunks, skipping those already sent."""
+    body_content = build_email_body(data)
+    to = data.get('to') or DEFAULT_SENDER
+    for chunk_key, chunk in broadcast_chunks(data):
+        if not await asyncio.to_thread(begin_delivery, {'idempotency_key': chunk_key}):
+            continue
+        try:
+            await send_email(to, data['subject'], body_content, bcc=chunk)
+        except Exception:
+            await asyncio.to_thread(deduplicator.abort, chunk_key)
+            raise
+        await asyncio.to_thread(deduplicator.complete, chunk_key)
+
+
+async def handle_message(message, exchange=None):
+    """
+    Processes one delivery from either lane.
+    Failed messages go through the retry tiers (published on ``exchange``)
+    and are rejected to the DLQ (requeue=False) after the last one.
+    """
+    logger.info("Received notification task")
+    lane = message_lane(getattr(message, 'routing_key', None))
+    observe_dwell(getattr(message, 'headers', None), lane)
+    key = None
+    try:
+        data = json.loads(message.body)
+        if data.get('type') == NotificationService.BROADCAST_TYPE:
+            await send_broadcast(data)
+            await message.ack()
+            metrics.increment('email_processed', lane=lane, outcome='ok')
+            return
+        # The dedupe store may be Redis: keep its round-trips off the event loop.
+        if not await asyncio.to_thread(begin_delivery, data):
+            await message.ack()
+            metrics.increment('email_processed', lane=lane, outcome='ok')
+            return
+        key = data.get('idempotency_key')
+        body_content = build_email_body(data)
+        await send_email(
+            data['to'],
+            data['subject'],
+            body_content,
+            data.get('attachment')
+        )
+        await asyncio.to_thread(deduplicator.complete, key)
+    except Exception as e:
+        if key:
+            await asyncio.to_thread(deduplicator.abort, key)
+        logger.error(f"Error processing message: {e}")
+        try:
+            retried = await schedule_retry(exchange, message, e)
+        except Exception as retry_error:
+            logger.error(f"Failed to schedule retry: {retry_error}")
+            retried = False
+        if retried:
+            await message.ack()
+            metrics.increment('email_processed', lane=lane, outcome='retried')
+        else:
+            await message.reject(requeue=False)
+            metrics.increment('email_processed', lane=lane, outcome='dead_lettered')
+        return
+    await message.ack()
+    metrics.increment('email_processed', lane=lane, outcome='ok')
+
+
+async def declare_lane(connection, lane, prefetch):
+    """Declares one work queue and its retry tiers on a new channel; returns ``(channel, queue)``."""
+    channel = await connection.channel()
+    await channel.set_qos(prefetch_count=prefetch)
+
+    args = {
+        'x-dead-letter-exchange': 'dlx_exchange',
+        'x-dead-letter-routing-key': 'dlq_key'
+    }
+    try:
+        queue = await channel.declare_queue(lane, durable=True, arguments=args)
+    except aio_pika.exceptions.ChannelPreconditionFailed as e:
+        logger.warning(
+            f"{lane} exists with different arguments; using existing queue config. "
+            f"Broker error: {e}"
+        )
+        # Re-open channel after broker closes it on precondition failure.
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=prefetch)
+        queue = await channel.declare_queue(lane, durable=True)
+
+    # Retry tiers: expired messages dead-letter back into this lane.
+    for delay in sorted(set(EMAIL_RETRY_DELAYS)):
+        await channel.declare_queue(
+            retry_queue_name(delay, lane),
+            durable=True,
+            arguments={
+                'x-dead-letter-exchange': '',
+                'x-dead-letter-routing-key': lane,
+            },
+        )
+    return channel, queue
+
+
+async def declare_topology(connection):
+    """
+    Declares dlx_exchange/email_dlq, both lanes and their retry tiers exactly
+    like worker.py. Each lane gets its own channel and prefetch window, so the
+    broker keeps delivering transactional mail while the bulk window is full.
+
+    Returns:
+        list: ``(channel, queue)`` per lane, transactional first.
+    """
+    channel = await connection.channel()
+    dlx = await channel.declare_exchange('dlx_exchange', aio_pika.ExchangeType.DIRECT)
+    dlq = await channel.declare_queue('email_dlq', durable=True)
+    await dlq.bind(dlx, routing_key='dlq_key')
+    await channel.close()
+
+    prefetch = {
+        NotificationService.TRANSACTIONAL_QUEUE_NAME: ASYNC_TRANSACTIONAL_PREFETCH,
+        NotificationService.QUEUE_NAME: ASYNC_WORKER_PREFETCH,
+    }
+    return [await declare_lane(connection, lane, prefetch[lane]) for lane in NotificationService.LANES]
+
+
+async def main():
+    """
+    Main entry point for the async worker process.
+    Declares the queues and consumes until cancelled.
+    """
+    precompile_templates()
+    if WORKER_METRICS_PORT:
+        start_metrics_server(WORKER_METRICS_PORT, WORKER_METRICS_HOST)
+    connection = await aio_pika.connect_robust(RABBITMQ_URL)
+    try:
+        for channel, queue in await declare_topology(connection):
+            await queue.consume(partial(handle_message, exchange=channel.default_exchange))
+        logger.info(
+            f'EuroEventos async worker active (prefetch {ASYNC_WORKER_PREFETCH}, '
+            f'transactional {ASYNC_TRANSACTIONAL_PREFETCH}). '
+            'Waiting for messages. Press CTRL+C to stop.'
+        )
+        await asyncio.Future()
+    finally:
+        await smtp_pool.close()
+        await connection.close()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print('Interrupted')
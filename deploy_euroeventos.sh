@@ -4,6 +4,7 @@ set -euo pipefail
 
 PROJECT_DIR="/var/www/euroeventos"
 SERVICE_WORKER="euroeventos-worker"
+SERVICE_RELAY="euroeventos-outbox-relay"
 SERVICE_APP="euroeventos"
 
 echo "Iniciando atualização do projeto..."
@@ -22,6 +23,7 @@ cd "$PROJECT_DIR"
 
 git pull
 systemctl restart "$SERVICE_WORKER"
+systemctl restart "$SERVICE_RELAY"
 systemctl restart "$SERVICE_APP"
 
 echo "Atualização concluída com sucesso."
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""Add background jobs
+
+Revision ID: 3c8e5a2f7d14
+Revises: 7b2e1d4c9a0f
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e5a2f7d14'
+down_revision = '7b2e1d4c9a0f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'background_jobs',
+        sa.Column('job_id', sa.String(length=32), nullable=False),
+        sa.Column('job_type', sa.String(length=40), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=True),
+        sa.Column('created_by', sa.String(length=50), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('completed', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('resultado', sa.String(length=20), nullable=True),
+        sa.Column('message', sa.Text(), nullable=True),
+        sa.Column('details_json', sa.Text(), nullable=True),
+        sa.Column('total_rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('processed_rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('unchanged_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('errors_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_enviado', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sem_email', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('falha_fila', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('job_id'),
+    )
+    op.create_index(
+        'ix_background_jobs_lookup', 'background_jobs', ['job_type', 'created_by', 'completed'], unique=False
+    )
+    op.create_index('ix_background_jobs_entity', 'background_jobs', ['job_type', 'entity_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_background_jobs_entity', table_name='background_jobs')
+    op.drop_index('ix_background_jobs_lookup', table_name='background_jobs')
+    op.drop_table('background_jobs')
@@ -0,0 +1,30 @@
+"""Add notification outbox coalescing
+
+Revision ID: b5e1c7d2f9a3
+Revises: 9d3f6b2a8c51
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e1c7d2f9a3'
+down_revision = '9d3f6b2a8c51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notification_outbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('coalesce_key', sa.String(length=190), nullable=True))
+        batch_op.add_column(sa.Column('available_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_notification_outbox_coalesce', ['coalesce_key', 'available_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_notification_outbox_coalesce')
+        batch_op.drop_column('available_at')
+        batch_op.drop_column('coalesce_key')
@@ -0,0 +1,30 @@
+"""Add background job chunks
+
+Revision ID: c8f2d4a6b1e9
+Revises: b5e1c7d2f9a3
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f2d4a6b1e9'
+down_revision = 'b5e1c7d2f9a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'background_job_chunks',
+        sa.Column('job_id', sa.String(length=32), nullable=False),
+        sa.Column('chunk_id', sa.String(length=32), nullable=False),
+        sa.Column('counters_json', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('job_id', 'chunk_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('background_job_chunks')
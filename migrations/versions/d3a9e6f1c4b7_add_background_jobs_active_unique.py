@@ -0,0 +1,44 @@
+"""Add unique index on active background jobs
+
+Revision ID: d3a9e6f1c4b7
+Revises: c8f2d4a6b1e9
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a9e6f1c4b7'
+down_revision = 'c8f2d4a6b1e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the newest unfinished job per type/owner/entity before enforcing uniqueness.
+    op.execute(sa.text(
+        "UPDATE background_jobs SET completed = :done, status = 'error', resultado = 'erro', "
+        "message = 'Job duplicado encerrado.' "
+        "WHERE completed = :open AND EXISTS ("
+        "SELECT 1 FROM background_jobs newer "
+        "WHERE newer.job_type = background_jobs.job_type "
+        "AND coalesce(newer.entity_id, 0) = coalesce(background_jobs.entity_id, 0) "
+        "AND coalesce(newer.created_by, '') = coalesce(background_jobs.created_by, '') "
+        "AND newer.completed = :open "
+        "AND (newer.created_at > background_jobs.created_at "
+        "OR (newer.created_at = background_jobs.created_at AND newer.job_id > background_jobs.job_id)))"
+    ).bindparams(done=True, open=False))
+    op.create_index(
+        'uq_background_jobs_active',
+        'background_jobs',
+        ['job_type', sa.text('coalesce(entity_id, 0)'), sa.text("coalesce(created_by, '')")],
+        unique=True,
+        sqlite_where=sa.text('completed = 0'),
+        postgresql_where=sa.text('completed = false'),
+    )
+
+
+def downgrade():
+    op.drop_index('uq_background_jobs_active', table_name='background_jobs')
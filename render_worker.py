@@ -0,0 +1,238 @@
+import json
+import os
+import sys
+import logging
+
+import pika
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# App imports come after load_dotenv() and the sys.path setup above.
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import Event  # noqa: E402
+from app.services.certificate_queue_service import CertificateQueueService  # noqa: E402
+from app.services.certificate_service import CertificateService  # noqa: E402
+from app.services.event_team_certificate_service import EventTeamCertificateService  # noqa: E402
+from app.services.institutional_certificate_service import InstitutionalCertificateService  # noqa: E402
+from app.services.job_registry_service import JobRegistryService  # noqa: E402
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+"""
+Certificate render worker for EuroEventos.
+Consumes the 'certificate_render' queue filled by the batch send endpoints
+(CERTIFICATE_RENDER_QUEUE_ENABLED=true). A 'plan' task prepares a batch and
+splits it into 'chunk' tasks; each chunk renders its PDFs and publishes the
+e-mails to 'email_queue'. Run as many of these processes, on as many nodes,
+as rendering needs.
+"""
+
+app = create_app()
+# Each process renders one chunk at a time (prefetch_count=1) and scales by adding
+# processes, so it draws serially instead of starting a cpu_count render pool.
+app.config['CERTIFICATE_RENDER_PROCESSES'] = 1
+job_registry = JobRegistryService()
+
+
+def _prepare_event(entity_id):
+    return CertificateService().prepare_event_certificate_batch(entity_id)
+
+
+def _deliver_event(entity_id, ids, send_id):
+    event = db.session.get(Event, entity_id)
+    if not event:
+        return None
+    return CertificateService().deliver_event_certificates(event, ids, send_id=send_id)
+
+
+def _prepare_team_event(entity_id):
+    return EventTeamCertificateService().prepare_certificate_batch(entity_id)
+
+
+def _deliver_team_event(entity_id, ids, send_id):
+    event = db.session.get(Event, entity_id)
+    if not event:
+        return None
+    return EventTeamCertificateService().deliver_certificates(event, ids, send_id=send_id)
+
+
+def _prepare_institutional(entity_id):
+    return InstitutionalCertificateService().prepare_certificate_batch(entity_id)
+
+
+def _deliver_institutional(entity_id, ids, send_id):
+    _, _, summary = InstitutionalCertificateService().deliver_certificates(entity_id, ids, send_id=send_id)
+    return summary
+
+
+HANDLERS = {
+    'event': (_prepare_event, _deliver_event),
+    'team_event': (_prepare_team_event, _deliver_team_event),
+    'institutional': (_prepare_institutional, _deliver_institutional),
+}
+
+
+def _record_chunk(job_id, chunk_id, chunk_size, summary):
+    """Adds a chunk's results to the shared job; the last chunk to finish closes it.
+
+    A chunk replayed from the DLQ replaces the counts of its failed run and
+    closes the job again with the corrected totals.
+    """
+    first_run = job_registry.record_chunk(
+        job_id,
+        chunk_id,
+        processed_rows=chunk_size,
+        total_enviado=summary.get('total_enviado', 0),
+        sem_email=summary.get('sem_email', 0),
+        falha_fila=summary.get('falha_fila', 0),
+    )
+    if first_run and not job_registry.complete_if_done(job_id):
+        return
+
+    job = job_registry.get(job_id)
+    if not job or not job['completed']:
+        return
+    if job['total_enviado'] == 0 and job['falha_fila'] == 0:
+        job_registry.update(
+            job_id,
+            status='error',
+            resultado='erro',
+            message='Problema no envio: nenhum destinatário com e-mail válido.',
+        )
+        return
+    if job['total_enviado'] == 0:
+        job_registry.update(
+            job_id,
+            status='error',
+            resultado='erro',
+            message='Problema no envio: falha ao enfileirar e-mails.',
+        )
+        return
+    job_registry.update(
+        job_id,
+        status='completed',
+        resultado='sucesso',
+        message='Envio parcialmente concluído com falhas.' if job['falha_fila'] else 'Envio em lote concluído.',
+    )
+
+
+def process_task(channel, task):
+    """Runs one 'plan' or 'chunk' task inside the application context."""
+    kind = task.get('kind')
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown batch kind: {kind}")
+
+    prepare, deliver = HANDLERS[kind]
+    entity_id = task['entity_id']
+    job_id = task.get('job_id')
+
+    if task.get('task') == 'plan':
+        ids = prepare(entity_id)
+        chunks = CertificateQueueService.split(ids)
+        if job_id:
+            job_registry.update(
+                job_id,
+                status='running' if ids else 'error',
+                completed=not ids,
+                resultado=None if ids else 'erro',
+                total_rows=len(ids),
+                message=(
+                    'Gerando PDFs e enfileirando e-mails.' if ids
+                    else 'Problema no envio: nenhum destinatário com e-mail válido.'
+                ),
+            )
+        CertificateQueueService.publish_chunks(channel, kind, entity_id, job_id, chunks)
+        logger.info(f"Planned {kind} batch {entity_id} (job {job_id}): {len(ids)} recipients in {len(chunks)} chunks")
+        return
+
+    if task.get('task') == 'chunk':
+        ids = task.get('ids') or []
+        # Tasks published before chunks carried an id are identified by their first recipient.
+        chunk_id = task.get('chunk_id', f"id-{ids[0] if ids else 0}")
+        try:
+            # The job id scopes the idempotency keys: a replayed chunk is deduplicated, a new batch is not.
+            summary = deliver(entity_id, ids, job_id) or {'total_enviado': 0, 'sem_email': 0, 'falha_fila': len(ids)}
+        except Exception:
+            # The chunk goes to the DLQ; its rows count as failed (until a replay) so the job can complete.
+            if job_id:
+                db.session.rollback()
+                _record_chunk(job_id, chunk_id, len(ids), {'falha_fila': len(ids)})
+            raise
+        logger.info(f"Rendered {kind} chunk for {entity_id} (job {job_id}): {summary}")
+        if job_id:
+            _record_chunk(job_id, chunk_id, len(ids), summary)
+        return
+
+    raise ValueError(f"Unknown task type: {task.get('task')}")
+
+
+def callback(ch, method, properties, body):
+    """
+    Callback function executed when a render task is received from the queue.
+    Failed tasks are rejected to the render DLQ (requeue=False).
+    """
+    try:
+        task = json.loads(body)
+        with app.app_context():
+            try:
+                process_task(ch, task)
+            finally:
+                db.session.remove()
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except Exception as e:
+        logger.exception(f"Error processing render task: {e}")
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+
+def main():
+    """
+    Main entry point for the render worker process.
+    Declares the render queue (with its DLQ) and starts consuming tasks.
+    """
+    params = pika.URLParameters(app.config['RABBITMQ_URL'])
+    connection = pika.BlockingConnection(params)
+    channel = connection.channel()
+
+    channel.exchange_declare(exchange='dlx_exchange', exchange_type='direct')
+    channel.queue_declare(queue=CertificateQueueService.DLQ_NAME, durable=True)
+    channel.queue_bind(
+        exchange='dlx_exchange',
+        queue=CertificateQueueService.DLQ_NAME,
+        routing_key=CertificateQueueService.DLQ_ROUTING_KEY,
+    )
+    channel.queue_declare(
+        queue=CertificateQueueService.QUEUE_NAME,
+        durable=True,
+        arguments={
+            'x-dead-letter-exchange': 'dlx_exchange',
+            'x-dead-letter-routing-key': CertificateQueueService.DLQ_ROUTING_KEY,
+        },
+    )
+
+    # One task at a time per process: chunks are CPU-bound, scale by adding processes.
+    channel.basic_qos(prefetch_count=1)
+    channel.basic_consume(queue=CertificateQueueService.QUEUE_NAME, on_message_callback=callback)
+
+    logger.info('EuroEventos render worker active. Waiting for certificate tasks. Press CTRL+C to stop.')
+    channel.start_consuming()
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print('Interrupted')
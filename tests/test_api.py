@@ -1,4 +1,5 @@
 import json
+import os
 import re
 import subprocess
 import tempfile
@@ -24,6 +25,7 @@ from app.services.auth_service import AuthService
 from app.services.event_service import EventService
 from app.api import admin as admin_api
 from app.api import certificates as certificates_api
+from app.services import job_registry_service as job_registry_module
 
 
 def _assert_last_inline_script_is_valid_javascript(html):
@@ -919,6 +921,56 @@ def test_protected_api_returns_401_json_when_not_authenticated(client):
     assert res.get_json()['session_expired'] is True
 
 
+def test_admin_email_pipeline_metrics_merge_publisher_queues_and_workers(client, app, admin_user, monkeypatch):
+    from app.services.email_metrics_service import EmailMetrics, start_metrics_server
+
+    publisher_metrics = EmailMetrics()
+    publisher_metrics.increment('email_published', queue='email_queue', outcome='ok')
+    publisher_metrics.observe('email_publish_seconds', 0.02, mode='batch')
+    worker_metrics = EmailMetrics()
+    worker_metrics.increment('email_processed', lane='email_queue', outcome='dead_lettered')
+    monkeypatch.setattr(admin_api, 'email_metrics', publisher_metrics)
+    monkeypatch.setattr(
+        admin_api.NotificationService,
+        'queue_depths',
+        lambda self: {'email_transactional': 0, 'email_queue': 12, 'email_dlq': 3},
+    )
+
+    server = start_metrics_server(0, '127.0.0.1', registry=worker_metrics)
+    try:
+        worker_url = f'http://127.0.0.1:{server.server_address[1]}'
+        app.config['EMAIL_WORKER_METRICS_URLS'] = [worker_url, 'http://127.0.0.1:9']
+        _login_admin(client)
+        res = client.get('/api/admin/notificacoes/metricas')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert res.status_code == 200
+    data = res.get_json()
+    assert data['queues'] == {'email_transactional': 0, 'email_queue': 12, 'email_dlq': 3}
+    assert data['publisher']['counters'] == [
+        {'name': 'email_published', 'labels': {'outcome': 'ok', 'queue': 'email_queue'}, 'value': 1},
+    ]
+    assert data['publisher']['histograms'][0]['p95'] == 0.025
+    assert data['workers'][0]['url'] == worker_url
+    assert data['workers'][0]['metrics']['counters'][0]['labels'] == {'lane': 'email_queue', 'outcome': 'dead_lettered'}
+    assert 'erro' in data['workers'][1]
+
+
+def test_admin_email_pipeline_metrics_require_admin(client, app):
+    with app.app_context():
+        user = User(username='metrics_participant', role='participante', nome='Participante', cpf='20030040099')
+        user.set_password('1234')
+        db.session.add(user)
+        db.session.commit()
+
+    _login_user(client, 'metrics_participant')
+    res = client.get('/api/admin/notificacoes/metricas')
+
+    assert res.status_code == 403
+
+
 def test_dashboard_page_no_longer_renders_management_analytics(client, app, admin_user):
     seeded = _seed_dashboard_analytics_data(app)
 
@@ -2184,6 +2236,63 @@ def test_importar_usuarios_csv_start_and_status_update_existing_user(client, app
         assert created.curso == 'Curso CSV Async'
 
 
+def test_import_job_rows_are_appended_to_log_and_paged_by_seeking(app, monkeypatch):
+    monkeypatch.setattr(admin_api, 'IMPORT_JOB_FLUSH_EVERY', 5)
+
+    with app.app_context():
+        job_id = admin_api._create_import_job('csv', 'admin_log')[0]['job_id']
+        admin_api._update_job(job_id, status='running', total_rows=12)
+        for number in range(1, 13):
+            admin_api._append_job_row(job_id, {
+                'row_number': number,
+                'status': 'created' if number % 3 else 'error',
+                'message': '',
+                'nome': f'Aluno {number:02d}',
+                'cpf': '',
+                'curso': '',
+                'ra': '',
+            })
+
+        # Two full flushes reached the log; the last two rows are still buffered.
+        assert admin_api._count_job_rows(job_id) == 10
+        running = admin_api._build_import_job_payload(job_id, 1, 5, 'all', '')
+        assert running['processed_rows'] == 10
+        assert running['created'] == 7
+
+        admin_api._update_job(job_id, status='completed', completed=True)
+        log_lines = admin_api._job_log_path(job_id).read_text(encoding='utf-8').splitlines()
+        assert len(log_lines) == 12
+
+        payload = admin_api._build_import_job_payload(job_id, 2, 5, 'all', '')
+        assert payload['completed'] is True
+        assert payload['processed_rows'] == 12
+        assert payload['errors_count'] == 4
+        assert payload['pagination'] == {'page': 2, 'per_page': 5, 'pages': 3, 'total_items': 12}
+        assert [row['row_number'] for row in payload['rows']] == [6, 7, 8, 9, 10]
+
+        filtered = admin_api._build_import_job_payload(job_id, 9, 5, 'status', 'error')
+        assert filtered['pagination']['page'] == 1
+        assert filtered['filters']['filtered_total_items'] == 4
+        assert [row['row_number'] for row in filtered['rows']] == [3, 6, 9, 12]
+
+
+def test_import_job_logs_expire_with_the_registry_retention(app):
+    with app.app_context():
+        old_job_id = admin_api._create_import_job('csv', 'admin_log_old')[0]['job_id']
+        admin_api._update_job(old_job_id, rows=[{'row_number': 1, 'status': 'created'}])
+        written_at = admin_api._job_log_path(old_job_id).stat().st_mtime
+        expired = written_at - admin_api.job_registry.retention_seconds() - 60
+        for path in (admin_api._job_log_path(old_job_id), admin_api._job_index_path(old_job_id)):
+            os.utime(path, (expired, expired))
+
+        new_job_id = admin_api._create_import_job('csv', 'admin_log_new')[0]['job_id']
+        admin_api._update_job(new_job_id, rows=[{'row_number': 1, 'status': 'created'}])
+
+        assert not admin_api._job_log_path(old_job_id).exists()
+        assert not admin_api._job_index_path(old_job_id).exists()
+        assert admin_api._count_job_rows(new_job_id) == 1
+
+
 def test_create_user_admin_endpoint_uses_cpf_as_username(client, admin_user):
     _login_admin(client)
 
@@ -2793,7 +2902,7 @@ def test_manual_enroll_api_sends_email_notification(client, app, admin_user, mon
     sent_payloads = []
     monkeypatch.setattr(
         admin_api.admin_service.notification_service,
-        'send_email_task',
+        'enqueue_email_task',
         lambda **kwargs: sent_payloads.append(kwargs) or True
     )
 
@@ -2820,7 +2929,7 @@ def test_manual_enroll_api_allows_extensao_in_event_management(client, app, admi
     sent_payloads = []
     monkeypatch.setattr(
         admin_api.admin_service.notification_service,
-        'send_email_task',
+        'enqueue_email_task',
         lambda **kwargs: sent_payloads.append(kwargs) or True
     )
 
@@ -2858,7 +2967,7 @@ def test_manual_enroll_api_duplicate_does_not_send_email(client, app, admin_user
     sent_payloads = []
     monkeypatch.setattr(
         admin_api.admin_service.notification_service,
-        'send_email_task',
+        'enqueue_email_task',
         lambda **kwargs: sent_payloads.append(kwargs) or True
     )
 
@@ -2878,7 +2987,7 @@ def test_manual_enroll_api_invalid_activity_does_not_send_email(client, app, adm
     sent_payloads = []
     monkeypatch.setattr(
         admin_api.admin_service.notification_service,
-        'send_email_task',
+        'enqueue_email_task',
         lambda **kwargs: sent_payloads.append(kwargs) or True
     )
 
@@ -3035,11 +3144,17 @@ def test_certificate_preview_layout_returns_pdf(client, app, admin_user):
         },
     }
 
+    generated_dir = os.path.join(app.root_path, 'static', 'certificates', 'generated')
+    preview_file = os.path.join(generated_dir, f'cert_{event_id}_123.456.789-00.pdf')
+    if os.path.exists(preview_file):
+        os.remove(preview_file)
+
     res = client.post(f'/api/certificates/preview_layout/{event_id}', json=payload)
 
     assert res.status_code == 200
     assert res.mimetype == 'application/pdf'
     assert res.data.startswith(b'%PDF')
+    assert not os.path.exists(preview_file)
 
 
 def test_institutional_certificate_preview_layout_returns_pdf(client, app, admin_user):
@@ -3474,7 +3589,7 @@ def test_certificate_send_batch_starts_background_job(client, app, admin_user, m
     monkeypatch.setattr(
         certificates_api.CertificateService,
         'queue_event_certificates',
-        lambda self, event_id: (
+        lambda self, event_id, send_id=None: (
             True,
             'Envio concluido',
             {'total_enviado': 1, 'sem_email': 0, 'falha_fila': 0}
@@ -3507,6 +3622,35 @@ def test_certificate_send_batch_starts_background_job(client, app, admin_user, m
     assert status_payload['total_enviado'] == 1
 
 
+def test_certificate_send_batch_dispatches_to_render_queue_when_enabled(client, app, admin_user, monkeypatch):
+    event_id = _create_event_for_certs(app)
+    app.config['CERTIFICATE_RENDER_QUEUE_ENABLED'] = True
+    published = []
+
+    monkeypatch.setattr(
+        certificates_api.certificate_queue,
+        'publish_batch',
+        lambda kind, entity_id, job_id: published.append((kind, entity_id, job_id)) or True,
+    )
+
+    class FailingThread:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError('queued batches must not start a web thread')
+
+    monkeypatch.setattr(certificates_api, 'Thread', FailingThread)
+
+    _login_admin(client)
+    res = client.post(f'/api/certificates/send_batch/{event_id}')
+
+    assert res.status_code == 202
+    job_id = res.get_json()['job_id']
+    assert published == [('event', event_id, job_id)]
+
+    status_payload = client.get(f'/api/certificates/send_batch/status/{job_id}').get_json()
+    assert status_payload['status'] == 'queued'
+    assert status_payload['completed'] is False
+
+
 def test_certificate_management_endpoints_allow_admin_owner_course_coordinator_extensao_and_gestor_view(client, app, admin_user):
     seeded = _seed_certificate_management_data(app)
 
@@ -3649,6 +3793,76 @@ def test_upload_asset_requires_file(client, app, admin_user):
     assert 'Arquivo não enviado' in res.json['erro']
 
 
+def test_certificate_image_optimizer_falls_back_to_original_on_decompression_bomb(app, tmp_path, monkeypatch):
+    from PIL import Image
+    from app.services.certificate_image_service import CertificateImageService
+
+    original = tmp_path / 'enorme.png'
+    Image.new('RGB', (200, 200), (10, 10, 10)).save(original, format='PNG')
+    # Pillow refuses images over twice this many pixels.
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+
+    with app.app_context():
+        assert CertificateImageService().optimize(str(original)) == str(original)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['enorme.png']
+
+
+def test_certificate_uploads_store_print_ready_variants_and_keep_originals(client, app, admin_user):
+    from PIL import Image
+
+    _login_admin(client)
+    event_id = _create_event_for_certs(app)
+
+    background = BytesIO()
+    Image.new('RGB', (5000, 3000), (200, 30, 30)).save(background, format='PNG')
+    background.seek(0)
+    res = client.post(
+        f'/api/certificates/setup/{event_id}',
+        data={'background': (background, 'fundo.png')},
+        content_type='multipart/form-data',
+    )
+    assert res.status_code == 200
+
+    asset = BytesIO()
+    Image.new('RGBA', (4000, 1000), (0, 0, 0, 0)).save(asset, format='PNG')
+    asset.seek(0)
+    asset_res = client.post(
+        f'/api/certificates/upload_asset/{event_id}',
+        data={'asset': (asset, 'logo.png')},
+        content_type='multipart/form-data',
+    )
+    assert asset_res.status_code == 200
+
+    with app.app_context():
+        static_root = os.path.join(app.root_path, 'static')
+        bg_path = db.session.get(Event, event_id).cert_bg_path
+        original_bg = os.path.join(static_root, 'certificates', 'backgrounds', f'bg_event_{event_id}_fundo.png')
+        original_asset = os.path.join(static_root, 'certificates', 'assets', f'asset_event_{event_id}_logo.png')
+        asset_path = asset_res.json['asset_path']
+        created = [
+            original_bg,
+            original_asset,
+            os.path.join(static_root, bg_path),
+            os.path.join(static_root, asset_path),
+        ]
+        try:
+            assert bg_path == f'certificates/backgrounds/bg_event_{event_id}_fundo.print.jpg'
+            assert os.path.exists(original_bg)
+            with Image.open(os.path.join(static_root, bg_path)) as optimized:
+                assert optimized.format == 'JPEG'
+                assert optimized.size == (3508, 2480)
+
+            assert asset_path == f'certificates/assets/asset_event_{event_id}_logo.print.png'
+            assert os.path.exists(original_asset)
+            with Image.open(os.path.join(static_root, asset_path)) as optimized:
+                assert optimized.mode == 'RGBA'
+                assert optimized.size == (3508, 877)
+        finally:
+            for path in created:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
 def test_profile_stats_include_institutional_counts_and_hours(client, app, admin_user):
     _seed_profile_history_data(app)
     _login_participant(client)
@@ -4049,7 +4263,11 @@ def test_team_certificate_send_batch_runs_background_job(client, app, admin_user
 
     monkeypatch.setattr(certificates_api, 'Thread', ImmediateThread)
     monkeypatch.setattr(certificates_api.team_cert_service, 'generate_recipient_pdf', lambda *args, **kwargs: str(pdf_path))
-    monkeypatch.setattr(certificates_api.team_cert_service.notifier, 'send_email_task', lambda **kwargs: sent.append(kwargs) or True)
+    monkeypatch.setattr(
+        certificates_api.team_cert_service.notifier,
+        'send_email_tasks',
+        lambda tasks: [sent.append(task) or True for task in tasks],
+    )
 
     _login_user(client, seeded['owner_username'])
     res = client.post(f"/api/certificates/team/event/{seeded['event_id']}/send_batch")
@@ -4071,7 +4289,6 @@ def test_team_certificate_send_batch_commits_missing_hashes_once_before_delivery
     pdf_path.write_bytes(b'%PDF-1.4\n% mocked team batch certificate\n')
 
     with app.app_context():
-        certificates_api._SEND_TEAM_BATCH_JOBS.clear()
         db.session.add_all(
             [
                 EventTeamCertificateRecipient(
@@ -4107,25 +4324,16 @@ def test_team_certificate_send_batch_commits_missing_hashes_once_before_delivery
         )
         monkeypatch.setattr(
             certificates_api.team_cert_service.notifier,
-            'send_email_task',
-            lambda **kwargs: True,
+            'send_email_tasks',
+            lambda tasks: [True for _ in tasks],
         )
 
-        job_id = 'team-batch-job-hash'
-        certificates_api._SEND_TEAM_BATCH_JOBS[job_id] = {
-            'job_id': job_id,
-            'event_id': seeded['event_id'],
-            'created_by': seeded['owner_username'],
-            'status': 'queued',
-            'completed': False,
-            'resultado': 'processando',
-            'message': 'Teste',
-            'total_enviado': 0,
-            'sem_email': 0,
-            'falha_fila': 0,
-            'created_at': 0,
-            'updated_at': 0,
-        }
+        job_id = certificates_api.job_registry.create(
+            certificates_api.SEND_TEAM_BATCH_JOB_TYPE,
+            created_by=seeded['owner_username'],
+            entity_id=seeded['event_id'],
+            message='Teste',
+        )['job_id']
 
         certificates_api._run_send_team_batch_job(
             job_id,
@@ -4140,6 +4348,9 @@ def test_team_certificate_send_batch_commits_missing_hashes_once_before_delivery
         assert len(commits) == 2
         assert all(item.cert_hash for item in recipients)
         assert all(item.cert_entregue is True for item in recipients)
+        job = certificates_api.job_registry.get(job_id)
+        assert job['completed'] is True
+        assert job['total_enviado'] == len(recipients)
 
 
 def test_team_certificate_send_batch_persists_automatic_resolved_rows_before_delivery(
@@ -4152,7 +4363,6 @@ def test_team_certificate_send_batch_persists_automatic_resolved_rows_before_del
     with app.app_context():
         from app.models import ActivitySpeaker
 
-        certificates_api._SEND_TEAM_BATCH_JOBS.clear()
         db.session.add(ActivitySpeaker(
             activity_id=seeded['activity_id'],
             nome='Speaker Auto Persistido',
@@ -4168,25 +4378,16 @@ def test_team_certificate_send_batch_persists_automatic_resolved_rows_before_del
         )
         monkeypatch.setattr(
             certificates_api.team_cert_service.notifier,
-            'send_email_task',
-            lambda **kwargs: True,
+            'send_email_tasks',
+            lambda tasks: [True for _ in tasks],
         )
 
-        job_id = 'team-batch-job-auto-persist'
-        certificates_api._SEND_TEAM_BATCH_JOBS[job_id] = {
-            'job_id': job_id,
-            'event_id': seeded['event_id'],
-            'created_by': seeded['owner_username'],
-            'status': 'queued',
-            'completed': False,
-            'resultado': 'processando',
-            'message': 'Teste',
-            'total_enviado': 0,
-            'sem_email': 0,
-            'falha_fila': 0,
-            'created_at': 0,
-            'updated_at': 0,
-        }
+        job_id = certificates_api.job_registry.create(
+            certificates_api.SEND_TEAM_BATCH_JOB_TYPE,
+            created_by=seeded['owner_username'],
+            entity_id=seeded['event_id'],
+            message='Teste',
+        )['job_id']
 
         certificates_api._run_send_team_batch_job(
             job_id,
@@ -4205,6 +4406,58 @@ def test_team_certificate_send_batch_persists_automatic_resolved_rows_before_del
         assert persisted.cert_data_envio is not None
 
 
+def test_team_certificate_queued_chunks_load_only_their_rows_and_report_missing_email(
+    client, app, admin_user, monkeypatch, tmp_path
+):
+    seeded = _seed_certificate_management_data(app)
+    pdf_path = tmp_path / 'team-batch-chunk.pdf'
+    pdf_path.write_bytes(b'%PDF-1.4\n% mocked team chunk\n')
+
+    with app.app_context():
+        from app.models import ActivitySpeaker
+
+        db.session.add(ActivitySpeaker(
+            activity_id=seeded['activity_id'],
+            nome='Speaker Com Email',
+            email='speaker.chunk@test.local',
+            ordem=0,
+        ))
+        db.session.add(ActivitySpeaker(
+            activity_id=seeded['activity_id'],
+            nome='Speaker Sem Email',
+            email=None,
+            ordem=1,
+        ))
+        db.session.commit()
+
+        monkeypatch.setattr(
+            certificates_api.team_cert_service.certificate_service,
+            'generate_pdf',
+            lambda *args, **kwargs: str(pdf_path),
+        )
+        monkeypatch.setattr(
+            certificates_api.team_cert_service.notifier,
+            'send_email_tasks',
+            lambda tasks: [True for _ in tasks],
+        )
+
+        recipient_ids = certificates_api.team_cert_service.prepare_certificate_batch(seeded['event_id'])
+        rows = EventTeamCertificateRecipient.query.filter(
+            EventTeamCertificateRecipient.id.in_(recipient_ids)
+        ).all()
+        assert {row.nome for row in rows} >= {'Speaker Com Email', 'Speaker Sem Email'}
+
+        def fail_full_resolution(event):
+            raise AssertionError('chunks must not resolve the whole event')
+
+        monkeypatch.setattr(certificates_api.team_cert_service, 'resolve_event_recipients', fail_full_resolution)
+        event = db.session.get(Event, seeded['event_id'])
+        chunk_ids = [row.id for row in rows if row.nome in ('Speaker Com Email', 'Speaker Sem Email')]
+        summary = certificates_api.team_cert_service.deliver_certificates(event, chunk_ids)
+
+        assert summary == {'total_enviado': 1, 'sem_email': 1, 'falha_fila': 0}
+
+
 def test_certificate_designer_bootstrap_returns_normalized_template_and_warnings(client, app, admin_user):
     event_id = _create_event_for_certs(app)
 
@@ -4286,20 +4539,20 @@ def test_team_certificate_delivery_list_returns_resolved_activity_and_responsibl
         assert 'nome' in item
 
 
-def test_prune_job_cache_removes_old_completed_entries(monkeypatch):
-    jobs = {
-        'old': {'completed': True, 'updated_at': 100},
-        'fresh': {'completed': True, 'updated_at': 1900},
-        'running': {'completed': False, 'updated_at': 50},
-    }
-
-    monkeypatch.setattr(certificates_api.time, 'time', lambda: 2000)
+def test_job_registry_prunes_old_completed_jobs(app, monkeypatch):
+    registry = certificates_api.job_registry
+    monkeypatch.setattr(job_registry_module.time, 'time', lambda: 100)
+    old = registry.create(certificates_api.SEND_BATCH_JOB_TYPE, completed=True)
+    running = registry.create(certificates_api.SEND_BATCH_JOB_TYPE)
+    monkeypatch.setattr(job_registry_module.time, 'time', lambda: 1900)
+    fresh = registry.create(certificates_api.SEND_BATCH_JOB_TYPE, completed=True)
 
-    certificates_api._prune_job_cache(jobs, max_completed_age=300, max_entries=10)
+    monkeypatch.setattr(job_registry_module.time, 'time', lambda: 2000)
+    assert registry.prune_completed(max_completed_age=300) == 1
 
-    assert 'old' not in jobs
-    assert 'fresh' in jobs
-    assert 'running' in jobs
+    assert registry.get(old['job_id']) is None
+    assert registry.get(fresh['job_id']) is not None
+    assert registry.get(running['job_id']) is not None
 
 
 def test_team_certificate_pages_load_for_owner_and_gestor(client, app, admin_user):
@@ -4504,7 +4757,11 @@ def test_team_certificate_send_batch_uses_resolved_activity_rows(client, app, ad
 
     monkeypatch.setattr(certificates_api, 'Thread', ImmediateThread)
     monkeypatch.setattr(certificates_api.team_cert_service, 'generate_recipient_pdf', lambda *args, **kwargs: str(pdf_path))
-    monkeypatch.setattr(certificates_api.team_cert_service.notifier, 'send_email_task', lambda **kwargs: sent.append(kwargs) or True)
+    monkeypatch.setattr(
+        certificates_api.team_cert_service.notifier,
+        'send_email_tasks',
+        lambda tasks: [sent.append(task) or True for task in tasks],
+    )
 
     _login_user(client, seeded['owner_username'])
     res = client.post(f"/api/certificates/team/event/{seeded['event_id']}/send_batch")
@@ -11,11 +11,16 @@ from app.services.certificate_service import CertificateService
 from app.services.institutional_certificate_service import InstitutionalCertificateService
 from app.services.admin_service import AdminService
 from app.services.email_template_service import EmailTemplateService
+from app.services.notification_service import NotificationService
 from app.models import User
 from app.extensions import db
-from app.models import Event, Course, Activity, ActivitySpeaker, Enrollment, EventRegistration, EventTeamCertificateRecipient
+from app.models import (
+    Event, Course, Activity, ActivitySpeaker, Enrollment, EventRegistration, EventTeamCertificateRecipient,
+    NotificationOutbox, BackgroundJob,
+)
 from openpyxl import Workbook
 
+
 def test_auth_service_register(app):
     service = AuthService()
     data = {'username': 'newuser', 'password': '123', 'nome': 'New', 'cpf': '99999999999'}
@@ -23,6 +28,7 @@ def test_auth_service_register(app):
     assert user.username == '99999999999'
     assert user.check_password('123')
 
+
 def test_auth_service_duplicate(app, admin_user):
     service = AuthService()
     data = {'username': 'admin_test', 'password': '123', 'nome': 'New', 'cpf': '00000000000'}
@@ -90,6 +96,7 @@ def test_admin_service_list_users_paginated_filters_by_cargo(app):
         assert 'user_role_gestor' in usernames
         assert 'user_role_professor' not in usernames
 
+
 def test_event_service_create(app, admin_user):
     service = EventService()
     data = {
@@ -386,6 +393,201 @@ def test_event_service_confirm_attendance_creates_event_registration_for_fast_ev
     assert enrollment.event_registration_id == registration.id
 
 
+def test_event_service_queues_enrollment_and_presence_emails_in_outbox_with_the_change(app, admin_user, monkeypatch):
+    participant = User(
+        username='outbox_user',
+        role='participante',
+        nome='Participante Outbox',
+        cpf='12345000005',
+        email='outbox@test.local',
+    )
+    participant.set_password('1234')
+    db.session.add(participant)
+    db.session.commit()
+
+    service = EventService()
+    event = service.create_event(admin_user.username, {
+        'nome': 'Evento Outbox',
+        'descricao': 'Desc',
+        'is_rapido': False,
+        'data_inicio': '2030-09-10',
+        'hora_inicio': '18:00',
+        'data_fim': '2030-09-10',
+        'hora_fim': '22:00',
+        'perfis_habilitados': ['participante'],
+        'atividades': [
+            {
+                'nome': 'Atividade Outbox',
+                'local': 'Sala 1',
+                'descricao': 'Desc',
+                'data_atv': '2030-09-10',
+                'hora_atv': '18:30',
+                'horas': 2,
+                'vagas': 10,
+            },
+        ],
+    })
+    activity = event.activities[0]
+    NotificationOutbox.query.delete()
+    db.session.commit()
+
+    def broker_unavailable():
+        raise AssertionError('request path must not touch the broker')
+
+    monkeypatch.setattr(service.notification_service, '_get_publisher', broker_unavailable)
+
+    enrollment, message = service.toggle_enrollment(participant, activity.id, 'inscrever', actor_user=participant)
+    assert message == 'Inscrição Realizada!'
+    success, _, _ = service.confirm_attendance(participant, activity.id, event.id)
+    assert success is True
+
+    db.session.rollback()
+    rows = NotificationOutbox.query.order_by(NotificationOutbox.id).all()
+    payloads = [json.loads(row.payload_json) for row in rows]
+    assert [row.queue for row in rows] == ['email_transactional', 'email_transactional']
+    assert [payload['template_name'] for payload in payloads] == [
+        'enrollment_confirmation.html',
+        'presence_confirmation.html',
+    ]
+    assert {payload['to'] for payload in payloads} == {'outbox@test.local'}
+    assert db.session.get(Enrollment, enrollment.id).presente is True
+
+
+def test_enrollment_confirmations_coalesce_into_one_digest_after_the_window(app, admin_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'NOTIFICATION_DIGEST_WINDOW_SECONDS', 120)
+    participant = User(
+        username='digest_user',
+        role='participante',
+        nome='Participante Digest',
+        cpf='12345000006',
+        email='Digest@test.local',
+    )
+    participant.set_password('1234')
+    db.session.add(participant)
+    db.session.commit()
+
+    service = EventService()
+    event = service.create_event(admin_user.username, {
+        'nome': 'Evento Digest',
+        'descricao': 'Desc',
+        'is_rapido': False,
+        'data_inicio': '2030-09-10',
+        'hora_inicio': '18:00',
+        'data_fim': '2030-09-11',
+        'hora_fim': '22:00',
+        'perfis_habilitados': ['participante'],
+        'atividades': [
+            {
+                'nome': 'Oficina A', 'local': 'Sala 1', 'descricao': 'Desc',
+                'data_atv': '2030-09-10', 'hora_atv': '18:30', 'horas': 2, 'vagas': 10,
+            },
+            {
+                'nome': 'Oficina B', 'local': 'Sala 2', 'descricao': 'Desc',
+                'data_atv': '2030-09-11', 'hora_atv': '19:00', 'horas': 2, 'vagas': 10,
+            },
+        ],
+    })
+    NotificationOutbox.query.delete()
+    db.session.commit()
+
+    published = []
+
+    class FakePublisher:
+        def publish_many(self, messages, window=100, timeout=10):
+            published.extend(messages)
+            return set()
+
+    monkeypatch.setattr(NotificationService, '_get_publisher', lambda self: FakePublisher())
+
+    for activity in event.activities:
+        _, message = service.toggle_enrollment(participant, activity.id, 'inscrever', actor_user=participant)
+        assert message == 'Inscrição Realizada!'
+
+    rows = NotificationOutbox.query.order_by(NotificationOutbox.id).all()
+    assert len(rows) == 2
+    assert rows[0].coalesce_key == f'enrollment:{event.id}:digest@test.local'
+    assert {row.coalesce_key for row in rows} == {rows[0].coalesce_key}
+    assert rows[0].available_at == rows[1].available_at > datetime.utcnow()
+
+    # Held until the window closes.
+    assert service.notification_service.relay_outbox() == (0, 0)
+    assert published == []
+
+    NotificationOutbox.query.update({NotificationOutbox.available_at: datetime(2000, 1, 1)})
+    db.session.commit()
+
+    assert service.notification_service.relay_outbox() == (2, 0)
+    assert NotificationOutbox.query.count() == 0
+    assert len(published) == 1
+    queue, body, _ = published[0]
+    payload = json.loads(body)
+    assert queue == 'email_transactional'
+    assert payload['to'] == 'Digest@test.local'
+    assert payload['template_name'] == 'enrollment_digest.html'
+    assert [item['activity_name'] for item in payload['template_data']['activities']] == ['Oficina A', 'Oficina B']
+
+    html = EmailTemplateService().render_template(payload['template_name'], payload['template_data'])
+    assert 'Oficina A' in html
+    assert 'Oficina B' in html
+    assert '11/09/2030' in html
+
+
+def test_event_service_notify_all_participants_publishes_one_broadcast(app, admin_user, monkeypatch):
+    users = [
+        User(
+            username=f'broadcast_{index}', role='participante', nome=f'Broadcast {index}',
+            cpf=f'1234500010{index}', email=email,
+        )
+        for index, email in enumerate(['one@test.local', 'TWO@test.local', None])
+    ]
+    for user in users:
+        user.set_password('1234')
+    db.session.add_all(users)
+    db.session.commit()
+
+    service = EventService()
+    event = service.create_event(admin_user.username, {
+        'nome': 'Evento Broadcast',
+        'descricao': 'Desc',
+        'is_rapido': False,
+        'data_inicio': '2030-09-12',
+        'hora_inicio': '18:00',
+        'data_fim': '2030-09-12',
+        'hora_fim': '22:00',
+        'perfis_habilitados': ['participante'],
+        'atividades': [
+            {'nome': f'Atividade {index}', 'local': 'Sala', 'descricao': 'Desc', 'data_atv': '2030-09-12',
+             'hora_atv': '18:30', 'horas': 2, 'vagas': 10}
+            for index in range(2)
+        ],
+    })
+    db.session.add_all([
+        Enrollment(activity_id=activity.id, user_cpf=user.cpf, nome=user.nome, presente=False)
+        for activity in event.activities
+        for user in users
+    ])
+    db.session.commit()
+
+    published = []
+
+    class FakePublisher:
+        def publish_many(self, messages, window=100, timeout=10):
+            published.extend((queue, json.loads(body)) for queue, body, _ in messages)
+            return set()
+
+    monkeypatch.setattr(service.notification_service, '_get_publisher', lambda: FakePublisher())
+
+    assert service.notify_all_participants(event.id, 'Aviso', 'Sala alterada') == 2
+    assert len(published) == 1
+    queue, payload = published[0]
+    assert queue == 'email_queue'
+    assert payload['type'] == 'broadcast'
+    assert sorted(payload['bcc']) == ['TWO@test.local', 'one@test.local']
+    assert payload['template_name'] == 'event_broadcast.html'
+    assert payload['template_data']['message_text'] == 'Sala alterada'
+    assert payload['idempotency_key'].startswith('broadcast:')
+
+
 def test_event_service_can_manage_event_allows_coordinator_course_scope_but_keeps_delete_owner_only(app):
     with app.app_context():
         course = Course(nome='Curso Permissoes')
@@ -865,7 +1067,7 @@ def test_admin_service_manual_enroll_sends_email_to_added_user(app, admin_user):
 
         service = AdminService()
         sent_payloads = []
-        service.notification_service.send_email_task = lambda **kwargs: sent_payloads.append(kwargs) or True
+        service.notification_service.enqueue_email_task = lambda **kwargs: sent_payloads.append(kwargs) or True
 
         success, msg = service.manual_enroll(participant.cpf, activity.id)
 
@@ -929,7 +1131,7 @@ def test_admin_service_manual_enroll_without_email_does_not_send_notification(ap
 
         service = AdminService()
         sent_payloads = []
-        service.notification_service.send_email_task = lambda **kwargs: sent_payloads.append(kwargs) or True
+        service.notification_service.enqueue_email_task = lambda **kwargs: sent_payloads.append(kwargs) or True
 
         success, msg = service.manual_enroll(participant.cpf, activity.id)
 
@@ -987,7 +1189,7 @@ def test_admin_service_manual_enroll_duplicate_does_not_send_notification(app, a
 
         service = AdminService()
         sent_payloads = []
-        service.notification_service.send_email_task = lambda **kwargs: sent_payloads.append(kwargs) or True
+        service.notification_service.enqueue_email_task = lambda **kwargs: sent_payloads.append(kwargs) or True
 
         success, msg = service.manual_enroll(participant.cpf, activity.id)
 
@@ -1020,6 +1222,33 @@ def test_manual_enrollment_email_template_renders_with_base_layout():
     assert 'Abrir página do evento' in html
 
 
+def test_email_template_service_precompiles_to_bytecode_cache_and_memoizes_renders(tmp_path, monkeypatch):
+    service = EmailTemplateService(bytecode_cache_dir=str(tmp_path), render_cache_size=2, watch_interval=60)
+
+    compiled = service.precompile()
+    assert compiled > len([name for name in os.listdir(service.templates_dir) if name.endswith('.html')])
+    assert any(tmp_path.iterdir())
+
+    loads = []
+    get_template = service.env.get_template
+    monkeypatch.setattr(
+        service.env, 'get_template', lambda name, *args: loads.append(name) or get_template(name, *args)
+    )
+    context = {'user_name': 'Pessoa', 'email': 'p@test.local', 'app_url': 'http://localhost', 'year': 2026}
+
+    first = service.render_template('welcome.html', context)
+    assert service.render_template('welcome.html', dict(reversed(list(context.items())))) == first
+    assert loads.count('welcome.html') == 1
+    service.render_template('welcome.html', {**context, 'user_name': 'Outra'})
+    assert loads.count('welcome.html') == 2
+
+    # A changed template directory recompiles and drops the rendered e-mails on the next check.
+    monkeypatch.setattr(service, '_templates_signature', lambda: ('changed',))
+    service._checked_at -= 60
+    service.render_template('welcome.html', context)
+    assert loads.count('welcome.html') == 4
+
+
 def test_event_team_certificate_email_template_renders_links():
     service = EmailTemplateService()
 
@@ -1579,6 +1808,498 @@ def test_certificate_service_generate_pdf_overwrites_read_only_existing_file_ato
             assert generated_file.read(4) == b'%PDF'
 
 
+def test_certificate_service_reuses_render_plan_until_template_changes(app, admin_user, monkeypatch):
+    with app.app_context():
+        CertificateService.clear_render_plan_cache()
+        event = Event(
+            owner_username='admin_test',
+            nome='Evento Plano Compilado',
+            descricao='Teste de cache do layout',
+            tipo='RAPIDO',
+            data_inicio=date(2030, 7, 3),
+            hora_inicio=time(9, 30),
+        )
+        first_user = User(
+            username='cert_plan_1', role='student', nome='Aluno Um', cpf='10000000011', email='plano1@example.com'
+        )
+        second_user = User(
+            username='cert_plan_2', role='student', nome='Aluno Dois', cpf='10000000012', email='plano2@example.com'
+        )
+        first_user.set_password('1234')
+        second_user.set_password('1234')
+        db.session.add_all([event, first_user, second_user])
+        db.session.commit()
+
+        service = CertificateService()
+        built_plans = []
+        original_build = service._build_render_plan
+
+        def _tracking_build(*args, **kwargs):
+            plan = original_build(*args, **kwargs)
+            built_plans.append(plan)
+            return plan
+
+        drawn_texts = []
+
+        def _capture_text(pdf_canvas, config, page_width, page_height, tags):
+            if config.get('id') == 'name_fixed':
+                drawn_texts.append((config['_compiled']['markup'], tags['{{NOME}}']))
+
+        monkeypatch.setattr(service, '_build_render_plan', _tracking_build)
+        monkeypatch.setattr(service, '_draw_text_element', _capture_text)
+
+        service.generate_pdf(event, first_user, activities=[], total_hours=4)
+        service.generate_pdf(event, second_user, activities=[], total_hours=4)
+
+        assert len(built_plans) == 1
+        assert drawn_texts == [('{{NOME}}', 'ALUNO UM'), ('{{NOME}}', 'ALUNO DOIS')]
+
+        event.cert_template_json = json.dumps(CertificateService.build_default_template(bg='fundo_alterado.png'))
+        db.session.commit()
+        service.generate_pdf(event, first_user, activities=[], total_hours=4)
+
+        assert len(built_plans) == 2
+        assert built_plans[1].key != built_plans[0].key
+
+
+def test_certificate_service_static_layer_embeds_a_shared_print_variant_of_the_background(
+    app, admin_user, monkeypatch, tmp_path
+):
+    from app.services import certificate_service as certificate_module
+
+    with app.app_context():
+        # The default background is a 600 dpi PNG, deflated again for every PDF without the static layer.
+        template = CertificateService.build_default_template()
+        template['elements'].append({
+            'id': 'static_text', 'type': 'text', 'text': 'Texto institucional sem marcadores',
+            'x': 50, 'y': 40, 'w': 60, 'h': 10, 'font': 14,
+        })
+        event = Event(
+            owner_username='admin_test',
+            nome='Evento Camada Estatica',
+            descricao='Teste de camada estatica',
+            tipo='RAPIDO',
+            data_inicio=date(2030, 7, 4),
+            hora_inicio=time(9, 30),
+            cert_template_json=json.dumps(template),
+        )
+        user = User(
+            username='cert_static_layer', role='student', nome='Aluno Estatico', cpf='10000000013',
+            email='estatico@example.com',
+        )
+        user.set_password('1234')
+        db.session.add_all([event, user])
+        db.session.commit()
+
+        service = CertificateService()
+        app.config['CERTIFICATE_STATIC_LAYER_ENABLED'] = False
+        full_redraw = service.generate_pdf(event, user, activities=[], total_hours=4, as_buffer=True).getvalue()
+
+        written = []
+        original_write_variant = certificate_module.CertificateImageService.write_variant
+
+        def _counting_write_variant(self, original_path, variant_stem, stretch=False):
+            written.append(original_path)
+            return original_write_variant(self, original_path, variant_stem, stretch=stretch)
+
+        monkeypatch.setattr(certificate_module.CertificateImageService, 'write_variant', _counting_write_variant)
+        monkeypatch.setitem(app.config, 'CERTIFICATE_IMAGE_CACHE_DIR', str(tmp_path))
+        CertificateService._static_image_cache.clear()
+        app.config['CERTIFICATE_STATIC_LAYER_ENABLED'] = True
+        static_layer = service.generate_pdf(event, user, activities=[], total_hours=4, as_buffer=True).getvalue()
+        service.generate_pdf(event, user, activities=[], total_hours=4, as_buffer=True)
+        # Another render process finds the variant on disk.
+        CertificateService._static_image_cache.clear()
+        service.generate_pdf(event, user, activities=[], total_hours=4, as_buffer=True)
+
+        assert len(written) == 1
+        assert [path.suffix for path in tmp_path.iterdir()] == ['.jpg']
+        # The JPEG variant is embedded as is (DCTDecode) and the PDF is lighter.
+        assert b'/DCTDecode' in static_layer and b'/DCTDecode' not in full_redraw
+        assert len(static_layer) < len(full_redraw)
+
+
+def test_certificate_service_reuses_cached_pdf_until_inputs_change(app, admin_user, monkeypatch):
+    from app.services import certificate_service as certificate_module
+
+    with app.app_context():
+        event = Event(
+            owner_username='admin_test',
+            nome='Evento Cache PDF',
+            descricao='Teste de cache por conteudo',
+            tipo='RAPIDO',
+            data_inicio=date(2030, 7, 6),
+            hora_inicio=time(9, 30),
+        )
+        user = User(
+            username='cert_pdf_cache', role='student', nome='Aluno Cache', cpf='10000000031', email='cache@example.com'
+        )
+        user.set_password('1234')
+        db.session.add_all([event, user])
+        db.session.commit()
+
+        opened_canvases = []
+        original_canvas = certificate_module.canvas.Canvas
+
+        def _tracking_canvas(*args, **kwargs):
+            opened_canvases.append(args[0])
+            return original_canvas(*args, **kwargs)
+
+        monkeypatch.setattr(certificate_module.canvas, 'Canvas', _tracking_canvas)
+        app.config['CERTIFICATE_PDF_CACHE_ENABLED'] = True
+        service = CertificateService()
+        digest_path = os.path.join(
+            app.root_path, 'static', 'certificates', 'generated', f'cert_{event.id}_{user.cpf}.pdf.digest'
+        )
+        if os.path.exists(digest_path):
+            os.remove(digest_path)
+
+        first_path = service.generate_pdf(event, user, activities=[], total_hours=4)
+        cached_path = service.generate_pdf(event, user, activities=[], total_hours=4)
+        assert cached_path == first_path
+        assert len(opened_canvases) == 1
+
+        service.generate_pdf(event, user, activities=[], total_hours=6)
+        assert len(opened_canvases) == 2
+
+        event.cert_template_json = json.dumps(CertificateService.build_default_template(bg=''))
+        db.session.commit()
+        service.generate_pdf(event, user, activities=[], total_hours=6)
+        assert len(opened_canvases) == 3
+
+        service.generate_pdf(event, user, activities=[], total_hours=6, template_override={'elements': []})
+        assert len(opened_canvases) == 4
+
+
+def test_certificate_service_draws_vector_qr_and_caches_modules_per_url(app, monkeypatch):
+    import qrcode
+    from reportlab.pdfgen import canvas as pdf_canvas_module
+
+    with app.app_context():
+        built_codes = []
+        original_qr = qrcode.QRCode
+
+        def _tracking_qr(*args, **kwargs):
+            built_codes.append(kwargs)
+            return original_qr(*args, **kwargs)
+
+        def _fail_inline_image(*args, **kwargs):
+            raise AssertionError('vector QR must not embed a raster image')
+
+        monkeypatch.setattr(qrcode, 'QRCode', _tracking_qr)
+        monkeypatch.setattr(pdf_canvas_module.Canvas, 'drawInlineImage', _fail_inline_image)
+        service = CertificateService()
+        config = {'id': 'qrcode', 'type': 'qr', 'x': 10, 'y': 80, 'w': 12, 'h': 17}
+        validation_url = 'https://eventos.example.edu.br/validar/QRVECTORCACHE01'
+
+        for _ in range(2):
+            buffer = BytesIO()
+            pdf_canvas = pdf_canvas_module.Canvas(buffer)
+            service._draw_qr_element(pdf_canvas, config, 842, 595, validation_url)
+            pdf_canvas.save()
+            assert buffer.getvalue().startswith(b'%PDF')
+
+        module_count, fill_operators = service._qr_modules(validation_url)
+        reference = original_qr(box_size=10, border=0)
+        reference.add_data(validation_url)
+        reference.make(fit=True)
+        matrix = reference.get_matrix()
+        filled = set()
+        for operator in fill_operators.split(' re')[:-1]:
+            col, row, width, _ = (int(value) for value in operator.split())
+            filled.update((row, col + offset) for offset in range(width))
+
+        assert len(built_codes) == 1
+        assert module_count == len(matrix)
+        assert filled == {(r, c) for r, row in enumerate(matrix) for c, dark in enumerate(row) if dark}
+
+
+def test_certificate_render_service_renders_descriptors_in_process_pool(app, admin_user):
+    from app.services.certificate_render_service import CertificateRenderService
+
+    with app.app_context():
+        event = Event(
+            owner_username='admin_test',
+            nome='Evento Lote Paralelo',
+            descricao='Teste de renderizacao em lote',
+            tipo='RAPIDO',
+            data_inicio=date(2030, 7, 5),
+            hora_inicio=time(9, 30),
+        )
+        users = [
+            User(
+                username=f'cert_pool_{idx}', role='student', nome=f'Aluno Lote {idx}', cpf=f'1000000002{idx}',
+                email=f'lote{idx}@example.com',
+            )
+            for idx in range(3)
+        ]
+        for user in users:
+            user.set_password('1234')
+        db.session.add(event)
+        db.session.add_all(users)
+        db.session.commit()
+
+        service = CertificateService()
+        descriptors = [
+            service.build_render_descriptor(event, user, [], 2, tag_overrides={'{{HASH}}': f'POOLHASH{idx}'})
+            for idx, user in enumerate(users)
+        ]
+        app.config['CERTIFICATE_RENDER_PROCESSES'] = 2
+        app.config['CERTIFICATE_RENDER_POOL_MIN_BATCH'] = 1
+
+        results = list(CertificateRenderService(service).render_many(descriptors))
+
+        assert [error for _, error in results] == [None, None, None]
+        assert [os.path.basename(path) for path, _ in results] == [
+            f'cert_{event.id}_{user.cpf}.pdf' for user in users
+        ]
+        for path, _ in results:
+            with open(path, 'rb') as pdf_file:
+                assert pdf_file.read(4) == b'%PDF'
+
+
+def test_certificate_render_service_reuses_one_process_pool_across_batches(app, admin_user, monkeypatch):
+    from app.services import certificate_render_service as render_module
+
+    with app.app_context():
+        event = Event(
+            owner_username='admin_test',
+            nome='Evento Pool Compartilhado',
+            descricao='Teste de pool reutilizado',
+            tipo='RAPIDO',
+            data_inicio=date(2030, 7, 5),
+            hora_inicio=time(9, 30),
+        )
+        users = [
+            User(
+                username=f'cert_shared_pool_{idx}',
+                role='student',
+                nome=f'Aluno Pool {idx}',
+                cpf=f'1000000005{idx}',
+                email=f'pool{idx}@example.com',
+            )
+            for idx in range(4)
+        ]
+        for user in users:
+            user.set_password('1234')
+        db.session.add(event)
+        db.session.add_all(users)
+        db.session.commit()
+
+        service = CertificateService()
+        descriptors = [
+            service.build_render_descriptor(event, user, [], 2, tag_overrides={'{{HASH}}': f'SHAREDPOOL{idx}'})
+            for idx, user in enumerate(users)
+        ]
+        app.config['CERTIFICATE_RENDER_PROCESSES'] = 2
+        app.config['CERTIFICATE_RENDER_POOL_MIN_BATCH'] = 1
+
+        def _not_in_parent(self, descriptor, as_buffer=False):
+            raise AssertionError('pool renders must not run in the calling process')
+
+        # Spawned processes import the module afresh, so only the parent sees this patch.
+        monkeypatch.setattr(CertificateService, 'render_descriptor', _not_in_parent)
+        try:
+            first = list(render_module.CertificateRenderService(service).render_many(descriptors[:2]))
+            pool = render_module._POOL
+            second = list(render_module.CertificateRenderService(service).render_many(descriptors[2:]))
+
+            assert pool is not None
+            assert render_module._POOL is pool
+            assert [error for _, error in first + second] == [None] * 4
+            for path, _ in first + second:
+                with open(path, 'rb') as pdf_file:
+                    assert pdf_file.read(4) == b'%PDF'
+        finally:
+            render_module.shutdown_render_pool()
+        assert render_module._POOL is None
+
+
+def test_certificate_service_queue_assigns_hashes_in_bulk_and_flushes_deliveries_in_chunks(
+    app, admin_user, monkeypatch
+):
+    with app.app_context():
+        event = Event(
+            owner_username='admin_test',
+            nome='Evento Envio em Lote',
+            descricao='Teste de gravacao em lote',
+            tipo='RAPIDO',
+            data_inicio=date(2030, 7, 6),
+            hora_inicio=time(9, 30),
+        )
+        db.session.add(event)
+        db.session.flush()
+        activity = Activity(event_id=event.id, nome='Atividade Lote', carga_horaria=3, vagas=30)
+        db.session.add(activity)
+        db.session.flush()
+        users = [
+            User(
+                username=f'cert_bulk_{idx}', role='participante', nome=f'Aluno Bulk {idx}', cpf=f'1000000003{idx}',
+                email=f'bulk{idx}@example.com',
+            )
+            for idx in range(3)
+        ]
+        for user in users:
+            user.set_password('1234')
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all([
+            Enrollment(activity_id=activity.id, user_cpf=user.cpf, nome=user.nome, presente=True)
+            for user in users
+        ])
+        db.session.commit()
+
+        service = CertificateService()
+        sent = []
+        monkeypatch.setattr(
+            service.notifier, 'send_email_tasks', lambda tasks: [sent.append(task) or True for task in tasks]
+        )
+        app.config['CERTIFICATE_DELIVERY_FLUSH_SIZE'] = 2
+
+        commits = []
+        original_commit = db.session.commit
+
+        def _counting_commit():
+            commits.append(1)
+            return original_commit()
+
+        monkeypatch.setattr(db.session, 'commit', _counting_commit)
+        success, _, summary = service.queue_event_certificates(event.id, send_id='job-1')
+        monkeypatch.undo()
+
+        enrollments = Enrollment.query.filter_by(activity_id=activity.id).all()
+        hashes = {enrollment.cert_hash for enrollment in enrollments}
+        assert success is True
+        assert summary['total_enviado'] == 3
+        # One commit for the hashes, then one per delivery chunk (2 + 1).
+        assert len(commits) == 3
+        assert None not in hashes and len(hashes) == 3
+        assert {item['template_data']['certificate_number'] for item in sent} == hashes
+        assert {item['idempotency_key'] for item in sent} == {
+            f"certificate:{item['template_data']['certificate_number']}:{item['to_email'].lower()}:job-1"
+            for item in sent
+        }
+        assert all(enrollment.cert_entregue and enrollment.cert_data_envio for enrollment in enrollments)
+
+
+def test_certificate_service_writes_one_pdf_per_enrollment_and_keeps_it_across_issue_dates(
+    app, admin_user, monkeypatch
+):
+    from app.services import certificate_service as certificate_module
+
+    with app.app_context():
+        event = Event(
+            owner_username='admin_test',
+            nome='Evento Varias Atividades',
+            descricao='Teste de um PDF por inscricao',
+            tipo='PADRAO',
+            data_inicio=date(2030, 7, 6),
+            hora_inicio=time(9, 30),
+        )
+        db.session.add(event)
+        db.session.flush()
+        activities = [
+            Activity(event_id=event.id, nome=f'Atividade {idx}', carga_horaria=idx + 1, vagas=30) for idx in range(2)
+        ]
+        db.session.add_all(activities)
+        user = User(
+            username='cert_multi_atv', role='participante', nome='Aluno Multi', cpf='10000000061',
+            email='multi@example.com',
+        )
+        user.set_password('1234')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([
+            Enrollment(activity_id=activity.id, user_cpf=user.cpf, nome=user.nome, presente=True)
+            for activity in activities
+        ])
+        db.session.commit()
+
+        service = CertificateService()
+        sent = []
+        monkeypatch.setattr(
+            service.notifier, 'send_email_tasks', lambda tasks: [sent.append(task) or True for task in tasks]
+        )
+        app.config['CERTIFICATE_PDF_CACHE_ENABLED'] = True
+
+        success, _, summary = service.queue_event_certificates(event.id)
+
+        assert success is True
+        assert summary['total_enviado'] == 2
+        attachments = [task['attachment_path'] for task in sent]
+        assert len(set(attachments)) == 2
+        enrollment = Enrollment.query.filter_by(activity_id=activities[0].id).one()
+        assert os.path.basename(attachments[0]) == f'cert_{event.id}_{user.cpf}_{enrollment.id}.pdf'
+
+        opened_canvases = []
+        original_canvas = certificate_module.canvas.Canvas
+
+        def _tracking_canvas(*args, **kwargs):
+            opened_canvases.append(args[0])
+            return original_canvas(*args, **kwargs)
+
+        monkeypatch.setattr(certificate_module.canvas, 'Canvas', _tracking_canvas)
+        monkeypatch.setattr(certificate_module, 'current_certificate_issue_date_label', lambda: '01/01/2031')
+        path = service.generate_pdf(event, user, [activities[0]], 1, enrollment=enrollment)
+
+        assert path == attachments[0]
+        assert opened_canvases == []
+
+
+def test_certificate_service_queued_batch_prepares_ids_and_delivers_single_chunk(app, admin_user, monkeypatch):
+    from app.services.certificate_queue_service import CertificateQueueService
+
+    with app.app_context():
+        event = Event(
+            owner_username='admin_test',
+            nome='Evento Fila Renderizacao',
+            descricao='Teste de fila de renderizacao',
+            tipo='RAPIDO',
+            data_inicio=date(2030, 7, 7),
+            hora_inicio=time(9, 30),
+        )
+        db.session.add(event)
+        db.session.flush()
+        activity = Activity(event_id=event.id, nome='Atividade Fila', carga_horaria=2, vagas=30)
+        db.session.add(activity)
+        db.session.flush()
+        users = [
+            User(
+                username=f'cert_chunk_{idx}', role='participante', nome=f'Aluno Chunk {idx}', cpf=f'1000000004{idx}',
+                email=f'chunk{idx}@example.com',
+            )
+            for idx in range(3)
+        ]
+        for user in users:
+            user.set_password('1234')
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all([
+            Enrollment(activity_id=activity.id, user_cpf=user.cpf, nome=user.nome, presente=True)
+            for user in users
+        ])
+        db.session.commit()
+
+        service = CertificateService()
+        sent = []
+        monkeypatch.setattr(
+            service.notifier,
+            'send_email_tasks',
+            lambda tasks: [sent.append(task['to_email']) or True for task in tasks],
+        )
+
+        enrollment_ids = service.prepare_event_certificate_batch(event.id)
+        chunks = CertificateQueueService.split(enrollment_ids, 2)
+        summary = service.deliver_event_certificates(event, chunks[0])
+
+        enrollments = {item.id: item for item in Enrollment.query.filter_by(activity_id=activity.id).all()}
+        assert [len(chunk) for chunk in chunks] == [2, 1]
+        assert all(item.cert_hash for item in enrollments.values())
+        assert summary == {'total_enviado': 2, 'sem_email': 0, 'falha_fila': 0}
+        assert sent == ['chunk0@example.com', 'chunk1@example.com']
+        assert [enrollments[item_id].cert_entregue for item_id in enrollment_ids] == [True, True, False]
+
+
 def test_certificate_service_normalize_template_payload_restores_fixed_validation_elements():
     normalized = CertificateService.normalize_template_payload({
         'version': 2,
@@ -2447,3 +3168,519 @@ def test_event_team_certificate_service_persists_generated_hash(app, admin_user,
         db.session.expire_all()
         stored = db.session.get(EventTeamCertificateRecipient, recipient.id)
         assert stored.cert_hash == recipient.cert_hash
+
+
+def test_job_registry_tracks_shared_progress_and_completes_once(app):
+    from app.services.job_registry_service import JobRegistryService
+
+    with app.app_context():
+        registry = JobRegistryService()
+        job = registry.create('certificate_batch', created_by='owner', entity_id=7, message='Iniciado', total_rows=5)
+        other = registry.create('certificate_batch', created_by='owner', entity_id=8)
+
+        assert registry.find_active('certificate_batch', created_by='owner', entity_id=7)['job_id'] == job['job_id']
+        assert registry.find_active('certificate_batch', created_by='someone-else') is None
+
+        registry.increment(job['job_id'], processed_rows=3, total_enviado=2, falha_fila=1)
+        assert registry.complete_if_done(job['job_id']) is False
+        registry.increment(job['job_id'], processed_rows=2, total_enviado=2)
+        assert registry.complete_if_done(job['job_id']) is True
+        assert registry.complete_if_done(job['job_id']) is False
+
+        finished = registry.get(job['job_id'])
+        assert finished['completed'] is True
+        assert finished['status'] == 'completed'
+        assert (finished['total_enviado'], finished['falha_fila']) == (4, 1)
+        assert registry.find_active('certificate_batch', created_by='owner', entity_id=7) is None
+
+        app.config['JOB_REGISTRY_STALE_AFTER_SECONDS'] = 60
+        registry.update(other['job_id'], status='running')
+        db.session.execute(
+            db.text('UPDATE background_jobs SET updated_at = updated_at - 120 WHERE job_id = :job_id'),
+            {'job_id': other['job_id']},
+        )
+        db.session.commit()
+        assert registry.find_active('certificate_batch', created_by='owner', entity_id=8) is None
+
+        with pytest.raises(ValueError):
+            registry.increment(job['job_id'], unknown_counter=1)
+
+
+def test_job_registry_create_if_absent_returns_the_job_that_won_the_race(app, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+    from app.services.job_registry_service import JobRegistryService
+
+    with app.app_context():
+        registry = JobRegistryService()
+        original_create = registry.create
+        winners = []
+
+        def create_after_concurrent_request(*args, **kwargs):
+            # Another request passes the same check and inserts first.
+            if not winners:
+                winners.append(original_create('certificate_batch', created_by='owner', entity_id=7))
+            return original_create(*args, **kwargs)
+
+        monkeypatch.setattr(registry, 'create', create_after_concurrent_request)
+        job, created = registry.create_if_absent('certificate_batch', created_by='owner', entity_id=7)
+
+        assert created is False
+        assert job['job_id'] == winners[0]['job_id']
+        assert db.session.query(BackgroundJob).filter_by(job_type='certificate_batch', completed=False).count() == 1
+        with pytest.raises(IntegrityError):
+            original_create('certificate_batch', created_by='owner', entity_id=7)
+
+        app.config['JOB_REGISTRY_STALE_AFTER_SECONDS'] = 60
+        db.session.execute(
+            db.text('UPDATE background_jobs SET updated_at = updated_at - 120 WHERE job_id = :job_id'),
+            {'job_id': job['job_id']},
+        )
+        db.session.commit()
+        replacement, created = registry.create_if_absent('certificate_batch', created_by='owner', entity_id=7)
+        assert created is True
+        assert replacement['job_id'] != job['job_id']
+        assert registry.get(job['job_id'])['status'] == 'error'
+
+
+def test_job_registry_counts_a_replayed_chunk_once(app):
+    from app.services.job_registry_service import JobRegistryService
+
+    with app.app_context():
+        registry = JobRegistryService()
+        job_id = registry.create('certificate_batch', created_by='owner', entity_id=7, total_rows=4)['job_id']
+
+        assert registry.record_chunk(job_id, 0, processed_rows=2, total_enviado=2) is True
+        # Chunk 1 fails and is dead-lettered, then replayed successfully.
+        assert registry.record_chunk(job_id, 1, processed_rows=2, falha_fila=2) is True
+        assert registry.complete_if_done(job_id) is True
+        assert registry.record_chunk(job_id, 1, processed_rows=2, total_enviado=1, sem_email=1) is False
+
+        job = registry.get(job_id)
+        assert (job['processed_rows'], job['total_enviado'], job['sem_email'], job['falha_fila']) == (4, 3, 1, 0)
+
+
+def test_notification_service_reuses_one_publisher_connection_and_reconnects(app, monkeypatch):
+    import pika
+    from app.services import notification_service as notification_module
+
+    opened = []
+
+    class FakeChannel:
+        def __init__(self):
+            self.is_open = True
+            self.published = []
+            self.fail_next = False
+
+        def basic_publish(self, exchange, routing_key, body, properties=None):
+            if self.fail_next:
+                raise pika.exceptions.StreamLostError('connection reset')
+            self.published.append((routing_key, json.loads(body)))
+
+    class FakeConnection:
+        def __init__(self, params):
+            self.params = params
+            self.is_open = True
+            self.channel_obj = FakeChannel()
+            opened.append(self)
+
+        def channel(self):
+            return self.channel_obj
+
+        def process_data_events(self, time_limit=None):
+            return None
+
+        def close(self):
+            self.is_open = False
+
+    monkeypatch.setattr(notification_module.pika, 'BlockingConnection', FakeConnection)
+    monkeypatch.setattr(notification_module.RabbitMQPublisher, '_instances', {})
+
+    with app.app_context():
+        service = NotificationService()
+        assert service.send_email_task('a@test.local', 'Um') is True
+        assert service.send_email_task('b@test.local', 'Dois') is True
+
+        assert len(opened) == 1
+        assert opened[0].params.heartbeat == app.config['RABBITMQ_HEARTBEAT_SECONDS']
+        assert [payload['to'] for _, payload in opened[0].channel_obj.published] == ['a@test.local', 'b@test.local']
+
+        opened[0].channel_obj.fail_next = True
+        assert service.send_email_task('c@test.local', 'Tres') is True
+        assert len(opened) == 2
+        assert opened[0].is_open is False
+        assert opened[1].channel_obj.published[0][1]['to'] == 'c@test.local'
+
+        # A forked child must not write to the parent's socket.
+        publisher = notification_module.RabbitMQPublisher.for_app()
+        monkeypatch.setattr(notification_module.os, 'getpid', lambda: publisher._pid + 1)
+        assert notification_module.RabbitMQPublisher.for_app() is not publisher
+        assert service.send_email_task('d@test.local', 'Quatro') is True
+        assert len(opened) == 3
+        assert opened[1].is_open is True
+
+
+def test_notification_service_send_email_tasks_confirms_windows_on_a_dedicated_connection(app, monkeypatch):
+    import pika
+    from types import SimpleNamespace
+    from app.services import notification_service as notification_module
+
+    class FakeIOLoop:
+        def __init__(self):
+            self.events = []
+            self.log = []
+
+        def call_later(self, delay, callback):
+            return callback
+
+        def remove_timeout(self, timer):
+            pass
+
+        def stop(self):
+            pass
+
+        def start(self):
+            # One pass of the loop: the broker answers everything sent so far.
+            self.log.append('wait')
+            events, self.events = self.events, []
+            for event in events:
+                event()
+
+    class FakeChannel:
+        def __init__(self, connection):
+            self.connection = connection
+            self.delivery_tag = 0
+
+        def add_on_close_callback(self, callback):
+            pass
+
+        def add_on_return_callback(self, callback):
+            self.on_return = callback
+
+        def confirm_delivery(self, ack_nack_callback, callback):
+            self.on_confirm = ack_nack_callback
+            self.connection.ioloop.events.append(lambda: callback(None))
+
+        def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+            assert mandatory
+            to_email = json.loads(body)['to']
+            self.delivery_tag += 1
+            tag = self.delivery_tag
+            self.connection.ioloop.log.append(to_email)
+            if to_email.startswith('drop@'):
+                error = pika.exceptions.StreamLostError('connection lost')
+                self.connection.ioloop.events.append(lambda: self.connection.on_close(self.connection, error))
+                return
+            if to_email.startswith('silent@'):
+                return
+            if to_email.startswith('unroutable@'):
+                self.connection.ioloop.events.append(lambda: self.on_return(self, None, properties, body))
+            method = pika.spec.Basic.Nack if to_email.startswith('nack@') else pika.spec.Basic.Ack
+            self.connection.ioloop.events.append(
+                lambda: self.on_confirm(SimpleNamespace(method=method(delivery_tag=tag)))
+            )
+
+    class FakeSelectConnection:
+        def __init__(self, params, on_open_callback, on_open_error_callback, on_close_callback):
+            self.ioloop = FakeIOLoop()
+            self.on_close = on_close_callback
+            self.is_closed = self.is_closing = False
+            self.ioloop.events.append(lambda: on_open_callback(self))
+            select_connections.append(self)
+
+        def channel(self, on_open_callback):
+            self.ioloop.events.append(lambda: on_open_callback(FakeChannel(self)))
+
+        def close(self):
+            self.is_closed = True
+
+    select_connections = []
+    monkeypatch.setattr(notification_module.pika, 'SelectConnection', FakeSelectConnection)
+    monkeypatch.setattr(
+        notification_module.pika,
+        'BlockingConnection',
+        lambda params: pytest.fail('bulk publishes must not use the transactional connection'),
+    )
+    monkeypatch.setattr(notification_module.RabbitMQPublisher, '_instances', {})
+
+    with app.app_context():
+        app.config['RABBITMQ_CONFIRM_WINDOW'] = 2
+        app.config['RABBITMQ_CONFIRM_TIMEOUT_SECONDS'] = 0.05
+        service = NotificationService()
+        results = service.send_email_tasks([
+            {'to_email': 'a@test.local', 'subject': 'A'},
+            {'to_email': 'nack@test.local', 'subject': 'B'},
+            {'to_email': 'c@test.local', 'subject': 'C'},
+            {'to_email': 'unroutable@test.local', 'subject': 'D'},
+            {'to_email': 'silent@test.local', 'subject': 'E'},
+        ])
+        assert results == [True, False, True, False, False]
+        assert len(select_connections) == 1
+        published = [entry for entry in select_connections[0].ioloop.log if entry != 'wait']
+        assert published == [
+            'a@test.local', 'nack@test.local', 'c@test.local', 'unroutable@test.local', 'silent@test.local',
+        ]
+        # Confirms are awaited once per window of two messages, not after every publish.
+        log = select_connections[0].ioloop.log
+        assert log[log.index('a@test.local'):log.index('silent@test.local') + 2] == [
+            'a@test.local', 'nack@test.local', 'wait',
+            'c@test.local', 'unroutable@test.local', 'wait',
+            'silent@test.local', 'wait',
+        ]
+
+        # A dropped connection fails the unconfirmed messages without republishing them.
+        results = service.send_email_tasks([
+            {'to_email': 'f@test.local', 'subject': 'F'},
+            {'to_email': 'drop@test.local', 'subject': 'G'},
+        ])
+        assert results == [True, False]
+        assert service.send_email_tasks([{'to_email': 'h@test.local', 'subject': 'H'}]) == [True]
+        assert len(select_connections) == 2
+        assert select_connections[0].is_closed is True
+
+        # Bulk batches never take the transactional connection's lock, so neither lane waits on the other.
+        publisher = notification_module.RabbitMQPublisher.for_app()
+        with publisher._lock:
+            assert service.send_email_tasks([{'to_email': 'i@test.local', 'subject': 'I'}]) == [True]
+
+
+def test_notification_service_routes_interactive_mail_to_transactional_lane(app, monkeypatch):
+    published = []
+
+    class FakePublisher:
+        def publish(self, routing_key, body, properties=None, exchange=''):
+            published.append((routing_key, json.loads(body)['to']))
+
+        def publish_many(self, messages, window=100, timeout=10):
+            published.extend((routing_key, json.loads(body)['to']) for routing_key, body, _ in messages)
+            return set()
+
+    service = NotificationService()
+    monkeypatch.setattr(service, '_get_publisher', lambda: FakePublisher())
+
+    with app.app_context():
+        assert service.send_email_task('reset@test.local', 'Redefinir senha') is True
+        assert service.send_email_task('resend@test.local', 'Certificado', priority='bulk') is True
+        assert service.send_email_tasks([{'to_email': 'batch@test.local', 'subject': 'Certificado'}]) == [True]
+        assert service.send_email_tasks(
+            [{'to_email': 'urgent@test.local', 'subject': 'Aviso'}], priority='transactional'
+        ) == [True]
+
+    assert published == [
+        ('email_transactional', 'reset@test.local'),
+        ('email_queue', 'resend@test.local'),
+        ('email_queue', 'batch@test.local'),
+        ('email_transactional', 'urgent@test.local'),
+    ]
+
+
+def test_relay_notification_outbox_publishes_confirmed_rows_and_keeps_failures(app, runner, monkeypatch):
+    batches = []
+    failing = {'to': 'b@test.local'}
+
+    class FakePublisher:
+        def publish_many(self, messages, window=100, timeout=10):
+            batches.append([(queue, json.loads(body)['to']) for queue, body, _ in messages])
+            return {index for index, (_, body, _) in enumerate(messages) if json.loads(body)['to'] == failing['to']}
+
+    monkeypatch.setattr(NotificationService, '_get_publisher', lambda self: FakePublisher())
+
+    with app.app_context():
+        service = NotificationService()
+        service.enqueue_email_task('a@test.local', 'A')
+        service.enqueue_email_task('b@test.local', 'B')
+        service.enqueue_email_task('c@test.local', 'C', priority='bulk')
+        db.session.commit()
+
+        assert service.relay_outbox(batch_size=10) == (2, 1)
+        assert batches[0] == [
+            ('email_transactional', 'a@test.local'),
+            ('email_transactional', 'b@test.local'),
+            ('email_queue', 'c@test.local'),
+        ]
+        remaining = NotificationOutbox.query.all()
+        assert len(remaining) == 1
+        assert json.loads(remaining[0].payload_json)['to'] == 'b@test.local'
+        assert remaining[0].attempts == 1
+        assert remaining[0].last_error
+
+    failing['to'] = None
+    result = runner.invoke(args=['relay-notification-outbox', '--once'])
+
+    assert result.exit_code == 0
+    assert '1 mensagem(ns) do outbox publicada(s)' in result.output
+    assert batches[-1] == [('email_transactional', 'b@test.local')]
+    with app.app_context():
+        assert NotificationOutbox.query.count() == 0
+        assert service.relay_outbox() == (0, 0)
+
+
+def test_relay_notification_outbox_leases_rows_and_commits_before_publishing(app, monkeypatch):
+    from datetime import datetime, timedelta
+
+    concurrent = []
+    outcome = {'failed': {0}}
+
+    class FakePublisher:
+        def publish_many(self, messages, window=100, timeout=10):
+            # A second relay running meanwhile finds the batch claimed, not locked.
+            concurrent.append(NotificationService().relay_outbox())
+            return outcome['failed']
+
+    monkeypatch.setattr(NotificationService, '_get_publisher', lambda self: FakePublisher())
+
+    with app.app_context():
+        service = NotificationService()
+        service.enqueue_email_task('a@test.local', 'A')
+        db.session.commit()
+
+        assert service.relay_outbox() == (0, 1)
+        assert concurrent == [(0, 0)]
+        row = NotificationOutbox.query.one()
+        assert row.attempts == 1
+        assert row.claimed_until is None
+
+        # A relay that died mid-batch keeps its rows until the lease expires.
+        row.claimed_until = datetime.utcnow() + timedelta(minutes=5)
+        db.session.commit()
+        assert service.relay_outbox() == (0, 0)
+
+        row.claimed_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        outcome['failed'] = set()
+        assert service.relay_outbox() == (1, 0)
+        assert NotificationOutbox.query.count() == 0
+
+
+def test_replay_email_dlq_command_requeues_dead_letters_with_fresh_retry_budget(app, runner, monkeypatch):
+    from app.services import notification_service as notification_module
+
+    dead_letters = [
+        (b'{"to": "a@test.local"}', {
+            'x-retry-attempt': 4,
+            'x-last-error': 'throttled',
+            'x-death': [{'queue': 'email_transactional'}],
+            'trace': 't1',
+        }),
+        (b'{"to": "b@test.local"}', None),
+        (b'{"to": "c@test.local"}', None),
+    ]
+
+    class FakeChannel:
+        def __init__(self):
+            self.published = []
+            self.acked = []
+            self.confirming = False
+
+        def queue_declare(self, queue, durable, passive):
+            return SimpleNamespace(method=SimpleNamespace(message_count=len(dead_letters)))
+
+        def confirm_delivery(self):
+            self.confirming = True
+
+        def basic_get(self, queue):
+            if not dead_letters:
+                return None, None, None
+            body, headers = dead_letters.pop(0)
+            tag = len(self.acked) + 1
+            properties = SimpleNamespace(headers=headers, content_type='application/json')
+            return SimpleNamespace(delivery_tag=tag), properties, body
+
+        def basic_publish(self, exchange, routing_key, body, properties):
+            self.published.append((routing_key, body, properties.headers))
+
+        def basic_ack(self, delivery_tag):
+            self.acked.append(delivery_tag)
+
+    channel = FakeChannel()
+
+    class FakeConnection:
+        def __init__(self, params):
+            self.is_open = True
+
+        def channel(self):
+            return channel
+
+        def close(self):
+            self.is_open = False
+
+    monkeypatch.setattr(notification_module.pika, 'BlockingConnection', FakeConnection)
+
+    result = runner.invoke(args=['replay-email-dlq', '--limit', '2'])
+
+    assert result.exit_code == 0
+    assert '2 mensagem(ns) reenviada(s)' in result.output
+    assert channel.confirming is True
+    assert channel.acked == [1, 2]
+    assert [item[0] for item in channel.published] == ['email_transactional', 'email_queue']
+    assert channel.published[0][2] == {'trace': 't1'}
+    assert channel.published[1][2] is None
+    assert len(dead_letters) == 1
+
+
+def test_mail_rate_limiter_spaces_sends_per_sender_and_domain():
+    from app.services.mail_rate_limit_service import LocalTokenBucketStore, MailRateLimiter
+
+    clock = [100.0]
+    limiter = MailRateLimiter.from_env({
+        'MAIL_RATE_SENDER_PER_MINUTE': '60',
+        'MAIL_RATE_SENDER_BURST': '2',
+        'MAIL_RATE_DOMAIN_PER_MINUTE': '0',
+        'MAIL_RATE_DOMAIN_OVERRIDES': 'slow.test=30:1, ignored=',
+    })
+    assert isinstance(limiter.store, LocalTokenBucketStore)
+    limiter.store = LocalTokenBucketStore(clock=lambda: clock[0])
+
+    # Burst of 2, then one slot per second reserved for each waiting caller.
+    assert [limiter.reserve('noreply@test.local', f'user{i}@test.local') for i in range(4)] == [0.0, 0.0, 1.0, 2.0]
+
+    clock[0] += 10
+    assert limiter.reserve('NoReply@test.local', 'a@fast.test') == 0.0
+    assert limiter.reserve('other@test.local', 'a@slow.test') == 0.0
+    # The slow.test bucket (30/min) dominates the sender bucket.
+    assert limiter.reserve('other@test.local', 'b@slow.test') == 2.0
+    assert limiter.reserve('fresh@test.local', 'not-an-address') == 0.0
+
+    slept = []
+    clock[0] += 10
+    limiter.wait('third@test.local', 'c@slow.test', sleep=slept.append)
+    limiter.wait('third@test.local', 'd@slow.test', sleep=slept.append)
+    assert slept == [2.0]
+
+
+def test_email_deduplicator_tracks_pending_and_sent_keys_until_they_expire():
+    from app.services.email_dedupe_service import EmailDeduplicator, LocalDedupeStore
+
+    clock = [100.0]
+    store = LocalDedupeStore(clock=lambda: clock[0])
+    deduplicator = EmailDeduplicator(store, ttl=60, pending_ttl=10)
+    key = NotificationService.build_idempotency_key('certificate', 'abc123', ' User@Test.local ')
+    assert key == 'certificate:abc123:user@test.local'
+    assert NotificationService.build_idempotency_key('certificate', None, 'user@test.local') is None
+
+    assert deduplicator.begin(key) is None
+    assert deduplicator.begin(key) == 'pending'
+    deduplicator.abort(key)
+    assert deduplicator.begin(key) is None
+    deduplicator.complete(key)
+    assert deduplicator.begin(key) == 'sent'
+
+    # Keys are scoped to one send: a replay of batch job-1 is skipped, a re-run as job-2 is mailed.
+    first_run = NotificationService.build_idempotency_key('certificate', 'abc123', 'user@test.local', 'job-1')
+    assert first_run == 'certificate:abc123:user@test.local:job-1'
+    assert deduplicator.begin(first_run) is None
+    deduplicator.complete(first_run)
+    assert deduplicator.begin(first_run) == 'sent'
+    assert deduplicator.begin(
+        NotificationService.build_idempotency_key('certificate', 'abc123', 'user@test.local', 'job-2')
+    ) is None
+
+    # A crashed sender's claim expires after pending_ttl; sent keys after ttl.
+    assert deduplicator.begin('other') is None
+    clock[0] += 11
+    assert deduplicator.begin('other') is None
+    clock[0] += 50
+    assert deduplicator.begin(key) is None
+    assert len(store._sent) == 0
+
+    assert EmailDeduplicator(store, ttl=0).begin('other') is None
+    assert EmailDeduplicator(store, ttl=0).begin('other') is None
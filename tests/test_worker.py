@@ -0,0 +1,484 @@
+import json
+import smtplib
+
+import pytest
+
+import worker
+
+
+class FakeSMTP:
+    instances = []
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.logins = 0
+        self.sent = []
+        self.quit_called = False
+        self.noop_code = 250
+        self.fail_next = None
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        return None
+
+    def login(self, username, password):
+        self.logins += 1
+
+    def noop(self):
+        return self.noop_code, b'OK'
+
+    def sendmail(self, from_addr, to_addrs, message):
+        if self.fail_next:
+            error, self.fail_next = self.fail_next, None
+            raise error
+        self.sent.append(to_addrs)
+
+    def quit(self):
+        self.quit_called = True
+
+    def close(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def pool():
+    FakeSMTP.instances = []
+    return worker.SMTPConnectionPool(
+        'smtp.test.local',
+        587,
+        'user',
+        'secret',
+        size=2,
+        max_messages=3,
+        noop_after=30,
+        factory=FakeSMTP,
+    )
+
+
+def test_smtp_pool_reuses_logged_in_session_until_message_limit(pool):
+    for index in range(4):
+        pool.send('noreply@test.local', [f'user{index}@test.local'], 'message')
+
+    assert len(FakeSMTP.instances) == 2
+    first, second = FakeSMTP.instances
+    assert first.logins == 1
+    assert len(first.sent) == 3
+    assert first.quit_called is True
+    assert second.sent == [['user3@test.local']]
+    assert second.quit_called is False
+
+    pool.close()
+    assert second.quit_called is True
+
+
+def test_smtp_pool_checks_idle_sessions_with_noop(pool, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(worker.time, 'monotonic', lambda: clock[0])
+
+    pool.send('noreply@test.local', ['a@test.local'], 'message')
+    stale = FakeSMTP.instances[0]
+    stale.noop_code = 421
+    clock[0] += 31
+
+    pool.send('noreply@test.local', ['b@test.local'], 'message')
+
+    assert len(FakeSMTP.instances) == 2
+    assert stale.quit_called is True
+    assert FakeSMTP.instances[1].sent == [['b@test.local']]
+
+
+def test_smtp_pool_reconnects_on_transient_errors_only(pool):
+    pool.send('noreply@test.local', ['a@test.local'], 'message')
+    session = FakeSMTP.instances[0]
+    session.fail_next = smtplib.SMTPDataError(421, b'Service not available, closing channel')
+
+    pool.send('noreply@test.local', ['b@test.local'], 'message')
+
+    assert session.quit_called is True
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[1].sent == [['b@test.local']]
+
+    FakeSMTP.instances[1].fail_next = smtplib.SMTPDataError(554, b'Message rejected')
+    with pytest.raises(smtplib.SMTPDataError):
+        pool.send('noreply@test.local', ['c@test.local'], 'message')
+    assert len(FakeSMTP.instances) == 2
+
+
+def test_concurrent_callback_sends_in_pool_and_settles_on_connection_thread(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import get_ident
+    from types import SimpleNamespace
+
+    connection_thread = get_ident()
+    sender_threads = set()
+
+    def fake_send_email(to, subject, body, attachment_path=None):
+        sender_threads.add(get_ident())
+        if to == 'broken@test.local':
+            raise smtplib.SMTPDataError(554, b'Message rejected')
+
+    class FakeConnection:
+        def __init__(self):
+            self.scheduled = []
+
+        def add_callback_threadsafe(self, callback):
+            self.scheduled.append(callback)
+
+    class FakeChannel:
+        is_open = True
+
+        def __init__(self):
+            self.settled = []
+
+        def basic_ack(self, delivery_tag):
+            self.settled.append(('ack', delivery_tag, get_ident()))
+
+        def basic_nack(self, delivery_tag, requeue=True):
+            self.settled.append(('nack', delivery_tag, requeue))
+
+    monkeypatch.setattr(worker, 'send_email', fake_send_email)
+    connection = FakeConnection()
+    channel = FakeChannel()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        on_message = worker.make_concurrent_callback(connection, executor)
+        for tag, to in enumerate(['a@test.local', 'broken@test.local', 'c@test.local'], start=1):
+            body = json.dumps({'to': to, 'subject': 'S', 'body': 'x'})
+            on_message(channel, SimpleNamespace(delivery_tag=tag), None, body)
+
+    assert connection_thread not in sender_threads
+    assert channel.settled == []
+
+    for scheduled in connection.scheduled:
+        scheduled()
+
+    assert sorted(channel.settled) == [
+        ('ack', 1, connection_thread),
+        ('ack', 3, connection_thread),
+        ('nack', 2, False),
+    ]
+
+
+def test_async_worker_pool_reuses_sessions_and_settles_messages(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+
+    import aiosmtplib
+
+    import async_worker
+
+    sessions = []
+
+    class FakeAsyncSMTP:
+        def __init__(self, hostname, port):
+            self.logins = 0
+            self.sent = []
+            self.fail_next = None
+            self.quit_called = False
+            sessions.append(self)
+
+        async def connect(self):
+            return None
+
+        async def login(self, username, password):
+            self.logins += 1
+
+        async def noop(self):
+            return SimpleNamespace(code=250)
+
+        async def sendmail(self, from_addr, to_addrs, message):
+            await asyncio.sleep(0)
+            if self.fail_next:
+                error, self.fail_next = self.fail_next, None
+                raise error
+            self.sent.append(to_addrs[0])
+
+        async def quit(self):
+            self.quit_called = True
+
+        def close(self):
+            self.quit_called = True
+
+    class FakeMessage:
+        def __init__(self, to):
+            self.body = json.dumps({'to': to, 'subject': 'Assunto', 'body': '<p>Oi</p>'}).encode()
+            self.settled = None
+
+        async def ack(self):
+            self.settled = 'ack'
+
+        async def reject(self, requeue=False):
+            self.settled = ('reject', requeue)
+
+    pool = async_worker.AsyncSMTPConnectionPool(
+        'smtp.test.local', 587, 'user', 'secret', size=2, max_messages=100, noop_after=30, factory=FakeAsyncSMTP,
+    )
+    monkeypatch.setattr(async_worker, 'smtp_pool', pool)
+    monkeypatch.setattr(async_worker, 'SMTP_USERNAME', 'user')
+    monkeypatch.setattr(async_worker, 'SMTP_PASSWORD', 'secret')
+
+    async def run():
+        messages = [FakeMessage(f'user{index}@test.local') for index in range(6)]
+        await asyncio.gather(*(async_worker.handle_message(message) for message in messages))
+
+        pool._idle[-1]['server'].fail_next = aiosmtplib.SMTPResponseException(421, 'closing channel')
+        retried = FakeMessage('retry@test.local')
+        await async_worker.handle_message(retried)
+
+        sessions[-1].fail_next = aiosmtplib.SMTPResponseException(554, 'rejected')
+        rejected = FakeMessage('rejected@test.local')
+        await async_worker.handle_message(rejected)
+        return messages, retried, rejected
+
+    messages, retried, rejected = asyncio.run(run())
+
+    assert [message.settled for message in messages] == ['ack'] * 6
+    assert sum(len(session.sent) for session in sessions) == 7
+    assert len(sessions) == 3
+    assert all(session.logins == 1 for session in sessions)
+    assert retried.settled == 'ack'
+    assert rejected.settled == ('reject', False)
+
+
+def test_failed_messages_go_through_retry_tiers_before_the_dlq(monkeypatch):
+    from types import SimpleNamespace
+
+    class FakeChannel:
+        is_open = True
+
+        def __init__(self):
+            self.published = []
+            self.settled = []
+
+        def basic_publish(self, exchange, routing_key, body, properties):
+            self.published.append((routing_key, properties))
+
+        def basic_ack(self, delivery_tag):
+            self.settled.append(('ack', delivery_tag))
+
+        def basic_nack(self, delivery_tag, requeue=True):
+            self.settled.append(('nack', delivery_tag, requeue))
+
+    errors = {'error': smtplib.SMTPDataError(451, b'Throttled')}
+
+    def failing_send_email(to, subject, body, attachment_path=None):
+        raise errors['error']
+
+    monkeypatch.setattr(worker, 'send_email', failing_send_email)
+    monkeypatch.setattr(worker, 'EMAIL_RETRY_DELAYS', [30, 120])
+    body = json.dumps({'to': 'a@test.local', 'subject': 'S', 'body': 'x'})
+    channel = FakeChannel()
+
+    worker.callback(channel, SimpleNamespace(delivery_tag=1), SimpleNamespace(headers=None), body)
+    queue, properties = channel.published[-1]
+    assert queue == 'email_retry_30s'
+    assert properties.expiration == '30000'
+    assert properties.headers['x-retry-attempt'] == 1
+    assert channel.settled[-1] == ('ack', 1)
+
+    worker.callback(channel, SimpleNamespace(delivery_tag=2), SimpleNamespace(headers=properties.headers), body)
+    queue, properties = channel.published[-1]
+    assert queue == 'email_retry_120s'
+    assert properties.headers['x-retry-attempt'] == 2
+    assert channel.settled[-1] == ('ack', 2)
+
+    worker.callback(channel, SimpleNamespace(delivery_tag=3), SimpleNamespace(headers=properties.headers), body)
+    assert len(channel.published) == 2
+    assert channel.settled[-1] == ('nack', 3, False)
+
+    errors['error'] = smtplib.SMTPDataError(554, b'Rejected')
+    worker.callback(channel, SimpleNamespace(delivery_tag=4), SimpleNamespace(headers=None), body)
+    assert len(channel.published) == 2
+    assert channel.settled[-1] == ('nack', 4, False)
+
+    # Transactional mail retries through its own tiers, so it comes back to its lane.
+    errors['error'] = smtplib.SMTPDataError(451, b'Throttled')
+    method = SimpleNamespace(delivery_tag=5, routing_key='email_transactional')
+    worker.callback(channel, method, SimpleNamespace(headers=None), body)
+    assert channel.published[-1][0] == 'email_transactional_retry_30s'
+    assert channel.settled[-1] == ('ack', 5)
+
+
+def test_retry_queues_dead_letter_back_into_their_lane(monkeypatch):
+    declared = []
+
+    class FakeChannel:
+        def queue_declare(self, queue, durable, arguments=None):
+            declared.append((queue, (arguments or {}).get('x-dead-letter-routing-key')))
+
+    monkeypatch.setattr(worker, 'EMAIL_RETRY_DELAYS', [30, 120])
+    channel = FakeChannel()
+    for lane in worker.NotificationService.LANES:
+        assert worker.declare_lane(None, channel, lane) is channel
+
+    assert declared == [
+        ('email_transactional', 'dlq_key'),
+        ('email_transactional_retry_30s', 'email_transactional'),
+        ('email_transactional_retry_120s', 'email_transactional'),
+        ('email_queue', 'dlq_key'),
+        ('email_retry_30s', 'email_queue'),
+        ('email_retry_120s', 'email_queue'),
+    ]
+    assert worker.message_lane('email_transactional') == 'email_transactional'
+    assert worker.message_lane('email_retry_30s') == 'email_queue'
+
+
+def test_process_message_skips_idempotency_keys_already_sent(monkeypatch):
+    from app.services.email_dedupe_service import EmailDeduplicator, LocalDedupeStore
+
+    sent = []
+    failures = []
+
+    def fake_send_email(to, subject, body, attachment_path=None):
+        if failures:
+            raise failures.pop()
+        sent.append(to)
+
+    monkeypatch.setattr(worker, 'send_email', fake_send_email)
+    monkeypatch.setattr(worker, 'deduplicator', EmailDeduplicator(LocalDedupeStore(), ttl=60, pending_ttl=10))
+    body = json.dumps({
+        'to': 'a@test.local', 'subject': 'S', 'body': 'x', 'idempotency_key': 'certificate:h1:a@test.local',
+    })
+
+    failures.append(smtplib.SMTPDataError(451, b'Throttled'))
+    with pytest.raises(smtplib.SMTPDataError):
+        worker.process_message(body)
+    # The failed attempt released its claim, so the retry sends; redeliveries after that do not.
+    worker.process_message(body)
+    worker.process_message(body)
+    worker.process_message(json.dumps({'to': 'a@test.local', 'subject': 'S', 'body': 'x'}))
+    assert sent == ['a@test.local', 'a@test.local']
+
+    worker.deduplicator.begin('certificate:h2:b@test.local')
+    in_flight = json.dumps({
+        'to': 'b@test.local', 'subject': 'S', 'body': 'x', 'idempotency_key': 'certificate:h2:b@test.local',
+    })
+    with pytest.raises(worker.EmailInFlightError) as excinfo:
+        worker.process_message(in_flight)
+    assert worker.is_retryable(excinfo.value) is True
+    assert sent == ['a@test.local', 'a@test.local']
+
+
+def test_broadcast_is_sent_in_bcc_chunks_and_retries_resume_after_sent_chunks(monkeypatch):
+    from app.services.email_dedupe_service import EmailDeduplicator, LocalDedupeStore
+
+    transactions = []
+    failures = {}
+
+    def fake_send_email(to, subject, body, attachment_path=None, bcc=None):
+        if failures.pop(len(transactions), None):
+            raise smtplib.SMTPDataError(451, b'Throttled')
+        transactions.append((to, bcc))
+
+    monkeypatch.setattr(worker, 'send_email', fake_send_email)
+    monkeypatch.setattr(worker, 'DEFAULT_SENDER', 'noreply@test.local')
+    monkeypatch.setattr(worker, 'EMAIL_BROADCAST_BCC_LIMIT', 2)
+    monkeypatch.setattr(worker, 'deduplicator', EmailDeduplicator(LocalDedupeStore(), ttl=60, pending_ttl=10))
+    body = json.dumps({
+        'type': 'broadcast',
+        'to': None,
+        'subject': 'Comunicado',
+        'body': '<p>Oi</p>',
+        'bcc': [f'user{index}@test.local' for index in range(5)],
+        'idempotency_key': 'broadcast:abc',
+    })
+
+    failures[1] = True
+    with pytest.raises(smtplib.SMTPDataError):
+        worker.process_message(body)
+    worker.process_message(body)
+
+    assert transactions == [
+        ('noreply@test.local', ['user0@test.local', 'user1@test.local']),
+        ('noreply@test.local', ['user2@test.local', 'user3@test.local']),
+        ('noreply@test.local', ['user4@test.local']),
+    ]
+
+
+def test_send_email_waits_for_rate_limiter_before_smtp(monkeypatch):
+    calls = []
+
+    class FakeLimiter:
+        def wait(self, sender, recipient):
+            calls.append(('wait', sender, recipient))
+
+    class FakePool:
+        def send(self, from_addr, to_addrs, message):
+            calls.append(('send', from_addr, to_addrs))
+
+    monkeypatch.setattr(worker, 'SMTP_USERNAME', 'user')
+    monkeypatch.setattr(worker, 'SMTP_PASSWORD', 'secret')
+    monkeypatch.setattr(worker, 'DEFAULT_SENDER', 'noreply@test.local')
+    monkeypatch.setattr(worker, 'rate_limiter', FakeLimiter())
+    monkeypatch.setattr(worker, 'smtp_pool', FakePool())
+
+    worker.send_email('a@test.local', 'Assunto', '<p>Oi</p>')
+
+    assert calls == [
+        ('wait', 'noreply@test.local', 'a@test.local'),
+        ('send', 'noreply@test.local', ['a@test.local']),
+    ]
+
+
+def test_worker_records_pipeline_metrics_and_serves_them_over_http(monkeypatch):
+    import time
+    import urllib.request
+    from types import SimpleNamespace
+
+    from app.services.email_metrics_service import EmailMetrics, start_metrics_server
+
+    registry = EmailMetrics()
+    monkeypatch.setattr(worker, 'metrics', registry)
+    monkeypatch.setattr(worker, 'EMAIL_RETRY_DELAYS', [30])
+    outcomes = [smtplib.SMTPDataError(451, b'Throttled'), None]
+
+    def fake_send_email(to, subject, body, attachment_path=None):
+        error = outcomes.pop(0)
+        if error:
+            raise error
+
+    class FakeChannel:
+        is_open = True
+
+        def basic_publish(self, exchange, routing_key, body, properties):
+            self.retry_headers = properties.headers
+
+        def basic_ack(self, delivery_tag):
+            pass
+
+        def basic_nack(self, delivery_tag, requeue=True):
+            pass
+
+    monkeypatch.setattr(worker, 'send_email', fake_send_email)
+    channel = FakeChannel()
+    body = json.dumps({'to': 'a@test.local', 'subject': 'S', 'template_name': 'welcome.html', 'template_data': {}})
+    method = SimpleNamespace(delivery_tag=1, routing_key='email_transactional')
+
+    worker.callback(channel, method, SimpleNamespace(headers={'x-published-at': time.time() - 5}), body)
+    # The retried delivery waited in a retry tier: not counted as queue dwell.
+    worker.callback(channel, method, SimpleNamespace(headers=channel.retry_headers), body)
+
+    snapshot = registry.snapshot()
+    counters = {(item['name'], tuple(sorted(item['labels'].items()))): item['value'] for item in snapshot['counters']}
+    assert counters[('email_processed', (('lane', 'email_transactional'), ('outcome', 'retried')))] == 1
+    assert counters[('email_processed', (('lane', 'email_transactional'), ('outcome', 'ok')))] == 1
+    histograms = {item['name']: item for item in snapshot['histograms']}
+    assert histograms['email_queue_dwell_seconds']['count'] == 1
+    assert histograms['email_queue_dwell_seconds']['sum'] >= 5
+    assert histograms['email_queue_dwell_seconds']['p50'] == 10
+    assert histograms['email_render_seconds']['labels'] == {'template': 'welcome.html'}
+    assert histograms['email_render_seconds']['count'] == 2
+
+    server = start_metrics_server(0, '127.0.0.1', registry=registry)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        with urllib.request.urlopen(f'{url}/metrics.json', timeout=5) as response:
+            assert json.loads(response.read())['counters'] == snapshot['counters']
+        with urllib.request.urlopen(f'{url}/metrics', timeout=5) as response:
+            text = response.read().decode()
+        assert 'euroeventos_email_processed_total{lane="email_transactional",outcome="retried"} 1' in text
+        assert 'euroeventos_email_queue_dwell_seconds_bucket{lane="email_transactional",le="+Inf"} 1' in text
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -4,6 +4,12 @@ import time
 import os
 import sys
 import logging
+import smtplib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from queue import Empty, LifoQueue
+from threading import BoundedSemaphore
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
@@ -16,7 +22,12 @@ load_dotenv()
 # Add parent directory to path to import app modules
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app.services.email_template_service import EmailTemplateService
+# App imports come after load_dotenv() and the sys.path setup above.
+from app.services.email_dedupe_service import SENT, EmailDeduplicator  # noqa: E402
+from app.services.email_metrics_service import metrics, start_metrics_server  # noqa: E402
+from app.services.email_template_service import EmailTemplateService  # noqa: E402
+from app.services.mail_rate_limit_service import MailRateLimiter  # noqa: E402
+from app.services.notification_service import NotificationService  # noqa: E402
 
 # Configure logging
 logging.basicConfig(
@@ -30,7 +41,8 @@ logger = logging.getLogger(__name__)
 
 """
 RabbitMQ Worker for EuroEventos.
-Processes asynchronous email tasks from the 'email_queue'.
+Processes asynchronous email tasks from the 'email_transactional' lane
+(served first) and the bulk 'email_queue'.
 Includes Dead Letter Queue (DLQ) support for failure handling.
 """
 
@@ -43,7 +55,177 @@ SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
 SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
 DEFAULT_SENDER = os.environ.get('DEFAULT_SENDER', '')
-template_service = EmailTemplateService()
+# Messages sent in parallel by one worker process, and how many unacked
+# messages the broker may hand it ahead of time. 1 keeps strictly serial delivery.
+WORKER_CONCURRENCY = max(int(os.environ.get('WORKER_CONCURRENCY', 1)), 1)
+_DEFAULT_WORKER_PREFETCH = WORKER_CONCURRENCY * 2 if WORKER_CONCURRENCY > 1 else 1
+WORKER_PREFETCH = max(int(os.environ.get('WORKER_PREFETCH', _DEFAULT_WORKER_PREFETCH)), 1)
+# Authenticated SMTP sessions are kept open and reused across messages.
+# Senders (and prefetch) reserved for the transactional lane in concurrent
+# mode, so interactive mail never waits behind a queued certificate batch.
+WORKER_TRANSACTIONAL_CONCURRENCY = max(int(os.environ.get('WORKER_TRANSACTIONAL_CONCURRENCY', 1)), 1)
+SMTP_POOL_SIZE = max(int(os.environ.get('SMTP_POOL_SIZE', max(WORKER_CONCURRENCY, 2))), 1)
+SMTP_MAX_MESSAGES_PER_CONNECTION = max(int(os.environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', 100)), 1)
+SMTP_NOOP_AFTER_SECONDS = max(int(os.environ.get('SMTP_NOOP_AFTER_SECONDS', 30)), 0)
+# Delays (seconds) of the retry tiers a failed message goes through before
+# landing in the DLQ; each tier is a queue that dead-letters back into its lane.
+EMAIL_RETRY_DELAYS = [
+    int(delay) for delay in os.environ.get('EMAIL_RETRY_DELAYS', '30,120,600,1800').split(',') if delay.strip()
+]
+# Envelope recipients per SMTP transaction when sending a broadcast in BCC
+# (Microsoft 365 accepts up to 500 recipients per message).
+EMAIL_BROADCAST_BCC_LIMIT = max(int(os.environ.get('EMAIL_BROADCAST_BCC_LIMIT', 50)), 1)
+# Compiled e-mail templates persist here across restarts; identical renders
+# (same template and template_data) are served from memory, and template
+# edits are picked up every EMAIL_TEMPLATE_WATCH_SECONDS.
+EMAIL_TEMPLATE_CACHE_DIR = os.environ.get('EMAIL_TEMPLATE_CACHE_DIR') or os.path.join(
+    tempfile.gettempdir(), 'euroeventos-email-templates'
+)
+EMAIL_TEMPLATE_RENDER_CACHE_SIZE = max(int(os.environ.get('EMAIL_TEMPLATE_RENDER_CACHE_SIZE', 256)), 0)
+EMAIL_TEMPLATE_WATCH_SECONDS = max(float(os.environ.get('EMAIL_TEMPLATE_WATCH_SECONDS', 5)), 0)
+# Port of the /metrics and /metrics.json endpoint (0 disables it); one port per worker process.
+WORKER_METRICS_PORT = max(int(os.environ.get('WORKER_METRICS_PORT', 0)), 0)
+WORKER_METRICS_HOST = os.environ.get('WORKER_METRICS_HOST', '0.0.0.0')
+template_service = EmailTemplateService(
+    bytecode_cache_dir=EMAIL_TEMPLATE_CACHE_DIR,
+    render_cache_size=EMAIL_TEMPLATE_RENDER_CACHE_SIZE,
+    watch_interval=EMAIL_TEMPLATE_WATCH_SECONDS,
+)
+# Token buckets per sender account and recipient domain (MAIL_RATE_* variables);
+# MAIL_RATE_REDIS_URL shares them across worker processes.
+rate_limiter = MailRateLimiter.from_env()
+# Idempotency keys already sent are skipped (EMAIL_DEDUPE_* variables);
+# EMAIL_DEDUPE_REDIS_URL shares them across worker processes.
+deduplicator = EmailDeduplicator.from_env()
+
+
+class EmailInFlightError(RuntimeError):
+    """Another delivery of the same idempotency key is being sent right now."""
+
+
+class SMTPConnectionPool:
+    """
+    Small pool of logged-in SMTP sessions shared by the worker.
+
+    A session idle for more than ``noop_after`` seconds is checked with NOOP
+    before reuse, and is closed after ``max_messages`` messages so long-lived
+    sessions never hit server-side limits. A transient failure (4xx, including
+    421 "service closing") or a dropped session discards the session and the
+    message is retried once on a fresh one.
+    """
+
+    def __init__(self, host, port, username, password, size=2, max_messages=100,
+                 noop_after=30, factory=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_messages = max_messages
+        self.noop_after = noop_after
+        self.factory = factory
+        self._idle = LifoQueue()
+        self._slots = BoundedSemaphore(size)
+
+    def _connect(self):
+        server = self.factory(self.host, self.port)
+        server.starttls()
+        server.login(self.username, self.password)
+        logger.info(f"Opened SMTP session to {self.host}:{self.port}")
+        return {'server': server, 'sent': 0, 'last_used': time.monotonic()}
+
+    @staticmethod
+    def _close(session):
+        try:
+            session['server'].quit()
+        except Exception:
+            try:
+                session['server'].close()
+            except Exception:
+                pass
+
+    def _is_healthy(self, session):
+        if time.monotonic() - session['last_used'] <= self.noop_after:
+            return True
+        try:
+            code, _ = session['server'].noop()
+        except (smtplib.SMTPException, OSError):
+            return False
+        return code == 250
+
+    def _acquire(self):
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except Empty:
+                return self._connect()
+            if self._is_healthy(session):
+                return session
+            self._close(session)
+
+    def _release(self, session):
+        if session['sent'] >= self.max_messages:
+            self._close(session)
+        else:
+            session['last_used'] = time.monotonic()
+            self._idle.put(session)
+
+    @staticmethod
+    def _is_transient(error):
+        # SMTPException subclasses OSError, so reply codes must be checked first.
+        if isinstance(error, smtplib.SMTPResponseException):
+            return 400 <= error.smtp_code < 500
+        if isinstance(error, smtplib.SMTPException):
+            return isinstance(error, smtplib.SMTPServerDisconnected)
+        return isinstance(error, OSError)
+
+    def send(self, from_addr, to_addrs, message):
+        with self._slots:
+            for attempt in range(2):
+                session = None
+                try:
+                    session = self._connect() if attempt else self._acquire()
+                    session['server'].sendmail(from_addr, to_addrs, message)
+                except Exception as e:
+                    if session is not None:
+                        self._close(session)
+                    if attempt or not self._is_transient(e):
+                        raise
+                    logger.warning(f"SMTP session failed ({e}); retrying on a new session")
+                    continue
+                session['sent'] += 1
+                self._release(session)
+                return
+
+    def close(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except Empty:
+                return
+
+
+smtp_pool = SMTPConnectionPool(
+    SMTP_SERVER,
+    SMTP_PORT,
+    SMTP_USERNAME,
+    SMTP_PASSWORD,
+    size=SMTP_POOL_SIZE,
+    max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION,
+    noop_after=SMTP_NOOP_AFTER_SECONDS,
+)
+
+
+def precompile_templates():
+    """Compiles the e-mail templates at startup so the first messages skip it."""
+    started = time.monotonic()
+    try:
+        count = template_service.precompile()
+    except Exception as e:
+        # A broken template still falls back per message; don't block startup.
+        logger.error(f"Template precompilation failed: {e}")
+        return 0
+    logger.info(f"Precompiled {count} email templates in {time.monotonic() - started:.2f}s")
+    return count
 
 
 def build_email_body(payload):
@@ -55,7 +237,8 @@ def build_email_body(payload):
     if template_name:
         try:
             logger.info(f"Rendering email template: {template_name}")
-            return template_service.render_template(template_name, template_data)
+            with metrics.timer('email_render_seconds', template=template_name):
+                return template_service.render_template(template_name, template_data)
         except Exception as e:
             logger.error(f"Template rendering failed ({template_name}): {e}")
 
@@ -64,18 +247,13 @@ def build_email_body(payload):
 
     return "<p>Mensagem automática do sistema EuroEventos.</p>"
 
-def send_email(to, subject, body, attachment_path=None):
+
+def build_message(to, subject, body, attachment_path=None):
     """
-    Sends an email via SMTP with optional file attachments.
-    
-    Args:
-        to (str): Recipient email address
-        subject (str): Email subject line
-        body (str): Email content (HTML or plain text)
-        attachment_path (str, optional): Path to file to attach
-        
+    Builds the MIME message for one email, attaching ``attachment_path`` if it exists.
+
     Raises:
-        Exception: If email sending fails
+        Exception: If the attachment cannot be read
     """
     logger.info(f"Preparing email to {to}")
     logger.debug(f"Subject: {subject}")
@@ -110,18 +288,39 @@ def send_email(to, subject, body, attachment_path=None):
                 raise
         else:
             logger.warning(f"Attachment not found at {attachment_path}")
+
+    return msg
+
+
+def send_email(to, subject, body, attachment_path=None, bcc=None):
+    """
+    Sends an email via SMTP with optional file attachments.
     
+    Args:
+        to (str): Recipient email address
+        subject (str): Email subject line
+        body (str): Email content (HTML or plain text)
+        attachment_path (str, optional): Path to file to attach
+        bcc (list, optional): Envelope recipients; when given, ``to`` is only
+            the visible header and the list never appears in the message
+        
+    Raises:
+        Exception: If email sending fails
+    """
+    msg = build_message(to, subject, body, attachment_path)
+    recipients = list(bcc) if bcc else [to]
+
     # Send email via SMTP (only if credentials are configured)
     if SMTP_USERNAME and SMTP_PASSWORD:
         try:
-            import smtplib
-            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.sendmail(DEFAULT_SENDER, [to], msg.as_string())
-            server.quit()
-            logger.info(f"Email successfully sent to {to}")
+            # A BCC chunk spans many domains: only the sender bucket applies.
+            rate_limiter.wait(DEFAULT_SENDER, None if bcc else to)
+            with metrics.timer('email_smtp_seconds'):
+                smtp_pool.send(DEFAULT_SENDER, recipients, msg.as_string())
+            metrics.increment('email_sent', outcome='ok')
+            logger.info(f"Email successfully sent to {to if not bcc else f'{len(recipients)} BCC recipients'}")
         except Exception as e:
+            metrics.increment('email_sent', outcome='error')
             logger.error(f"Failed to send email: {e}")
             raise
     else:
@@ -130,33 +329,268 @@ def send_email(to, subject, body, attachment_path=None):
         time.sleep(1)  # Simulate network delay
         logger.info(f"[SIMULATION] Email successfully prepared for {to}")
 
-def callback(ch, method, properties, body):
+
+def begin_delivery(data):
     """
-    Callback function executed when a message is received from the queue.
-    Decodes the JSON payload and attempts to send the email.
+    Claims the payload's idempotency key before sending.
+    Returns False when the key was already sent (the message is acked without
+    mail), and raises ``EmailInFlightError`` while another worker is sending
+    it, so the message goes to a retry tier instead of being sent twice.
     """
-    logger.info("Received notification task")
+    key = data.get('idempotency_key')
+    state = deduplicator.begin(key)
+    if state == SENT:
+        logger.info(f"Skipping duplicate email {key}")
+        metrics.increment('email_duplicates_skipped')
+        return False
+    if state is not None:
+        raise EmailInFlightError(f"Email {key} is already being sent")
+    return True
+
+
+def broadcast_chunks(data):
+    """
+    Splits a broadcast payload into ``(idempotency key, recipients)`` chunks
+    of at most EMAIL_BROADCAST_BCC_LIMIT, each sent as one SMTP transaction.
+    """
+    recipients = data.get('bcc') or []
+    key = data.get('idempotency_key')
+    for index, start in enumerate(range(0, len(recipients), EMAIL_BROADCAST_BCC_LIMIT)):
+        yield (f'{key}:{index}' if key else None), recipients[start:start + EMAIL_BROADCAST_BCC_LIMIT]
+
+
+def send_broadcast(data):
+    """
+    Sends a broadcast in BCC chunks. Chunks already sent (by an earlier
+    attempt of this message) are skipped, so a retry resumes where it failed.
+    """
+    body_content = build_email_body(data)
+    to = data.get('to') or DEFAULT_SENDER
+    for chunk_key, chunk in broadcast_chunks(data):
+        if not begin_delivery({'idempotency_key': chunk_key}):
+            continue
+        try:
+            send_email(to, data['subject'], body_content, bcc=chunk)
+        except Exception:
+            deduplicator.abort(chunk_key)
+            raise
+        deduplicator.complete(chunk_key)
+
+
+def process_message(body):
+    """Decodes one task from the queue and sends its email. Raises on failure."""
+    data = json.loads(body)
+    if data.get('type') == NotificationService.BROADCAST_TYPE:
+        send_broadcast(data)
+        return
+    if not begin_delivery(data):
+        return
+    key = data.get('idempotency_key')
     try:
-        data = json.loads(body)
         body_content = build_email_body(data)
         send_email(
-            data['to'], 
-            data['subject'], 
+            data['to'],
+            data['subject'],
             body_content,
             data.get('attachment')
         )
-        # Acknowledge successful processing
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except Exception:
+        deduplicator.abort(key)
+        raise
+    deduplicator.complete(key)
+
+
+def observe_dwell(headers, lane):
+    """
+    Records how long a first delivery waited in the broker, from the
+    publisher's timestamp header. Retried messages are skipped: their wait
+    is the retry tier delay, not queue lag.
+    """
+    headers = headers or {}
+    published_at = headers.get(NotificationService.PUBLISHED_AT_HEADER)
+    if published_at is None or headers.get(NotificationService.ATTEMPT_HEADER):
+        return
+    try:
+        metrics.observe('email_queue_dwell_seconds', time.time() - float(published_at), lane=lane)
+    except (TypeError, ValueError):
+        pass
+
+
+def retry_queue_name(delay, lane=NotificationService.QUEUE_NAME):
+    # The bulk lane keeps the original 'email_retry_<delay>s' names.
+    prefix = 'email' if lane == NotificationService.QUEUE_NAME else lane
+    return f'{prefix}_retry_{delay}s'
+
+
+def message_lane(routing_key):
+    """Lane of a delivery: retried messages dead-letter back with their lane as routing key."""
+    return routing_key if routing_key in NotificationService.LANES else NotificationService.QUEUE_NAME
+
+
+def is_retryable(error):
+    """Malformed payloads and permanent SMTP rejections go straight to the DLQ."""
+    if isinstance(error, (ValueError, KeyError)):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    return True
+
+
+def retry_target(headers, error, retryable=is_retryable, lane=NotificationService.QUEUE_NAME):
+    """
+    Picks the retry tier for a failed message.
+
+    Returns:
+        tuple: (queue name, delay in seconds, next attempt number), or None
+        when the message should be dead-lettered.
+    """
+    if not retryable(error):
+        return None
+    attempt = int((headers or {}).get(NotificationService.ATTEMPT_HEADER) or 0)
+    if attempt >= len(EMAIL_RETRY_DELAYS):
+        return None
+    delay = EMAIL_RETRY_DELAYS[attempt]
+    return retry_queue_name(delay, lane), delay, attempt + 1
+
+
+def retry_headers(headers, attempt, error):
+    headers = dict(headers or {})
+    headers.pop('x-death', None)
+    headers[NotificationService.ATTEMPT_HEADER] = attempt
+    headers[NotificationService.LAST_ERROR_HEADER] = str(error)[:500]
+    return headers
+
+
+def declare_retry_queues(channel, lane=NotificationService.QUEUE_NAME):
+    """Declares one delay queue per tier; expired messages return to ``lane``."""
+    for delay in sorted(set(EMAIL_RETRY_DELAYS)):
+        channel.queue_declare(
+            queue=retry_queue_name(delay, lane),
+            durable=True,
+            arguments={
+                'x-dead-letter-exchange': '',
+                'x-dead-letter-routing-key': lane,
+            },
+        )
+
+
+def declare_lane(connection, channel, lane):
+    """
+    Declares a work queue with DLQ arguments plus its retry tiers; returns the
+    channel to keep using (a new one if the broker closed it).
+    """
+    args = {
+        'x-dead-letter-exchange': 'dlx_exchange',
+        'x-dead-letter-routing-key': 'dlq_key'
+    }
+    # If queue already exists with a different schema, fallback without crashing.
+    try:
+        channel.queue_declare(queue=lane, durable=True, arguments=args)
+    except pika.exceptions.ChannelClosedByBroker as e:
+        logger.warning(
+            f"{lane} exists with different arguments; using existing queue config. "
+            f"Broker error: {e}"
+        )
+        # Re-open channel after broker closes it on precondition failure.
+        channel = connection.channel()
+        channel.queue_declare(queue=lane, durable=True)
+    declare_retry_queues(channel, lane)
+    return channel
+
+
+def _settle(ch, delivery_tag, properties, body, error=None, lane=NotificationService.QUEUE_NAME):
+    """
+    Acks a delivered message, or sends a failed one to its lane's next retry
+    tier (per-message TTL) and only rejects it to the DLQ after the last tier.
+    Runs on the connection thread: pika channels must not be used from senders.
+    """
+    if not ch.is_open:
+        logger.warning(f"Channel closed before settling message {delivery_tag}; broker will redeliver it")
+        return
+    if error is None:
+        ch.basic_ack(delivery_tag=delivery_tag)
+        metrics.increment('email_processed', lane=lane, outcome='ok')
+        return
+
+    target = retry_target(getattr(properties, 'headers', None), error, lane=lane)
+    if target:
+        queue, delay, attempt = target
+        try:
+            ch.basic_publish(
+                exchange='',
+                routing_key=queue,
+                body=body,
+                properties=pika.BasicProperties(
+                    delivery_mode=2,
+                    content_type='application/json',
+                    headers=retry_headers(getattr(properties, 'headers', None), attempt, error),
+                    expiration=str(delay * 1000),
+                ),
+            )
+            ch.basic_ack(delivery_tag=delivery_tag)
+            metrics.increment('email_processed', lane=lane, outcome='retried')
+            logger.warning(f"Message {delivery_tag} scheduled for retry {attempt} in {delay}s")
+            return
+        except Exception as e:
+            logger.error(f"Failed to schedule retry: {e}")
+
+    # Reject message and send to DLQ (requeue=False)
+    ch.basic_nack(delivery_tag=delivery_tag, requeue=False)
+    metrics.increment('email_processed', lane=lane, outcome='dead_lettered')
+
+
+def callback(ch, method, properties, body):
+    """
+    Callback function executed when a message is received from the queue.
+    Decodes the JSON payload and attempts to send the email.
+    """
+    logger.info("Received notification task")
+    lane = message_lane(getattr(method, 'routing_key', None))
+    observe_dwell(getattr(properties, 'headers', None), lane)
+    error = None
+    try:
+        process_message(body)
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+        error = e
+    _settle(ch, method.delivery_tag, properties, body, error, lane)
+
+
+def _send_in_pool(connection, ch, delivery_tag, properties, body, lane=NotificationService.QUEUE_NAME):
+    error = None
+    try:
+        process_message(body)
     except Exception as e:
         logger.error(f"Error processing message: {e}")
-        # Reject message and send to DLQ (requeue=False)
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False) 
+        error = e
+    connection.add_callback_threadsafe(partial(_settle, ch, delivery_tag, properties, body, error, lane))
+
+
+def make_concurrent_callback(connection, executor):
+    """
+    Builds a consumer callback that hands each message to ``executor``.
+    The prefetch window bounds how many messages are in flight; acks and
+    nacks are scheduled back onto the connection thread.
+    """
+    def concurrent_callback(ch, method, properties, body):
+        logger.info("Received notification task")
+        lane = message_lane(getattr(method, 'routing_key', None))
+        observe_dwell(getattr(properties, 'headers', None), lane)
+        executor.submit(_send_in_pool, connection, ch, method.delivery_tag, properties, body, lane)
+
+    return concurrent_callback
+
 
 def main():
     """
     Main entry point for the worker process.
     Configures exchanges, queues, and starts consuming messages.
     """
+    precompile_templates()
+    if WORKER_METRICS_PORT:
+        start_metrics_server(WORKER_METRICS_PORT, WORKER_METRICS_HOST)
     params = pika.URLParameters(RABBITMQ_URL)
     connection = pika.BlockingConnection(params)
     channel = connection.channel()
@@ -167,29 +601,46 @@ def main():
     channel.queue_declare(queue='email_dlq', durable=True)
     channel.queue_bind(exchange='dlx_exchange', queue='email_dlq', routing_key='dlq_key')
     
-    # 2. Declare Main Queue with DLQ arguments.
-    # If queue already exists with a different schema, fallback without crashing.
-    args = {
-        'x-dead-letter-exchange': 'dlx_exchange',
-        'x-dead-letter-routing-key': 'dlq_key'
-    }
-    try:
-        channel.queue_declare(queue='email_queue', durable=True, arguments=args)
-    except pika.exceptions.ChannelClosedByBroker as e:
-        logger.warning(
-            "email_queue exists with different arguments; using existing queue config. "
-            f"Broker error: {e}"
+    # 2. Declare both lanes with DLQ arguments and their retry tiers.
+    for lane in NotificationService.LANES:
+        channel = declare_lane(connection, channel, lane)
+
+    # 3. Each lane consumes on its own channel with its own prefetch, so the
+    # broker keeps delivering transactional mail while the bulk window is full.
+    # Fair dispatch: at most WORKER_PREFETCH unacked bulk messages per worker
+    # (one at a time unless concurrency is enabled).
+    channel.basic_qos(prefetch_count=WORKER_PREFETCH)
+    transactional_channel = connection.channel()
+    executors = []
+    if WORKER_CONCURRENCY > 1:
+        executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix='smtp-sender')
+        transactional_executor = ThreadPoolExecutor(
+            max_workers=WORKER_TRANSACTIONAL_CONCURRENCY, thread_name_prefix='smtp-transactional'
         )
-        # Re-open channel after broker closes it on precondition failure.
-        channel = connection.channel()
-        channel.queue_declare(queue='email_queue', durable=True)
-    
-    # Ensure fair dispatch (one message at a time per worker)
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue='email_queue', on_message_callback=callback)
-    
-    logger.info('EuroEventos Worker active. Waiting for messages. Press CTRL+C to stop.')
-    channel.start_consuming()
+        executors = [transactional_executor, executor]
+        on_message = make_concurrent_callback(connection, executor)
+        on_transactional_message = make_concurrent_callback(connection, transactional_executor)
+        transactional_channel.basic_qos(prefetch_count=WORKER_TRANSACTIONAL_CONCURRENCY)
+    else:
+        # Serial mode: a transactional message waits for at most the one bulk send in progress.
+        on_message = on_transactional_message = callback
+        transactional_channel.basic_qos(prefetch_count=1)
+    transactional_channel.basic_consume(
+        queue=NotificationService.TRANSACTIONAL_QUEUE_NAME, on_message_callback=on_transactional_message
+    )
+    channel.basic_consume(queue=NotificationService.QUEUE_NAME, on_message_callback=on_message)
+
+    logger.info(
+        f'EuroEventos Worker active ({WORKER_CONCURRENCY} senders, prefetch {WORKER_PREFETCH}). '
+        'Waiting for messages. Press CTRL+C to stop.'
+    )
+    try:
+        # Both channels share the connection, so this dispatches both lanes.
+        channel.start_consuming()
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
+        smtp_pool.close()
 
 if __name__ == '__main__':
     try: